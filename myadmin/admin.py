@@ -1,13 +1,55 @@
-from django.contrib import admin
-from django.utils.html import format_html
+import copy
+import hmac
+import uuid
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME, ActionForm
+from django.contrib.admin.utils import unquote
+from django.contrib.auth import get_user_model
+from django.utils.html import format_html, format_html_join
 from django.utils import timezone
-from django.urls import path
+from django.urls import path, reverse
 from django.template.response import TemplateResponse
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, JsonResponse, QueryDict, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from datetime import date
+
+from .models import ServicePricing, PricingRule, Customer, Quote, Crew, AuditEntry, StaffProfile
+from . import audit, bulk, dedupe, franchises, metrics, pricing_rules, schedule_feed, scheduling, simulator
+from .views import pricing_config, pricing_etag, versioned_static
+
+
+class AuditHistoryMixin:
+    """Show field-level audit entries on the object's History page"""
+    object_history_template = 'admin/audit_object_history.html'
+
+    def history_view(self, request, object_id, extra_context=None):
+        obj = self.get_object(request, unquote(object_id))
+        entries = list(audit.history(obj)) if obj else []
+        users = get_user_model().objects.in_bulk({entry.user_id for entry in entries if entry.user_id})
+        for entry in entries:
+            user = users.get(entry.user_id)
+            entry.username = user.get_username() if user else None
+        extra_context = {
+            **(extra_context or {}),
+            'audit_entries': entries,
+        }
+        return super().history_view(request, object_id, extra_context)
+
+
+class PricingRuleInline(admin.TabularInline):
+    """Discount, zone and minimum rules edited on their pricing"""
+    model = PricingRule
+    fields = ('kind', 'threshold', 'percent_off', 'amount', 'is_active')
+    extra = 0
 
-from .models import ServicePricing, Customer, Quote
 
 # @admin.register(ServicePricing)
-class ServicePricingAdmin(admin.ModelAdmin):
+class ServicePricingAdmin(AuditHistoryMixin, admin.ModelAdmin):
     """Admin configuration for ServicePricing model"""
     list_display = (
         'name',
@@ -42,10 +84,11 @@ class ServicePricingAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    inlines = (PricingRuleInline,)
 
 
 # @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(AuditHistoryMixin, admin.ModelAdmin):
     """Admin configuration for Customer model"""
     list_display = (
         'full_name',
@@ -65,7 +108,8 @@ class CustomerAdmin(admin.ModelAdmin):
         'state',
         'zip_code'
     )
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'possible_duplicates')
+    actions = ['merge_selected']
     fieldsets = (
         ('Personal Information', {
             'fields': ('first_name', 'last_name', 'email', 'phone_number')
@@ -76,6 +120,9 @@ class CustomerAdmin(admin.ModelAdmin):
         ('Additional Information', {
             'fields': ('notes',)
         }),
+        ('Possible Duplicates', {
+            'fields': ('possible_duplicates',)
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -87,6 +134,121 @@ class CustomerAdmin(admin.ModelAdmin):
 
     full_name.short_description = "Customer Name"
 
+    def possible_duplicates(self, obj):
+        if not obj or not obj.pk:
+            return "-"
+        matches = dedupe.find_duplicates_of(obj)
+        if not matches:
+            return "None found"
+        return format_html_join(
+            format_html('<br>'),
+            '<a href="{}">{}</a> ({}, score {})',
+            (
+                (reverse('admin:myadmin_customer_change', args=[match.pk]), match.full_name, match.full_address, score)
+                for score, match in matches
+            ),
+        )
+
+    possible_duplicates.short_description = "Possible Duplicates"
+
+    def merge_selected(self, request, queryset):
+        """Merge the selected customers into the oldest one, moving all their quotes"""
+        customers = list(queryset.order_by('created_at', 'pk'))
+        if len(customers) < 2:
+            self.message_user(request, "Select at least two customers to merge.", messages.WARNING)
+            return
+        primary, duplicates = customers[0], customers[1:]
+        try:
+            moved = dedupe.merge_customers(primary, duplicates, confirmed='confirm' in request.POST)
+        except ValueError:
+            # Customers that look unrelated are only merged from the confirmation page
+            context = {
+                **self.admin_site.each_context(request),
+                'title': "Merge unrelated customers?",
+                'opts': self.model._meta,
+                'primary': primary,
+                'duplicates': duplicates,
+                'unrelated': dedupe.unrelated(primary, duplicates),
+                'action_checkbox_name': ACTION_CHECKBOX_NAME,
+            }
+            return TemplateResponse(request, 'admin/merge_customers_confirmation.html', context)
+        self.message_user(
+            request,
+            f"Merged {len(duplicates)} customer(s) into {primary.full_name} and moved {moved} quote(s).",
+            messages.SUCCESS,
+        )
+
+    merge_selected.short_description = "Merge selected customers into the oldest"
+
+
+# @admin.register(Crew)
+class CrewAdmin(admin.ModelAdmin):
+    """Admin configuration for Crew model"""
+    list_display = ('name', 'daily_capacity_minutes', 'works_weekends', 'is_active', 'updated_at')
+    list_filter = ('is_active', 'works_weekends')
+    search_fields = ('name',)
+    readonly_fields = ('created_at', 'updated_at', 'schedule_feeds')
+
+    def schedule_feeds(self, obj):
+        """Feed URLs for the crew's devices; they work without logging in while the crew is active"""
+        if obj.pk is None:
+            return "Available once the crew is saved."
+        token = schedule_feed.device_token(obj)
+        return format_html(
+            '<a href="{}">iCalendar</a> &middot; <a href="{}">JSON</a>',
+            reverse('admin:schedule-feed-device', args=(token, 'ics')),
+            reverse('admin:schedule-feed-device', args=(token, 'json')),
+        )
+
+    schedule_feeds.short_description = "Schedule Feeds"
+
+
+# @admin.register(AuditEntry)
+class AuditEntryAdmin(admin.ModelAdmin):
+    """Read-only admin for the append-only audit log"""
+    list_display = ('timestamp', 'model', 'object_id', 'action', 'user_id', 'changed_fields')
+    list_filter = ('model', 'action')
+    search_fields = ('=object_id',)
+    date_hierarchy = 'timestamp'
+    show_full_result_count = False
+
+    def changed_fields(self, obj):
+        return ", ".join(obj.changes)
+
+    changed_fields.short_description = "Changed Fields"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# @admin.register(StaffProfile)
+class StaffProfileAdmin(admin.ModelAdmin):
+    """Admin configuration for StaffProfile model; managed by head office only"""
+    list_display = ('user', 'franchise')
+    list_filter = ('franchise',)
+    search_fields = ('user__username', 'user__email')
+
+    def has_module_permission(self, request):
+        return franchises.is_head_office(request.user) and super().has_module_permission(request)
+
+    def has_view_permission(self, request, obj=None):
+        return franchises.is_head_office(request.user) and super().has_view_permission(request, obj)
+
+    def has_add_permission(self, request):
+        return franchises.is_head_office(request.user) and super().has_add_permission(request)
+
+    def has_change_permission(self, request, obj=None):
+        return franchises.is_head_office(request.user) and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return franchises.is_head_office(request.user) and super().has_delete_permission(request, obj)
+
 
 class QuoteInline(admin.TabularInline):
     """Inline admin for Quote related to Customer"""
@@ -98,8 +260,24 @@ class QuoteInline(admin.TabularInline):
     can_delete = False
 
 
+class QuoteActionForm(ActionForm):
+    """Action bar with the parameters of the bulk quote actions"""
+    days = forms.IntegerField(
+        required=False,
+        label="Shift days",
+        widget=forms.NumberInput(attrs={'style': 'width: 5em'}),
+    )
+    work_date = forms.DateField(required=False, label="or to", widget=forms.DateInput(attrs={'type': 'date'}))
+    pricing = forms.ModelChoiceField(ServicePricing.objects.all(), required=False, label="Pricing")
+    include_completed = forms.BooleanField(required=False, label="incl. completed")
+
+
+# Session key of the bulk quote jobs in progress
+BULK_JOBS_SESSION_KEY = 'quote_bulk_jobs'
+
+
 # @admin.register(Quote)
-class QuoteAdmin(admin.ModelAdmin):
+class QuoteAdmin(AuditHistoryMixin, admin.ModelAdmin):
     """Admin configuration for Quote model"""
     list_display = (
         'quote_number',
@@ -117,6 +295,7 @@ class QuoteAdmin(admin.ModelAdmin):
         'work_date',
         'driveway_calculation_type',
         'gutter_cleaning',
+        'crew',
         'created_at'
     )
     search_fields = (
@@ -126,13 +305,18 @@ class QuoteAdmin(admin.ModelAdmin):
         'customer__email',
         'notes'
     )
-    readonly_fields = ('created_at', 'updated_at', 'total_amount')
+    readonly_fields = ('created_at', 'updated_at', 'total_amount', 'estimated_minutes')
     autocomplete_fields = ['customer']
+    action_form = QuoteActionForm
+    actions = ['mark_completed', 'reschedule', 'reassign_pricing', 'delete_quotes']
 
     fieldsets = (
         ('Basic Information', {
             'fields': ('customer', 'pricing', 'quote_number', 'quote_date', 'work_date', 'is_completed')
         }),
+        ('Scheduling', {
+            'fields': ('crew', 'estimated_minutes')
+        }),
         ('House & Driveway Details', {
             'fields': ('house_sqft', 'driveway_calculation_type', 'driveway_sqft', 'driveway_cars')
         }),
@@ -169,41 +353,528 @@ class QuoteAdmin(admin.ModelAdmin):
 
     status_tag.short_description = "Status"
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Warn, but don't block, when the work date is now over the crew's (or all crews') capacity
+        if obj.work_date and (not change or {'work_date', 'crew'} & set(form.changed_data)):
+            booked = scheduling.booked_minutes(obj.work_date, obj.crew_id)
+            capacity = scheduling.Capacity.current()
+            available = capacity.for_date(obj.work_date, obj.crew_id)
+            if booked > available:
+                slot = scheduling.earliest_available_date(
+                    obj.estimated_minutes, timezone.now().date(), capacity, obj.crew_id
+                )
+                self.message_user(
+                    request,
+                    f"{obj.work_date} is overbooked for {obj.crew or 'the crews'}: {booked} of {available} minutes booked. "
+                    f"Earliest day with room for this job: {slot or 'none in the next year'}.",
+                    messages.WARNING,
+                )
+
     # Add customer info to the Quote admin
     def get_queryset(self, request):
         """Prefetch related customer to avoid extra queries"""
         return super().get_queryset(request).select_related('customer', 'pricing')
 
+    def get_actions(self, request):
+        # delete_quotes replaces the default action, which loads and deletes quotes one by one
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('bulk/<str:job_id>/', self.admin_site.admin_view(self.bulk_job_view), name='myadmin_quote_bulk'),
+        ]
+        return custom_urls + urls
+
+    def _action_params(self, request):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        form.is_valid()
+        return form.cleaned_data
+
+    @staticmethod
+    def _bulk_message(description, changed, processed, skipped):
+        message = f"{description}: {changed} quote(s)"
+        if skipped and processed > changed:
+            message += f", skipped {processed - changed} {skipped}"
+        return message + "."
+
+    def _run_bulk(self, request, queryset, operation, params, description, skipped=None):
+        """
+        Run a bulk operation on the selection: within the request for small
+        selections, else in chunks from a progress page. Deletes always go
+        through the progress page, which asks for confirmation first.
+
+        ``skipped`` describes the selected quotes the operation leaves alone,
+        to report their number.
+        """
+        total = queryset.count()
+        if operation != 'delete' and total <= bulk.INLINE_LIMIT:
+            changed = bulk.OPERATIONS[operation](queryset, **params)
+            self.message_user(request, self._bulk_message(description, changed, total, skipped), messages.SUCCESS)
+            return None
+
+        select_across = request.POST.get('select_across') == '1'
+        job_id = uuid.uuid4().hex
+        jobs = request.session.get(BULK_JOBS_SESSION_KEY, {})
+        jobs[job_id] = {
+            'operation': operation,
+            'params': params,
+            'description': description,
+            'skipped': skipped,
+            'total': total,
+            'done': 0,
+            'changed': 0,
+            'cursor': 0,
+            # "Select all" is replayed from the changelist filters, one chunk at a time
+            'query': request.GET.urlencode(),
+            'ids': None if select_across else list(queryset.values_list('pk', flat=True)),
+        }
+        request.session[BULK_JOBS_SESSION_KEY] = jobs
+        return redirect(reverse('admin:myadmin_quote_bulk', args=[job_id], current_app=self.admin_site.name))
+
+    def _bulk_selection(self, request, job):
+        if job['ids'] is not None:
+            return self.get_queryset(request).filter(pk__in=job['ids'])
+        changelist_request = copy.copy(request)
+        changelist_request.GET = QueryDict(job['query'])
+        changelist = self.get_changelist_instance(changelist_request)
+        return changelist.get_queryset(changelist_request)
+
+    def bulk_job_view(self, request, job_id):
+        """Progress page of a chunked bulk action; each POST processes the next chunk"""
+        jobs = request.session.get(BULK_JOBS_SESSION_KEY, {})
+        job = jobs.get(job_id)
+        changelist_url = reverse('admin:myadmin_quote_changelist', current_app=self.admin_site.name)
+        if job is None:
+            if request.method == 'POST':
+                return JsonResponse({'finished': True, 'redirect': changelist_url})
+            return redirect(changelist_url)
+        if job['query']:
+            changelist_url += '?' + job['query']
+
+        allowed = self.has_delete_permission(request) if job['operation'] == 'delete' else self.has_change_permission(request)
+        if not allowed:
+            raise PermissionDenied
+
+        if request.method == 'POST':
+            processed, changed, cursor = bulk.run_chunk(
+                self._bulk_selection(request, job),
+                job['operation'],
+                job['params'],
+                job['cursor'],
+            )
+            job['done'] += processed
+            job['changed'] += changed
+            if cursor is None:
+                del jobs[job_id]
+                self.message_user(
+                    request,
+                    self._bulk_message(job['description'], job['changed'], job['done'], job.get('skipped')),
+                    messages.SUCCESS,
+                )
+            else:
+                job['cursor'] = cursor
+            request.session[BULK_JOBS_SESSION_KEY] = jobs
+            return JsonResponse({
+                'done': job['done'],
+                'total': job['total'],
+                'finished': cursor is None,
+                'redirect': changelist_url,
+            })
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': job['description'],
+            'opts': self.model._meta,
+            'job': job,
+            'changelist_url': changelist_url,
+            'chunk_size': bulk.CHUNK_SIZE,
+            'confirm': job['operation'] == 'delete',
+        }
+        return TemplateResponse(request, 'admin/quote_bulk_progress.html', context)
+
+    def mark_completed(self, request, queryset):
+        return self._run_bulk(request, queryset, 'complete', {}, "Marked completed")
+
+    mark_completed.short_description = "Mark selected quotes completed"
+    mark_completed.allowed_permissions = ('change',)
+
+    def reschedule(self, request, queryset):
+        params = self._action_params(request)
+        if params.get('work_date'):
+            work_date = params['work_date']
+            return self._run_bulk(
+                request, queryset, 'reschedule', {'work_date': work_date.isoformat()}, f"Rescheduled to {work_date}"
+            )
+        if params.get('days'):
+            days = params['days']
+            return self._run_bulk(request, queryset, 'reschedule', {'days': days}, f"Shifted by {days} day(s)")
+        self.message_user(request, "Enter a number of days to shift by, or a date to move to.", messages.WARNING)
+
+    reschedule.short_description = "Reschedule selected quotes (shift days / date)"
+    reschedule.allowed_permissions = ('change',)
+
+    def reassign_pricing(self, request, queryset):
+        params = self._action_params(request)
+        pricing = params.get('pricing')
+        if pricing is None:
+            self.message_user(request, "Choose the pricing to move the quotes to.", messages.WARNING)
+            return
+        include_completed = bool(params.get('include_completed'))
+        return self._run_bulk(
+            request,
+            queryset,
+            'reassign_pricing',
+            {'pricing_id': pricing.pk, 'include_completed': include_completed},
+            f"Moved to {pricing.name} and repriced",
+            skipped=f"already on {pricing.name}" if include_completed else f"completed or already on {pricing.name}",
+        )
+
+    reassign_pricing.short_description = "Move selected quotes to pricing and reprice"
+    reassign_pricing.allowed_permissions = ('change',)
+
+    def delete_quotes(self, request, queryset):
+        return self._run_bulk(request, queryset, 'delete', {}, "Deleted")
+
+    delete_quotes.short_description = "Delete selected quotes"
+    delete_quotes.allowed_permissions = ('delete',)
+
     # Add customer's quotes to customer view
     CustomerAdmin.inlines = [QuoteInline]
 
 
 class AdminSite(admin.AdminSite):
+    def has_permission(self, request):
+        # Staff whose franchise has no database configured get no access rather than head office's data
+        return super().has_permission(request) and franchises.franchise_of(request.user) is not None
+
+    def each_context(self, request):
+        context = super().each_context(request)
+        franchise = getattr(request, 'franchise', None)
+        context['franchise_name'] = franchises.name_of(franchise)
+        context['head_office'] = franchise == franchises.DEFAULT_DB_ALIAS
+        if franchise and franchises.franchise_choices():
+            context['site_header'] = f"{self.site_header} · {context['franchise_name']}"
+        return context
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
             path('price-calculator/', self.admin_view(self.price_calculator_view), name='price-calculator'),
+            path(
+                'price-calculator/pricing.json',
+                self.admin_view(self.pricing_config_view, cacheable=True),
+                name='price-calculator-config',
+            ),
+            # Not behind admin_view: the worker script holds no data and must load without a redirect
+            path('price-calculator/sw.js', self.price_calculator_sw_view, name='price-calculator-sw'),
+            path('pricing-simulator/', self.admin_view(self.pricing_simulator_view), name='pricing-simulator'),
+            path('duplicate-customers/', self.admin_view(self.duplicate_customers_view), name='duplicate-customers'),
+            path('schedule/', self.admin_view(self.schedule_view), name='schedule'),
+            path('franchise-report/', self.admin_view(self.franchise_report_view), name='franchise-report'),
+            # Not behind admin_view: scrapers get a 403, not a login page
+            path('metrics/', self.metrics_view, name='metrics'),
+            # Staff (any crew with ?crew=) or crew devices with their token, without logging in
+            path('schedule/feed.<str:format>', self.schedule_feed_view, name='schedule-feed'),
+            path('schedule/feed/<str:device>.<str:format>', self.schedule_feed_view, name='schedule-feed-device'),
         ]
         return custom_urls + urls
 
     def price_calculator_view(self, request):
-        # Get the latest pricing configuration to pass to the template
-        pricing = ServicePricing.objects.filter(is_active=True).first()
-
-        # Fallback to the most recently updated pricing if no active pricing exists
-        if not pricing:
-            pricing = ServicePricing.objects.order_by('-updated_at').first()
-
-        # Create the context with the pricing data
+        # The page is a static shell so the service worker can serve it offline;
+        # pricing is loaded from pricing_config_view
         context = {
             **self.each_context(request),
             'title': 'Price Calculator',
-            'pricing': pricing,
+            'calculator_js_url': versioned_static('js/price-calculator.js'),
+            'calculator_css_url': versioned_static('css/price-calculator.css'),
+            'pricing_plan_js_url': versioned_static('myadmin/js/pricing-plan.js'),
         }
 
         # Render the template with the context
         return TemplateResponse(request, 'admin/price_calculator.html', context)
 
+    def pricing_config_view(self, request):
+        """Active pricing as calculator JSON, answering If-None-Match with 304"""
+        # Get the active pricing configuration, falling back to the most recently updated one
+        pricing = simulator.baseline_pricing()
+        if pricing is None:
+            return JsonResponse({'error': 'No pricing configured'}, status=404)
+
+        etag = pricing_etag(pricing)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            # Saving a rule bumps pricing.updated_at, so the ETag covers the rules too
+            plan = pricing_rules.evaluator_for(pricing).plan
+            response = JsonResponse({
+                'name': pricing.name,
+                'updatedAt': pricing.updated_at.isoformat(),
+                'pricingConfig': pricing_config(pricing),
+                'rules': {**plan, 'summary': pricing_rules.describe(plan)},
+            })
+        response.headers['ETag'] = etag
+        # Always revalidate; the payload is tiny and a 304 is cheaper still
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def price_calculator_sw_view(self, request):
+        """Service worker that caches the calculator shell and its static assets"""
+        assets = [
+            versioned_static('js/price-calculator.js'),
+            versioned_static('css/price-calculator.css'),
+            versioned_static('myadmin/js/pricing-plan.js'),
+        ]
+        context = {
+            # Changes whenever an asset does, so a new bundle installs a fresh cache
+            'cache_name': 'price-calculator-' + '-'.join(url.rpartition('?v=')[2] for url in assets),
+            'shell_url': reverse('admin:price-calculator', current_app=self.name),
+            'config_url': reverse('admin:price-calculator-config', current_app=self.name),
+            'static_url': settings.STATIC_URL,
+            'precache_urls': assets,
+        }
+        response = TemplateResponse(
+            request,
+            'admin/price_calculator_sw.js',
+            context,
+            content_type='application/javascript',
+        )
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def pricing_simulator_view(self, request):
+        """Compare historical quote revenue under candidate pricing sets (read-only)"""
+        default_since, default_until = simulator.default_period()
+        errors = []
+
+        def parse_date(name, default):
+            value = request.GET.get(name)
+            if not value:
+                return default
+            try:
+                return date.fromisoformat(value)
+            except ValueError:
+                errors.append(f"Invalid date for {name}: '{value}'")
+                return default
+
+        since = parse_date('since', default_since)
+        until = parse_date('until', default_until)
+        completed_only = request.GET.get('completed_only') == '1'
+        scenario_text = request.GET.get('scenarios', '')
+
+        pricing = simulator.baseline_pricing()
+        pricing_id = request.GET.get('pricing')
+        if pricing_id:
+            pricing = ServicePricing.objects.filter(pk=pricing_id).first() if pricing_id.isdigit() else None
+            if pricing is None:
+                errors.append(f"Unknown pricing '{pricing_id}'")
+
+        scenarios = []
+        if pricing:
+            baseline = simulator.Scenario.from_pricing(pricing)
+            for line in scenario_text.splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    scenarios.append(simulator.parse_scenario(line, baseline))
+                except ValueError as exc:
+                    errors.append(f"{line.strip()}: {exc}")
+
+        results = []
+        quote_count = None
+        if scenarios and not errors:
+            quotes = Quote.objects.filter(quote_date__range=(since, until))
+            if completed_only:
+                quotes = quotes.filter(is_completed=True)
+            measurements = simulator.QuoteMeasurements.load(quotes)
+            quote_count = len(measurements)
+            results = simulator.simulate(measurements, baseline, scenarios)
+
+        context = {
+            **self.each_context(request),
+            'title': 'Pricing Simulator',
+            'pricing': pricing,
+            'rule_count': simulator.active_rule_count(pricing) if pricing else 0,
+            'pricing_options': ServicePricing.objects.order_by('name'),
+            'price_fields': simulator.PRICE_FIELDS,
+            'since': since,
+            'until': until,
+            'completed_only': completed_only,
+            'scenario_text': scenario_text,
+            'errors': errors,
+            'quote_count': quote_count,
+            'results': results,
+        }
+        return TemplateResponse(request, 'admin/pricing_simulator.html', context)
+
+    def duplicate_customers_view(self, request):
+        """List likely duplicate customer pairs, linking to the changelist to merge them"""
+        try:
+            min_score = float(request.GET.get('min_score', 0.45))
+        except ValueError:
+            min_score = 0.45
+
+        pairs = dedupe.find_duplicate_pairs(min_score=min_score)
+        shown = pairs[:200]
+        customers = Customer.objects.in_bulk({pk for _, a, b in shown for pk in (a, b)})
+        changelist_url = reverse('admin:myadmin_customer_changelist')
+
+        context = {
+            **self.each_context(request),
+            'title': 'Duplicate Customers',
+            'min_score': min_score,
+            'pair_count': len(pairs),
+            'pairs': [
+                (score, customers[a], customers[b], f"{changelist_url}?id__in={a},{b}")
+                for score, a, b in shown
+                if a in customers and b in customers
+            ],
+        }
+        return TemplateResponse(request, 'admin/duplicate_customers.html', context)
+
+    def schedule_view(self, request):
+        """Month calendar of booked crew time, with an earliest available slot finder"""
+        today = timezone.now().date()
+        try:
+            year, month = (int(part) for part in request.GET.get('month', '').split('-'))
+            date(year, month, 1)
+            # The calendar grid and the previous/next links reach into the adjacent years
+            if not date.min.year < year < date.max.year:
+                raise ValueError
+        except ValueError:
+            year, month = today.year, today.month
+
+        capacity = scheduling.Capacity.current()
+        weeks = scheduling.month_calendar(year, month, capacity)
+
+        # Earliest slot for a quote (by number, on its crew) or a plain duration in minutes (on any crew)
+        slot_query = request.GET.get('slot', '').strip()
+        slot_minutes = slot = slot_error = slot_crew = None
+        if slot_query:
+            quote = Quote.objects.filter(quote_number=slot_query).select_related('crew').first()
+            if quote:
+                slot_minutes, slot_crew = quote.estimated_minutes, quote.crew
+            elif slot_query.isdigit():
+                slot_minutes = int(slot_query)
+            else:
+                slot_error = f"No quote '{slot_query}'; enter a quote number or a duration in minutes."
+            if slot_minutes is not None:
+                slot = scheduling.earliest_available_date(
+                    slot_minutes, today, capacity, slot_crew.pk if slot_crew else None
+                )
+
+        first = date(year, month, 1)
+        previous_month = date(year - 1, 12, 1) if month == 1 else date(year, month - 1, 1)
+        next_month = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+
+        context = {
+            **self.each_context(request),
+            'title': 'Crew Schedule',
+            'month': first,
+            'previous_month': previous_month,
+            'next_month': next_month,
+            'weeks': weeks,
+            'capacity': capacity,
+            'today': today,
+            'quote_changelist_url': reverse('admin:myadmin_quote_changelist'),
+            'slot_query': slot_query,
+            'slot_minutes': slot_minutes,
+            'slot_crew': slot_crew,
+            'slot': slot,
+            'slot_error': slot_error,
+        }
+        return TemplateResponse(request, 'admin/schedule.html', context)
+
+    def franchise_report_view(self, request):
+        """Head office: quotes and revenue of every franchise database, read in parallel"""
+        if not franchises.is_head_office(request.user):
+            raise PermissionDenied
+
+        today = timezone.now().date()
+        errors = []
+        try:
+            since = date.fromisoformat(request.GET['since']) if request.GET.get('since') else date(today.year, 1, 1)
+            until = date.fromisoformat(request.GET['until']) if request.GET.get('until') else today
+        except ValueError:
+            errors.append("Dates must be in YYYY-MM-DD format.")
+            since, until = date(today.year, 1, 1), today
+
+        context = {
+            **self.each_context(request),
+            'title': 'Franchise Report',
+            'since': since,
+            'until': until,
+            'errors': errors,
+            'report': franchises.head_office_report(since, until),
+        }
+        return TemplateResponse(request, 'admin/franchise_report.html', context)
+
+    def schedule_feed_view(self, request, format, device=None):
+        """
+        Scheduled jobs as JSON or iCalendar. A JSON poll with ``?since=<sync
+        token>`` gets only the changes since; without one, or with an expired
+        one, it gets every job, streamed. ``?from=YYYY-MM-DD`` goes back
+        before today.
+        """
+        if format not in ('json', 'ics'):
+            raise Http404
+        if device is not None:
+            crew = schedule_feed.crew_for_device(device)
+            if crew is None:
+                raise PermissionDenied
+        elif self.has_permission(request):
+            crew = None
+            if request.GET.get('crew'):
+                crew = Crew.objects.filter(pk=request.GET['crew']).first() if request.GET['crew'].isdigit() else None
+                if crew is None:
+                    raise Http404
+        else:
+            raise PermissionDenied
+
+        try:
+            start = date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        except ValueError:
+            return JsonResponse({'error': "from must be a date in YYYY-MM-DD format"}, status=400)
+        feed = schedule_feed.Feed(crew._state.db if crew else franchises.current_alias(), crew, start)
+        # Calendar apps only ever fetch the whole calendar
+        cursor = feed.cursor(request.GET['since']) if format == 'json' and request.GET.get('since') else None
+
+        etag = feed.etag(f"{format}|{request.GET.get('since', '') if cursor else ''}")
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            if format == 'ics':
+                response = StreamingHttpResponse(
+                    (f'{line}\r\n' for line in feed.ics(request.get_host())),
+                    content_type='text/calendar; charset=utf-8',
+                )
+            elif cursor is None:
+                response = StreamingHttpResponse(feed.full_json(), content_type='application/json')
+            else:
+                response = HttpResponse(feed.delta_json(cursor), content_type='application/json')
+        response.headers['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def metrics_view(self, request):
+        """
+        Prometheus metrics of every worker process, for head office staff or a
+        scraper sending ``settings.METRICS_TOKEN`` as a bearer token
+        """
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            pass
+        elif not (self.has_permission(request) and franchises.is_head_office(request.user)):
+            raise PermissionDenied
+
+        response = HttpResponse(metrics.exposition(), content_type=metrics.CONTENT_TYPE)
+        patch_cache_control(response, no_store=True)
+        return response
+
 
 # Replace the default admin site
 admin.site = AdminSite()
@@ -212,6 +883,9 @@ admin.site = AdminSite()
 admin.site.register(ServicePricing, ServicePricingAdmin)
 admin.site.register(Customer, CustomerAdmin)
 admin.site.register(Quote, QuoteAdmin)
+admin.site.register(Crew, CrewAdmin)
+admin.site.register(AuditEntry, AuditEntryAdmin)
+admin.site.register(StaffProfile, StaffProfileAdmin)
 admin.site.site_header = 'Capital Power Washer Admin'
 admin.site.site_title = 'Capital Power Washer Admin Portal'
 admin.site.index_title = 'Welcome to Capital Power Washing Admin Portal'
@@ -1,6 +1,30 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class MyadminConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "myadmin"
+
+    def ready(self):
+        from . import audit, metrics, schedule_feed, scheduling
+
+        Crew = self.get_model('Crew')
+        Quote = self.get_model('Quote')
+        connection_created.connect(metrics.install_query_wrapper, dispatch_uid='metrics_query_wrapper')
+        # Before the audit handler, which replaces the snapshot used to spot completions
+        post_save.connect(metrics.quote_saved, sender=Quote, dispatch_uid='metrics_quote_saved')
+        # Before the scheduling handler, which replaces the work date the quote was loaded with
+        post_save.connect(schedule_feed.quote_saved, sender=Quote, dispatch_uid='schedule_feed_quote_saved')
+        # Keep the per-day load table in step with quote saves, (bulk) deletes and crew deletes
+        post_save.connect(scheduling.quote_saved, sender=Quote, dispatch_uid='scheduling_quote_saved')
+        post_delete.connect(scheduling.quote_deleted, sender=Quote, dispatch_uid='scheduling_quote_deleted')
+        pre_delete.connect(scheduling.crew_deleting, sender=Crew, dispatch_uid='scheduling_crew_deleting')
+        post_delete.connect(scheduling.crew_deleted, sender=Crew, dispatch_uid='scheduling_crew_deleted')
+        post_delete.connect(schedule_feed.quote_deleted, sender=Quote, dispatch_uid='schedule_feed_quote_deleted')
+
+        for name in ('ServicePricing', 'Customer', 'Quote'):
+            model = self.get_model(name)
+            post_save.connect(audit.instance_saved, sender=model, dispatch_uid=f'audit_saved_{name}')
+            post_delete.connect(audit.instance_deleted, sender=model, dispatch_uid=f'audit_deleted_{name}')
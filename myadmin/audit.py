@@ -0,0 +1,367 @@
+"""
+Append-only audit log of field-level changes.
+
+ServicePricing, Customer and Quote remember the values they were loaded
+with, so a save can be diffed without an extra query. Queryset ``update()``
+and ``bulk_update()`` read the affected rows once beforehand; the new values
+come from the arguments, and are only read back for expressions such as
+``F()``. Entries are queued once the surrounding transaction commits and
+written in batches by a background thread, so the write path only pays for
+building a small dict.
+"""
+import atexit
+import contextvars
+import functools
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, models, router, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Bookkeeping fields that are not worth an audit entry
+EXCLUDED_FIELDS = {
+    'created_at',
+    'updated_at',
+    'phone_key',
+    'email_key',
+    'address_key',
+    'name_key',
+    'estimated_minutes',
+}
+
+EMPTY_VALUES = (None, '')
+
+# Rows read per query when diffing bulk updates
+BULK_CHUNK_SIZE = 500
+
+_current_request = contextvars.ContextVar('audit_request', default=None)
+_suspended = contextvars.ContextVar('audit_suspended', default=False)
+
+
+@functools.cache
+def tracked_fields(model):
+    """attname of every audited concrete field of ``model``"""
+    return tuple(
+        field.attname
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in EXCLUDED_FIELDS
+    )
+
+
+def current_user_id():
+    request = _current_request.get()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    return None
+
+
+class AuditMiddleware:
+    """Make the requesting user available to audit entries recorded during the request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+
+class AuditBuffer:
+    """In-memory queue of pending (database alias, entry, failed attempts), flushed in batches by a daemon thread"""
+
+    def __init__(self, flush_interval, batch_size, max_attempts):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._entries = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, entries, using):
+        with self._lock:
+            self._entries.extend((using, entry, 0) for entry in entries)
+            pending = len(self._entries)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-flush', daemon=True)
+                self._thread.start()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+    def flush(self):
+        """
+        Write all pending entries. On failure they stay queued for the next
+        attempt, up to ``max_attempts``, after which they are logged and dropped.
+        """
+        from .models import AuditEntry
+
+        with self._lock:
+            pending, self._entries = self._entries, []
+        by_alias = defaultdict(list)
+        for using, entry, attempts in pending:
+            by_alias[using].append((entry, attempts))
+
+        written = 0
+        for using, queued in by_alias.items():
+            try:
+                AuditEntry.objects.using(using).bulk_create([entry for entry, _ in queued], batch_size=self.batch_size)
+            except DatabaseError:
+                retry = [(using, entry, attempts + 1) for entry, attempts in queued if attempts + 1 < self.max_attempts]
+                dropped = [entry for entry, attempts in queued if attempts + 1 >= self.max_attempts]
+                logger.warning("Could not write %d audit entries to %s", len(queued), using, exc_info=True)
+                if dropped:
+                    logger.error(
+                        "Dropped %d audit entries for %s after %d attempts: %s",
+                        len(dropped),
+                        using,
+                        self.max_attempts,
+                        ', '.join(f'{entry.model}:{entry.object_id}:{entry.action}' for entry in dropped),
+                    )
+                with self._lock:
+                    self._entries[:0] = retry
+                continue
+            written += len(queued)
+        return written
+
+
+buffer = AuditBuffer(
+    flush_interval=getattr(settings, 'AUDIT_FLUSH_INTERVAL', 2.0),
+    batch_size=getattr(settings, 'AUDIT_BATCH_SIZE', 500),
+    max_attempts=getattr(settings, 'AUDIT_MAX_ATTEMPTS', 5),
+)
+atexit.register(buffer.flush)
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+class suspended:
+    """Context manager that skips auditing, e.g. while generating test data"""
+
+    def __enter__(self):
+        self._token = _suspended.set(True)
+
+    def __exit__(self, *exc_info):
+        _suspended.reset(self._token)
+
+
+def record(entries, using=None):
+    """Queue ``AuditEntry`` instances for database ``using`` once the current transaction commits"""
+    if entries and not _suspended.get():
+        from .models import AuditEntry
+
+        using = using or router.db_for_write(AuditEntry)
+        transaction.on_commit(lambda: buffer.add(entries, using), using=using)
+
+
+def _entry(model, object_id, action, changes, user_id, timestamp):
+    from .models import AuditEntry
+
+    return AuditEntry(
+        timestamp=timestamp,
+        model=_label(model),
+        object_id=object_id,
+        action=action,
+        user_id=user_id,
+        changes=changes,
+    )
+
+
+def _created(values):
+    """Changes of a new object; blank fields are left out to keep entries small"""
+    return {name: [None, value] for name, value in values.items() if value not in EMPTY_VALUES}
+
+
+def diff(old, new):
+    """{field: [old, new]} for the fields whose value differs"""
+    return {field: [old.get(field), value] for field, value in new.items() if old.get(field) != value}
+
+
+class AuditSnapshotMixin:
+    """Remember audited field values as loaded, so saves can be diffed without a query"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        tracked = tracked_fields(cls)
+        instance._audit_snapshot = {name: value for name, value in zip(field_names, values) if name in tracked}
+        return instance
+
+    def audit_values(self):
+        # Reading a deferred field would load it with a query per instance
+        deferred = self.get_deferred_fields()
+        return {name: getattr(self, name) for name in tracked_fields(type(self)) if name not in deferred}
+
+
+def instance_saved(sender, instance, created, raw=False, using=None, update_fields=None, **kwargs):
+    if raw:
+        return
+    current = instance.audit_values()
+    if update_fields is not None:
+        names = {sender._meta.get_field(name).attname for name in update_fields}
+        current = {name: value for name, value in current.items() if name in names}
+
+    if created:
+        action = 'c'
+        changes = _created(current)
+    else:
+        action = 'u'
+        changes = diff(getattr(instance, '_audit_snapshot', {}), current)
+    if changes:
+        record([_entry(sender, instance.pk, action, changes, current_user_id(), timezone.now())], using)
+
+    snapshot = getattr(instance, '_audit_snapshot', {})
+    snapshot.update(current)
+    instance._audit_snapshot = snapshot
+
+
+def instance_deleted(sender, instance, using=None, **kwargs):
+    values = getattr(instance, '_audit_snapshot', None) or instance.audit_values()
+    changes = {name: [value, None] for name, value in values.items() if value not in EMPTY_VALUES}
+    record([_entry(sender, instance.pk, 'd', changes, current_user_id(), timezone.now())], using)
+
+
+def _read_values(model, using, pks, attnames):
+    values = {}
+    manager = model._base_manager.using(using)
+    for start in range(0, len(pks), BULK_CHUNK_SIZE):
+        chunk = pks[start:start + BULK_CHUNK_SIZE]
+        for row in manager.filter(pk__in=chunk).order_by().values_list('pk', *attnames):
+            values[row[0]] = dict(zip(attnames, row[1:]))
+    return values
+
+
+def _bulk_entries(model, before, after, user_id):
+    timestamp = timezone.now()
+    entries = []
+    for pk, old in before.items():
+        changes = diff(old, after.get(pk, {}))
+        if changes:
+            entries.append(_entry(model, pk, 'b', changes, user_id, timestamp))
+    return entries
+
+
+def record_bulk(model, before, after, using=None):
+    """Record a bulk write made outside the ORM from ``{pk: {attname: value}}`` before and after"""
+    record(_bulk_entries(model, before, after, current_user_id()), using)
+
+
+def record_deleted(model, pks, using=None):
+    """Record the deletion of ``pks``; call before deleting the rows outside the ORM"""
+    timestamp = timezone.now()
+    user_id = current_user_id()
+    record([
+        _entry(model, pk, 'd', {name: [value, None] for name, value in values.items() if value not in EMPTY_VALUES}, user_id, timestamp)
+        for pk, values in _read_values(model, using, list(pks), tracked_fields(model)).items()
+    ], using)
+
+
+def _plain_value(field, value):
+    """The value a field reads back as after update(field=value)"""
+    if isinstance(value, models.Model):
+        return value.pk
+    return field.to_python(value)
+
+
+class AuditedQuerySet(models.QuerySet):
+    """QuerySet whose bulk writes are recorded in the audit log too"""
+
+    def _audited_attnames(self, names):
+        tracked = set(tracked_fields(self.model))
+        attnames = []
+        for name in names:
+            attname = self.model._meta.get_field(name).attname
+            if attname in tracked:
+                attnames.append(attname)
+        return attnames
+
+    def update(self, **kwargs):
+        attnames = self._audited_attnames(kwargs)
+        if not attnames or _suspended.get():
+            return super().update(**kwargs)
+
+        # Plain values are known up front; only expressions such as F('x') + 1 are read back
+        plain, computed = {}, []
+        for name, value in kwargs.items():
+            field = self.model._meta.get_field(name)
+            if field.attname not in attnames:
+                continue
+            if hasattr(value, 'resolve_expression'):
+                computed.append(field.attname)
+            else:
+                plain[field.attname] = _plain_value(field, value)
+
+        with transaction.atomic(using=self.db):
+            before = {
+                row[0]: dict(zip(attnames, row[1:]))
+                for row in self.order_by().values_list('pk', *attnames).iterator(chunk_size=BULK_CHUNK_SIZE)
+            }
+            rows = super().update(**kwargs)
+            after = {pk: dict(plain) for pk in before}
+            if computed:
+                for pk, values in _read_values(self.model, self.db, list(before), computed).items():
+                    after[pk].update(values)
+            record(_bulk_entries(self.model, before, after, current_user_id()), self.db)
+        return rows
+
+    update.alters_data = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        attnames = self._audited_attnames(fields)
+        objs = list(objs)
+        if not attnames or not objs or _suspended.get():
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+
+        with transaction.atomic(using=self.db):
+            before = _read_values(self.model, self.db, [obj.pk for obj in objs], attnames)
+            rows = super().bulk_update(objs, fields, batch_size=batch_size)
+            after = {obj.pk: {name: getattr(obj, name) for name in attnames} for obj in objs}
+            record(_bulk_entries(self.model, before, after, current_user_id()), self.db)
+        return rows
+
+    bulk_update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if _suspended.get():
+            return objs
+        timestamp = timezone.now()
+        user_id = current_user_id()
+        record([
+            _entry(self.model, obj.pk, 'c', _created(obj.audit_values()), user_id, timestamp)
+            for obj in objs
+            if obj.pk is not None
+        ], self.db)
+        return objs
+
+    bulk_create.alters_data = True
+
+
+def history(obj, limit=100):
+    """Latest audit entries of ``obj``, newest first, via the (model, object_id) index"""
+    from .models import AuditEntry
+
+    return (
+        AuditEntry.objects.using(obj._state.db)
+        .filter(model=_label(type(obj)), object_id=obj.pk)
+        .order_by('-timestamp', '-id')[:limit]
+    )
@@ -0,0 +1,18 @@
+"""
+Timing helpers shared by the ``benchmark_*`` management commands.
+"""
+import time
+
+
+def best_of(repeat, func):
+    """Call ``func`` ``repeat`` times; returns (fastest run in seconds, result of the last call)"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def duration(seconds):
+    return f'{seconds * 1e6:.1f} us' if seconds < 1e-3 else f'{seconds * 1e3:.1f} ms'
@@ -0,0 +1,141 @@
+"""
+Set-based bulk operations on quotes.
+
+Each operation works on a queryset with a few UPDATE/DELETE statements
+instead of loading and saving every quote, and does the bookkeeping that
+``Quote.save()`` and its signals would otherwise do: audit entries,
+``updated_at``, daily crew load and repricing through the compiled pricing
+rules. Large selections are processed in primary key order, one chunk at a
+time, by ``run_chunk``.
+"""
+from datetime import date, timedelta
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import audit, metrics, pricing_rules, schedule_feed, scheduling
+
+# Rows per chunk when a selection is processed step by step
+CHUNK_SIZE = 2000
+
+# Selections up to this size are processed within the admin request
+INLINE_LIMIT = 5000
+
+# Primary keys per DELETE statement
+DELETE_BATCH_SIZE = 500
+
+
+def complete(queryset):
+    """Mark quotes completed"""
+    changed = queryset.filter(is_completed=False).update(is_completed=True, updated_at=timezone.now())
+    metrics.QUOTES_COMPLETED.labels(queryset.db).inc(changed)
+    return changed
+
+
+def reschedule(queryset, days=0, work_date=None):
+    """
+    Move scheduled quotes to ``work_date`` (an ISO date), or shift them by ``days``.
+
+    Quotes without a work date are left alone.
+    """
+    scheduled = queryset.filter(work_date__isnull=False)
+    dates = set(scheduled.order_by().values_list('work_date', flat=True).distinct())
+    now = timezone.now()
+    today = timezone.localdate(now)
+    # Jobs moved into the past, for their crews' schedule feeds to drop
+    left = []
+
+    with transaction.atomic(using=queryset.db):
+        if work_date:
+            target = date.fromisoformat(work_date)
+            if target < today:
+                left.extend(scheduled.filter(work_date__gte=today).order_by().values_list('pk', 'crew_id', 'work_date'))
+            moved = scheduled.update(work_date=target, updated_at=now)
+            new_dates = {target}
+        else:
+            # One UPDATE per distinct day; going against the shift direction
+            # keeps rows that land on a later (or earlier) selected day from moving twice
+            shift = timedelta(days=days)
+            moved = 0
+            new_dates = set()
+            for day in sorted(dates, reverse=days > 0):
+                on_day = scheduled.filter(work_date=day)
+                if day + shift < today <= day:
+                    left.extend(on_day.order_by().values_list('pk', 'crew_id', 'work_date'))
+                moved += on_day.update(work_date=day + shift, updated_at=now)
+                new_dates.add(day + shift)
+        if left:
+            schedule_feed.record_removed(left, queryset.db)
+        scheduling.refresh_daily_load(dates | new_dates, queryset.db)
+    return moved
+
+
+def reassign_pricing(queryset, pricing_id, include_completed=False):
+    """
+    Switch quotes to another pricing and recompute their totals with its rules.
+
+    Quotes already on that pricing are left alone, and so are completed
+    quotes, whose totals were billed, unless ``include_completed``.
+    """
+    quotes = queryset.exclude(pricing_id=pricing_id)
+    if not include_completed:
+        quotes = quotes.filter(is_completed=False)
+
+    with transaction.atomic(using=queryset.db):
+        # Once moved they can't be told apart from the quotes that were already on the pricing
+        moved = queryset.model._default_manager.using(queryset.db).filter(
+            pk__in=list(quotes.order_by().values_list('pk', flat=True))
+        )
+        changed = moved.update(pricing_id=pricing_id, updated_at=timezone.now())
+        pricing_rules.reprice(moved)
+    return changed
+
+
+def delete(queryset):
+    """Delete quotes without loading them, then refresh the daily load of their days"""
+    model = queryset.model
+    using = queryset.db
+    connection = connections[using]
+    qn = connection.ops.quote_name
+
+    with transaction.atomic(using=using):
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+        dates = set(queryset.order_by().values_list('work_date', flat=True).distinct())
+        audit.record_deleted(model, pks, using)
+        schedule_feed.record_removed(
+            queryset.filter(work_date__isnull=False).order_by().values_list('pk', 'crew_id', 'work_date'), using
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(pks), DELETE_BATCH_SIZE):
+                batch = pks[start:start + DELETE_BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    f"DELETE FROM {qn(model._meta.db_table)} WHERE {qn(model._meta.pk.column)} IN ({placeholders})",
+                    batch,
+                )
+        scheduling.refresh_daily_load(dates, using)
+    return len(pks)
+
+
+# Operations that can be run in chunks; parameters must be JSON-serializable
+OPERATIONS = {
+    'complete': complete,
+    'reschedule': reschedule,
+    'reassign_pricing': reassign_pricing,
+    'delete': delete,
+}
+
+
+def run_chunk(selection, operation, params, cursor=0, chunk_size=CHUNK_SIZE):
+    """
+    Apply ``operation`` to the next ``chunk_size`` quotes of ``selection`` with
+    a primary key above ``cursor``.
+
+    Returns (quotes in the chunk, quotes changed, new cursor); the cursor is
+    None once the selection is exhausted.
+    """
+    pks = list(selection.filter(pk__gt=cursor).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+    if not pks:
+        return 0, 0, None
+    changed = OPERATIONS[operation](selection.model._default_manager.using(selection.db).filter(pk__in=pks), **params)
+    return len(pks), changed, pks[-1] if len(pks) == chunk_size else None
@@ -0,0 +1,332 @@
+"""
+Duplicate customer detection and merging.
+
+Every customer carries normalized blocking keys (phone, email, address plus
+zip, phonetic name). Candidate pairs are only scored within a block of
+customers sharing a key, so a full pass is linear in the number of
+customers rather than quadratic.
+"""
+import re
+from collections import defaultdict
+from itertools import combinations
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+KEY_FIELDS = ('phone_key', 'email_key', 'address_key', 'name_key')
+
+# Customer fields the keys are derived from, in compute_keys() argument order
+SOURCE_FIELDS = (
+    'first_name',
+    'last_name',
+    'email',
+    'phone_number',
+    'address_line1',
+    'address_line2',
+    'zip_code',
+)
+
+# How much a shared key contributes to a pair's score
+KEY_WEIGHTS = {
+    'phone_key': 0.45,
+    'email_key': 0.45,
+    'address_key': 0.35,
+    'name_key': 0.25,
+}
+
+# Blocks larger than this are split by zip, then skipped if still too large
+MAX_BLOCK_SIZE = 50
+
+ADDRESS_ABBREVIATIONS = {
+    'street': 'st',
+    'avenue': 'ave',
+    'road': 'rd',
+    'drive': 'dr',
+    'boulevard': 'blvd',
+    'crescent': 'cres',
+    'court': 'ct',
+    'place': 'pl',
+    'lane': 'ln',
+    'terrace': 'terr',
+    'circle': 'cir',
+    'highway': 'hwy',
+    'north': 'n',
+    'south': 's',
+    'east': 'e',
+    'west': 'w',
+    'apartment': 'apt',
+    'suite': 'ste',
+    'unit': 'unit',
+}
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def normalize_phone(phone):
+    """Last ten digits, so '+1 (613) 555-0100' and '613.555.0100' match"""
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) < 7:
+        return ''
+    return digits[-10:]
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def normalize_zip(zip_code):
+    return re.sub(r'[^0-9A-Z]', '', (zip_code or '').upper())
+
+
+def normalize_address(address_line1, address_line2, zip_code):
+    """Lowercased, abbreviated street address followed by '|' and the zip"""
+    words = re.findall(r'[a-z0-9]+', f"{address_line1} {address_line2}".lower())
+    street = ' '.join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+    if not street:
+        return ''
+    return f"{street}|{normalize_zip(zip_code)}"
+
+
+def soundex(name):
+    letters = re.sub(r'[^a-z]', '', (name or '').lower())
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # 'h' and 'w' don't separate letters with the same code, vowels do
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def phonetic_name(first_name, last_name):
+    """Soundex of the last name plus the first initial, e.g. 'S530J' for John Smith"""
+    last = soundex(last_name)
+    if not last:
+        return ''
+    first = re.sub(r'[^a-z]', '', (first_name or '').lower())[:1].upper()
+    return f"{last}{first}"
+
+
+def compute_keys(first_name, last_name, email, phone_number, address_line1, address_line2, zip_code):
+    """Blocking key values in ``KEY_FIELDS`` order"""
+    return (
+        normalize_phone(phone_number),
+        normalize_email(email),
+        normalize_address(address_line1, address_line2, zip_code),
+        phonetic_name(first_name, last_name),
+    )
+
+
+def blocking_keys(customer):
+    """Map of blocking key field -> value for a Customer instance"""
+    values = compute_keys(*(getattr(customer, field) for field in SOURCE_FIELDS))
+    return dict(zip(KEY_FIELDS, values))
+
+
+def _write_keys(model, rows, using):
+    """
+    Write ``[(*key values, pk)]`` with one prepared UPDATE.
+
+    bulk_update() builds a CASE WHEN expression per field and row, which is
+    an order of magnitude slower for a table-wide backfill.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    assignments = ', '.join(f"{qn(model._meta.get_field(field).column)} = %s" for field in KEY_FIELDS)
+    sql = f"UPDATE {qn(model._meta.db_table)} SET {assignments} WHERE {qn(model._meta.pk.column)} = %s"
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def rebuild_keys(queryset=None, batch_size=5000):
+    """
+    Recompute blocking keys, e.g. after bulk imports that bypass save().
+
+    Works on historical models too, so migrations can call it.
+    """
+    if queryset is None:
+        from .models import Customer
+        queryset = Customer.objects.all()
+
+    using = queryset.db
+    rows = queryset.order_by().values_list('pk', *SOURCE_FIELDS, *KEY_FIELDS)
+    changed = []
+    updated = 0
+    with transaction.atomic(using=using):
+        for row in rows.iterator(chunk_size=batch_size):
+            pk, source, current = row[0], row[1:8], row[8:]
+            keys = compute_keys(*source)
+            if keys != current:
+                changed.append((*keys, pk))
+            if len(changed) >= batch_size:
+                _write_keys(queryset.model, changed, using)
+                updated += len(changed)
+                changed = []
+        if changed:
+            _write_keys(queryset.model, changed, using)
+            updated += len(changed)
+    return updated
+
+
+def score(a, b):
+    """Score two rows of blocking keys, between 0 and 1"""
+    total = sum(weight for field, weight in KEY_WEIGHTS.items() if a[field] and a[field] == b[field])
+    return min(round(total, 2), 1.0)
+
+
+def _zip_of(row):
+    return row['address_key'].rpartition('|')[2]
+
+
+def _blocks(rows):
+    """Yield lists of rows sharing a blocking key"""
+    for field in KEY_FIELDS:
+        groups = defaultdict(list)
+        for row in rows:
+            if row[field]:
+                groups[row[field]].append(row)
+
+        for block in groups.values():
+            if len(block) < 2:
+                continue
+            if len(block) <= MAX_BLOCK_SIZE:
+                yield block
+                continue
+            # Common keys such as a frequent surname are narrowed down by zip
+            by_zip = defaultdict(list)
+            for row in block:
+                by_zip[_zip_of(row)].append(row)
+            for zip_code, sub_block in by_zip.items():
+                if zip_code and 2 <= len(sub_block) <= MAX_BLOCK_SIZE:
+                    yield sub_block
+
+
+def find_duplicate_pairs(queryset=None, min_score=0.45):
+    """
+    Return ``[(score, id_a, id_b)]`` for likely duplicates, best first.
+
+    Only the key columns are read, in a single pass over ``queryset``.
+    """
+    from .models import Customer
+
+    if queryset is None:
+        queryset = Customer.objects.all()
+    rows = list(queryset.order_by().values('id', *KEY_FIELDS).iterator(chunk_size=5000))
+
+    seen = set()
+    pairs = []
+    for block in _blocks(rows):
+        for a, b in combinations(block, 2):
+            pair = (a['id'], b['id']) if a['id'] < b['id'] else (b['id'], a['id'])
+            if pair in seen:
+                continue
+            seen.add(pair)
+            pair_score = score(a, b)
+            if pair_score >= min_score:
+                pairs.append((pair_score, *pair))
+
+    pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+    return pairs
+
+
+def find_duplicates_of(customer, min_score=0.45):
+    """Likely duplicates of a single customer, looked up through the indexed key columns"""
+    from django.db.models import Q
+    from .models import Customer
+
+    keys = {field: getattr(customer, field) for field in KEY_FIELDS}
+    condition = Q()
+    for field, value in keys.items():
+        if value:
+            condition |= Q(**{field: value})
+    if not condition:
+        return []
+
+    candidates = Customer.objects.filter(condition).exclude(pk=customer.pk)[:MAX_BLOCK_SIZE]
+    matches = []
+    for candidate in candidates:
+        candidate_score = score(keys, {field: getattr(candidate, field) for field in KEY_FIELDS})
+        if candidate_score >= min_score:
+            matches.append((candidate_score, candidate))
+    matches.sort(key=lambda match: -match[0])
+    return matches
+
+
+MERGE_FILL_FIELDS = (
+    'first_name',
+    'last_name',
+    'email',
+    'phone_number',
+    'address_line2',
+    'city',
+    'state',
+    'zip_code',
+)
+
+
+def unrelated(primary, duplicates):
+    """The ``duplicates`` sharing no blocking key with ``primary``"""
+    keys = {(field, getattr(primary, field)) for field in KEY_FIELDS if getattr(primary, field)}
+    return [
+        customer for customer in duplicates
+        if customer.pk != primary.pk and not keys & {(field, getattr(customer, field)) for field in KEY_FIELDS}
+    ]
+
+
+def merge_customers(primary, duplicates, confirmed=False):
+    """
+    Merge ``duplicates`` into ``primary``.
+
+    Quotes are re-pointed in a single UPDATE, blank fields on the primary are
+    filled from the duplicates, notes are combined and the duplicates deleted.
+    Returns the number of quotes moved.
+
+    Raises ValueError if a duplicate shares no blocking key with the primary,
+    unless ``confirmed``.
+    """
+    from .models import Customer, Quote
+
+    duplicates = [customer for customer in duplicates if customer.pk != primary.pk]
+    if not duplicates:
+        return 0
+    if not confirmed:
+        strangers = unrelated(primary, duplicates)
+        if strangers:
+            raise ValueError(
+                f"{', '.join(customer.full_name for customer in strangers)} share(s) no phone, email, "
+                f"address or name key with {primary.full_name}"
+            )
+    duplicate_ids = [customer.pk for customer in duplicates]
+    using = primary._state.db
+
+    with transaction.atomic(using=using):
+        moved = Quote.objects.using(using).filter(customer_id__in=duplicate_ids).update(
+            customer=primary, updated_at=timezone.now()
+        )
+
+        notes = [primary.notes] if primary.notes else []
+        for duplicate in duplicates:
+            for field in MERGE_FILL_FIELDS:
+                if not getattr(primary, field) and getattr(duplicate, field):
+                    setattr(primary, field, getattr(duplicate, field))
+            if duplicate.notes and duplicate.notes not in notes:
+                notes.append(duplicate.notes)
+        primary.notes = '\n\n'.join(notes)
+        primary.save(using=using)
+
+        Customer.objects.using(using).filter(pk__in=duplicate_ids).delete()
+    return moved
@@ -0,0 +1,118 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django import forms
+from django.core import validators
+from django.db import models
+
+# Minor units used for money columns
+CENTS = 2
+# Per-sq.ft. rates need sub-cent precision
+MILLICENTS = 5
+
+
+def to_minor_units(value, decimal_places):
+    """Decimal amount -> integer number of minor units, rounding half up"""
+    return int(Decimal(value).scaleb(decimal_places).to_integral_value(ROUND_HALF_UP))
+
+
+def from_minor_units(value, decimal_places):
+    """Integer number of minor units -> Decimal amount"""
+    return Decimal(value).scaleb(-decimal_places)
+
+
+def trim_places(value, min_places=CENTS):
+    """``value`` without trailing zeros past ``min_places`` decimals, e.g. 0.50000 -> 0.50 but 0.12345 as is"""
+    normalized = value.normalize()
+    if normalized.as_tuple().exponent > -min_places:
+        return value.quantize(Decimal(1).scaleb(-min_places))
+    return normalized
+
+
+def rescale(value, from_places, to_places):
+    """Convert integer minor units between precisions, rounding half up"""
+    if to_places >= from_places:
+        return value * 10 ** (to_places - from_places)
+    divisor = 10 ** (from_places - to_places)
+    return (value + divisor // 2) // divisor
+
+
+class MoneyField(models.BigIntegerField):
+    """
+    Money stored as an integer number of minor units.
+
+    Python code sees Decimal values with ``decimal_places`` digits, while the
+    database holds exact integers (cents for ``decimal_places=2``, milli-cents
+    for ``decimal_places=5``), so SQL SUM() and arithmetic are exact and
+    reading a row needs no float to Decimal conversion.
+
+    Values are read with the zeros past the cents trimmed, so a rate of
+    0.50000 shows as 0.50 in lists, forms and audit entries alike.
+
+    Sum() of a MoneyField is a Decimal amount, but Avg() is a float number of
+    minor units, as the database averages the integers; use ``MoneyAvg``.
+    """
+    description = "Money stored as integer minor units"
+
+    def __init__(self, *args, max_digits=None, decimal_places=CENTS, **kwargs):
+        self.max_digits = max_digits
+        self.decimal_places = decimal_places
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.max_digits is not None:
+            kwargs['max_digits'] = self.max_digits
+        if self.decimal_places != CENTS:
+            kwargs['decimal_places'] = self.decimal_places
+        return name, path, args, kwargs
+
+    @property
+    def validators(self):
+        # The integer range validators of BigIntegerField don't apply to Decimal values
+        extra = [validators.DecimalValidator(self.max_digits, self.decimal_places)] if self.max_digits else []
+        return [*self.default_validators, *self._validators, *extra]
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        if self.decimal_places > CENTS:
+            return trim_places(from_minor_units(value, self.decimal_places))
+        return from_minor_units(value, self.decimal_places)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            return Decimal(str(value))
+        except ArithmeticError:
+            raise validators.ValidationError(
+                "'%(value)s' value must be a decimal number.",
+                code='invalid',
+                params={'value': value},
+            )
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        return to_minor_units(self.to_python(value), self.decimal_places)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        return '' if value is None else str(value)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'form_class': forms.DecimalField,
+            'max_digits': self.max_digits,
+            'decimal_places': self.decimal_places,
+            **kwargs,
+        })
+
+
+class MoneyAvg(models.Func):
+    """Avg() of a MoneyField as a Decimal amount, rounded to whole minor units"""
+    function = 'ROUND'
+
+    def __init__(self, expression, decimal_places=CENTS, **extra):
+        super().__init__(models.Avg(expression, **extra), output_field=MoneyField(decimal_places=decimal_places))
@@ -0,0 +1,208 @@
+"""
+Per-franchise databases.
+
+Each franchise territory keeps its pricing, customers, quotes, crews,
+schedule and audit log in its own database alias (``settings.FRANCHISES``),
+so territories don't share SQLite's single write lock. Users, sessions and
+staff profiles stay in the default database, which also holds head office's
+own business data.
+
+``FranchiseMiddleware`` sets the franchise of the logged-in staff user for
+the request, and ``FranchiseRouter`` sends every query on franchise data to
+it. Code outside a request (commands, threads) uses the default database
+unless wrapped in ``using_franchise``. Head office reporting reads all
+databases in parallel with ``map_franchises``.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+HEAD_OFFICE = "Head Office"
+
+# Models of this app that live in the default database only
+SHARED_MODELS = {'staffprofile'}
+
+_current_alias = contextvars.ContextVar('franchise_alias', default=None)
+
+
+def franchise_choices():
+    return [(alias, name) for alias, name in getattr(settings, 'FRANCHISES', {}).items()]
+
+
+def aliases():
+    """Every database holding business data: head office's, then each franchise's"""
+    return [DEFAULT_DB_ALIAS, *getattr(settings, 'FRANCHISES', {})]
+
+
+def name_of(alias):
+    if alias in (None, DEFAULT_DB_ALIAS):
+        return HEAD_OFFICE
+    return getattr(settings, 'FRANCHISES', {}).get(alias, alias)
+
+
+def current_alias():
+    return _current_alias.get() or DEFAULT_DB_ALIAS
+
+
+def franchise_of(user):
+    """
+    Database alias of a staff user's franchise: the default database for head
+    office staff, None if their franchise isn't configured.
+    """
+    profile = getattr(user, 'staff_profile', None) if user.is_authenticated else None
+    franchise = profile.franchise if profile else ''
+    if not franchise:
+        return DEFAULT_DB_ALIAS
+    return franchise if franchise in connections.settings else None
+
+
+def is_head_office(user):
+    return franchise_of(user) == DEFAULT_DB_ALIAS
+
+
+class using_franchise:
+    """Context manager that routes franchise data to ``alias``"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __enter__(self):
+        self._token = _current_alias.set(self.alias)
+
+    def __exit__(self, *exc_info):
+        _current_alias.reset(self._token)
+
+
+class FranchiseMiddleware:
+    """Route the request's franchise data to the logged-in staff user's database"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.franchise = franchise_of(request.user)
+        token = _current_alias.set(request.franchise)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_alias.reset(token)
+
+
+class FranchiseCommand(BaseCommand):
+    """Management command that works on one franchise's data, chosen with ``--franchise``"""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--franchise',
+            default=DEFAULT_DB_ALIAS,
+            choices=aliases(),
+            help="Database alias of the franchise (default: head office)",
+        )
+
+    def execute(self, *args, **options):
+        with using_franchise(options.get('franchise') or DEFAULT_DB_ALIAS):
+            return super().execute(*args, **options)
+
+
+def _is_franchise_data(model):
+    return model._meta.app_label == 'myadmin' and model._meta.model_name not in SHARED_MODELS
+
+
+class FranchiseRouter:
+    """
+    Franchise data goes to the current franchise's database; objects stay in
+    the database they were loaded from, so related lookups never cross over.
+    """
+
+    def _db_for(self, model, **hints):
+        if not _is_franchise_data(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return current_alias()
+
+    db_for_read = _db_for
+    db_for_write = _db_for
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if _is_franchise_data(type(obj1)) or _is_franchise_data(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS:
+            return None
+        # Franchise databases only hold franchise data
+        return app_label == 'myadmin' and model_name not in SHARED_MODELS
+
+
+def map_franchises(func, only=None, max_workers=None):
+    """
+    Call ``func(alias)`` for every business database in a thread pool, with
+    franchise data routed to that alias. Returns ``{alias: result}`` in
+    ``aliases()`` order.
+    """
+    targets = list(only or aliases())
+
+    def run(alias):
+        try:
+            with using_franchise(alias):
+                return func(alias)
+        finally:
+            # Connections are per thread; don't leave one open per pool worker
+            connections[alias].close()
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(targets), thread_name_prefix='franchise') as pool:
+        return dict(zip(targets, pool.map(run, targets)))
+
+
+def franchise_summary(alias, start, end):
+    """Quote and revenue figures of one database for quotes dated ``start`` to ``end``"""
+    from .models import Customer, Quote
+
+    quotes = Quote.objects.using(alias).filter(quote_date__range=(start, end))
+    totals = quotes.aggregate(
+        quotes=Count('pk'),
+        completed=Count('pk', filter=Q(is_completed=True)),
+        quoted=Sum('total_amount'),
+        revenue=Sum('total_amount', filter=Q(is_completed=True)),
+    )
+    months = (
+        quotes.annotate(month=TruncMonth('quote_date'))
+        .order_by()
+        .values('month')
+        .annotate(quotes=Count('pk'), revenue=Sum('total_amount', filter=Q(is_completed=True)))
+    )
+    return {
+        **totals,
+        'customers': Customer.objects.using(alias).count(),
+        'months': {row['month']: row for row in months},
+    }
+
+
+def head_office_report(start, end, max_workers=None):
+    """Per-franchise figures read in parallel, merged into totals and a per-month series"""
+    results = map_franchises(lambda alias: franchise_summary(alias, start, end), max_workers=max_workers)
+
+    franchises = []
+    totals = {'quotes': 0, 'completed': 0, 'quoted': 0, 'revenue': 0, 'customers': 0}
+    months = {}
+    for alias, summary in results.items():
+        franchises.append({'alias': alias, 'name': name_of(alias), **summary})
+        for key in totals:
+            totals[key] += summary[key] or 0
+        for month, row in summary['months'].items():
+            merged = months.setdefault(month, {'month': month, 'quotes': 0, 'revenue': 0})
+            merged['quotes'] += row['quotes']
+            merged['revenue'] += row['revenue'] or 0
+    return {
+        'franchises': franchises,
+        'totals': totals,
+        'months': [months[month] for month in sorted(months)],
+    }
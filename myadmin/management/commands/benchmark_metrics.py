@@ -0,0 +1,101 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from myadmin import metrics
+from myadmin.benchmarking import best_of
+
+
+class Command(BaseCommand):
+    help = "Measure the per-call cost of recording metrics, the query wrapper and the request middleware"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=1_000_000, help="Calls per metric operation")
+        parser.add_argument('--queries', type=int, default=20_000)
+        parser.add_argument('--requests', type=int, default=50_000)
+        parser.add_argument('--threads', type=int, default=4, help="Threads incrementing one counter concurrently")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        calls, repeat = options['calls'], options['repeat']
+        registry = metrics.Registry()
+        counter = metrics.Counter('bench_total', "Benchmark counter", registry=registry)
+        labelled = metrics.Counter('bench_labelled_total', "Benchmark counter", ['view'], registry=registry)
+        child = labelled.labels('admin:index')
+        histogram = metrics.Histogram('bench_seconds', "Benchmark histogram", registry=registry)
+
+        def per_call(func, n):
+            loop = range(n)
+
+            def run():
+                for _ in loop:
+                    func()
+
+            elapsed, _ = best_of(repeat, run)
+            return elapsed / n * 1e9
+
+        empty = per_call(lambda: None, calls)
+        self.stdout.write(f"Metric operations ({calls} calls each, empty loop of {empty:.0f} ns/call subtracted)")
+        for label, func in [
+            ("Counter.inc()", counter.inc),
+            ("labelled child .inc()", child.inc),
+            ("labels('...').inc()", lambda: labelled.labels('admin:index').inc()),
+            ("Histogram.observe()", lambda: histogram.observe(0.003)),
+        ]:
+            self.stdout.write(f"  {label:<24} {per_call(func, calls) - empty:7.0f} ns")
+
+        threads = options['threads']
+        shared = metrics.Counter('bench_threads_total', "Benchmark counter", registry=registry)
+        per_thread = calls // threads
+        workers = [
+            threading.Thread(target=lambda: [shared.inc() for _ in range(per_thread)]) for _ in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        expected = per_thread * threads
+        value = shared.labels().get()
+        self.stdout.write(
+            f"  {threads} threads x {per_thread} increments: {value} counted "
+            f"({'exact' if value == expected else f'LOST {expected - value}'})"
+        )
+
+        queries = options['queries']
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        wrappers = list(connection.execute_wrappers)
+
+        def run_queries():
+            with connection.cursor() as cursor:
+                for _ in range(queries):
+                    cursor.execute('SELECT 1')
+
+        wrapped, _ = best_of(repeat, run_queries)
+        connection.execute_wrappers[:] = [wrapper for wrapper in wrappers if wrapper.__module__ != metrics.__name__]
+        try:
+            bare, _ = best_of(repeat, run_queries)
+        finally:
+            connection.execute_wrappers[:] = wrappers
+        self.stdout.write(
+            f"Query wrapper ({queries} x SELECT 1): {bare / queries * 1e6:.2f} us bare, "
+            f"{wrapped / queries * 1e6:.2f} us wrapped, +{(wrapped - bare) / queries * 1e9:.0f} ns/query"
+        )
+
+        requests = options['requests']
+        request = RequestFactory().get('/admin/')
+        response = HttpResponse()
+        view = lambda request: response  # noqa: E731
+        middleware = metrics.MetricsMiddleware(view)
+        bare = per_call(lambda: view(request), requests)
+        measured = per_call(lambda: middleware(request), requests)
+        self.stdout.write(f"MetricsMiddleware ({requests} requests): +{(measured - bare) / 1000:.2f} us/request")
+
+        scrape, text = best_of(repeat, metrics.exposition)
+        self.stdout.write(
+            f"Exposition of {len(metrics.REGISTRY.snapshot()['metrics'])} metrics: "
+            f"{scrape * 1000:.2f} ms, {len(text)} bytes"
+        )
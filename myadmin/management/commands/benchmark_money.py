@@ -0,0 +1,94 @@
+import random
+import sqlite3
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+from django.db.models import Sum, Value
+from django.db.models.expressions import Col
+
+from myadmin.benchmarking import best_of
+from myadmin.fields import CENTS, MoneyField
+from myadmin.models import Quote
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare decimal and integer-cents money columns: SQL SUM and loading rows "
+        "through Django's converters, on an in-memory SQLite table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument(
+            '--quotes',
+            action='store_true',
+            help="Also time Sum('total_amount') and row loads on the real Quote table",
+        )
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        rng = random.Random(42)
+        amounts = [rng.randrange(5_000, 500_000) for _ in range(rows)]
+
+        # Same values stored the old way (decimal affinity, REAL on disk) and as integer cents
+        db = sqlite3.connect(':memory:')
+        db.execute("CREATE TABLE legacy (total_amount decimal NOT NULL)")
+        db.execute("CREATE TABLE cents (total_amount bigint NOT NULL)")
+        db.executemany("INSERT INTO legacy VALUES (?)", ((str(Decimal(cents).scaleb(-CENTS)),) for cents in amounts))
+        db.executemany("INSERT INTO cents VALUES (?)", ((cents,) for cents in amounts))
+
+        decimal_field = models.DecimalField(max_digits=10, decimal_places=2)
+        decimal_converter = connection.ops.get_decimalfield_converter(Col('legacy', decimal_field))
+        # Aggregates aren't columns, so Django skips the quantize step for them
+        aggregate_converter = connection.ops.get_decimalfield_converter(Value(None, output_field=decimal_field))
+        money_field = MoneyField(max_digits=10)
+        expected = Decimal(sum(amounts)).scaleb(-CENTS)
+
+        def legacy_sum():
+            (value,), = db.execute("SELECT SUM(total_amount) FROM legacy")
+            return aggregate_converter(value, None, connection)
+
+        def cents_sum():
+            (value,), = db.execute("SELECT SUM(total_amount) FROM cents")
+            return money_field.from_db_value(value, None, connection)
+
+        def legacy_load():
+            expression = Col('legacy', decimal_field)
+            return [decimal_converter(value, expression, connection) for value, in db.execute("SELECT total_amount FROM legacy")]
+
+        def cents_load():
+            from_db_value = money_field.from_db_value
+            return [from_db_value(value, None, connection) for value, in db.execute("SELECT total_amount FROM cents")]
+
+        self.stdout.write(f"{rows} rows, best of {repeat}")
+        results = []
+        for label, legacy, cents in (
+            ("SUM()", legacy_sum, cents_sum),
+            ("load rows", legacy_load, cents_load),
+        ):
+            legacy_time, legacy_result = best_of(repeat, legacy)
+            cents_time, cents_result = best_of(repeat, cents)
+            results.append((label, legacy_time, cents_time))
+            if label == "SUM()":
+                self.stdout.write(
+                    f"  exact total {expected}: decimal column {legacy_result} "
+                    f"({'exact' if legacy_result == expected else 'off'}), integer cents {cents_result} "
+                    f"({'exact' if cents_result == expected else 'off'})"
+                )
+
+        for label, legacy_time, cents_time in results:
+            self.stdout.write(
+                f"  {label:<10} decimal {legacy_time * 1000:9.1f} ms   integer cents {cents_time * 1000:9.1f} ms   "
+                f"x{legacy_time / cents_time:.1f}"
+            )
+
+        if options['quotes']:
+            count = Quote.objects.count()
+            sum_time, total = best_of(repeat, lambda: Quote.objects.aggregate(total=Sum('total_amount'))['total'])
+            load_time, _ = best_of(repeat, lambda: list(Quote.objects.values_list('total_amount', flat=True)))
+            self.stdout.write(
+                f"  Quote table ({count} rows): Sum('total_amount') = {total} in {sum_time * 1000:.1f} ms, "
+                f"loading total_amount {load_time * 1000:.1f} ms"
+            )
@@ -0,0 +1,100 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from myadmin.benchmarking import best_of
+from myadmin.fields import CENTS, to_minor_units
+from myadmin.models import PricingRule, Quote, ServicePricing
+from myadmin.pricing_rules import QUOTE_COLUMNS, CompiledRules, build_plan, evaluate_reference, evaluator_for
+
+
+def sample_pricing():
+    pricing = ServicePricing(
+        name='benchmark',
+        house_sqft_price=Decimal('0.15'),
+        driveway_sqft_price=Decimal('0.10'),
+        driveway_car_price=Decimal('25.00'),
+        patio_deck_sqft_price=Decimal('0.12'),
+        roof_cleaning_sqft_price=Decimal('0.20'),
+        gutter_cleaning_flat_price=Decimal('150.00'),
+        distance_price_per_km=Decimal('1.50'),
+    )
+    rules = [
+        PricingRule(kind='volume_discount', threshold=2500, percent_off=Decimal('5')),
+        PricingRule(kind='volume_discount', threshold=5000, percent_off=Decimal('10')),
+        PricingRule(kind='volume_discount', threshold=10000, percent_off=Decimal('15')),
+        PricingRule(kind='distance_zone', threshold=10, amount=Decimal('0')),
+        PricingRule(kind='distance_zone', threshold=25, amount=Decimal('20')),
+        PricingRule(kind='distance_zone', threshold=50, amount=Decimal('45')),
+        PricingRule(kind='bundle_discount', percent_off=Decimal('12.5')),
+        PricingRule(kind='minimum_charge', amount=Decimal('149')),
+    ]
+    return pricing, rules
+
+
+class Command(BaseCommand):
+    help = "Time the compiled pricing rules against the reference interpreter on synthetic quotes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quotes', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument(
+            '--database',
+            action='store_true',
+            help="Also time loading and pricing every quote in the database with its pricing's rules",
+        )
+
+    def handle(self, *args, **options):
+        count, repeat = options['quotes'], options['repeat']
+        rng = random.Random(42)
+        rows = [
+            (
+                rng.randrange(0, 6000),
+                rng.choice(['sqft', 'cars']),
+                rng.randrange(0, 3000),
+                rng.randrange(0, 5),
+                rng.randrange(0, 2000),
+                rng.choice([0, rng.randrange(0, 4000)]),
+                rng.random() < 0.4,
+                rng.randrange(0, 80),
+            )
+            for _ in range(count)
+        ]
+        pricing, rules = sample_pricing()
+
+        compile_time, compiled = best_of(repeat, lambda: CompiledRules(build_plan(pricing, rules)))
+        compiled_time, totals = best_of(repeat, lambda: compiled.totals(rows))
+
+        # The interpreter works on Quote instances; build them outside the timing
+        quotes = [Quote(**dict(zip(QUOTE_COLUMNS, row))) for row in rows]
+        reference_time, reference = best_of(1, lambda: [
+            to_minor_units(evaluate_reference(pricing, rules, quote), CENTS) for quote in quotes
+        ])
+        mismatches = sum(1 for a, b in zip(totals, reference) if a != b)
+
+        self.stdout.write(f"{count} quotes, {len(rules)} rules")
+        self.stdout.write(f"  compile            {compile_time * 1000:9.2f} ms")
+        self.stdout.write(f"  compiled evaluator {compiled_time * 1000:9.1f} ms   ({compiled_time / count * 1e9:.0f} ns/quote)")
+        self.stdout.write(
+            f"  reference          {reference_time * 1000:9.1f} ms   x{reference_time / compiled_time:.0f} slower, "
+            f"{mismatches} mismatches"
+        )
+
+        if options['database']:
+            def price_all():
+                evaluators = {}
+                rows = Quote.objects.order_by().values_list('pricing_id', *QUOTE_COLUMNS)
+                total = 0
+                for pricing_id, *columns in rows.iterator(chunk_size=5000):
+                    evaluate = evaluators.get(pricing_id)
+                    if evaluate is None:
+                        evaluate = evaluators[pricing_id] = evaluator_for(ServicePricing.objects.get(pk=pricing_id)).evaluate
+                    total += evaluate(*columns)
+                return total
+
+            db_time, total = best_of(repeat, price_all)
+            self.stdout.write(
+                f"  database ({Quote.objects.count()} quotes): {db_time * 1000:.1f} ms to load and price, "
+                f"total ${Decimal(total).scaleb(-CENTS):,}"
+            )
@@ -0,0 +1,113 @@
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from myadmin import audit
+from myadmin.franchises import SHARED_MODELS, using_franchise
+from myadmin.models import Customer, Quote, ServicePricing
+
+
+def create_shard(alias, path):
+    """Register a database alias at ``path`` and create the franchise tables in it"""
+    connections.settings[alias] = {**connections.settings['default'], 'NAME': path}
+    with connections[alias].schema_editor() as editor:
+        for model in apps.get_app_config('myadmin').get_models():
+            if model._meta.model_name not in SHARED_MODELS:
+                editor.create_model(model)
+
+    with audit.suspended(), using_franchise(alias):
+        pricing = ServicePricing.objects.create(name='Benchmark', is_active=True)
+        customer = Customer.objects.create(first_name='Bench', last_name='Mark', address_line1='1 Main St')
+    return pricing.pk, customer.pk
+
+
+def drop_shard(alias):
+    connections[alias].close()
+    del connections[alias]
+    del connections.settings[alias]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent quote writes (Quote.save() with its signals, one transaction each) "
+        "with the same writer threads spread over 1, 2, 4... franchise databases"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', default='1,2,4,8', help="Comma-separated shard counts to compare")
+        parser.add_argument('--writers', type=int, default=8, help="Concurrent writer threads")
+        parser.add_argument('--seconds', type=float, default=3.0, help="Duration of each run")
+        parser.add_argument('--dir', help="Where to create the shard files (default: a temporary directory)")
+
+    def handle(self, *args, **options):
+        shard_counts = [int(count) for count in options['shards'].split(',')]
+        writers, seconds = options['writers'], options['seconds']
+        directory = tempfile.mkdtemp(prefix='shards-', dir=options['dir'])
+        numbers = itertools.count()
+
+        self.stdout.write(
+            f"{writers} writer threads on {os.cpu_count()} CPU(s), {seconds:g} s per run, databases in {directory}"
+        )
+        try:
+            baseline = None
+            for count in shard_counts:
+                aliases = [f'bench_{count}_{i}' for i in range(count)]
+                shards = {alias: create_shard(alias, f'{directory}/{alias}.sqlite3') for alias in aliases}
+                writes = [0] * writers
+                waited = [0.0] * writers
+                start = threading.Barrier(writers + 1)
+                deadline = None
+
+                def write(worker):
+                    alias = aliases[worker % count]
+                    pricing_id, customer_id = shards[alias]
+                    today = timezone.now().date()
+                    with audit.suspended(), using_franchise(alias):
+                        start.wait()
+                        try:
+                            while time.perf_counter() < deadline:
+                                began = time.perf_counter()
+                                with transaction.atomic(using=alias):
+                                    # BEGIN IMMEDIATE returns once this writer holds the database's write lock
+                                    waited[worker] += time.perf_counter() - began
+                                    Quote.objects.create(
+                                        customer_id=customer_id,
+                                        pricing_id=pricing_id,
+                                        quote_number=f'B{next(numbers)}',
+                                        work_date=today + timedelta(days=worker),
+                                        house_sqft=2000,
+                                        patio_deck_sqft=300,
+                                        distance_km=12,
+                                    )
+                                writes[worker] += 1
+                        finally:
+                            connections[alias].close()
+
+                threads = [threading.Thread(target=write, args=(worker,)) for worker in range(writers)]
+                for thread in threads:
+                    thread.start()
+                deadline = time.perf_counter() + seconds
+                start.wait()
+                for thread in threads:
+                    thread.join()
+
+                total = sum(writes)
+                rate = total / seconds
+                baseline = baseline or rate
+                self.stdout.write(
+                    f"  {count:>2} shard(s): {total:>7} quotes, {rate:9.0f} writes/s   x{rate / baseline:.1f}   "
+                    f"lock wait {sum(waited) / max(total, 1) * 1000:7.2f} ms/write"
+                )
+                for alias in aliases:
+                    drop_shard(alias)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,183 @@
+import json
+import os
+import platform
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.templatetags.admin_list import results
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.utils import timezone
+
+from myadmin.benchmarking import best_of, duration
+from myadmin.models import Customer, Quote
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+
+
+class Suite:
+    """
+    The benchmarks, each a method returning ``(function, operations per call)``
+    after doing its setup, e.g. loading rows, outside the timing
+    """
+    BENCHMARKS = (
+        'calculate_total',
+        'full_address',
+        'status_tag',
+        'price_calculator_view',
+        'changelist',
+        'changelist_filtered',
+        'changelist_search',
+        'changelist_sorted_by_total',
+        'changelist_last_page',
+    )
+    SAMPLE = 2000
+
+    def __init__(self):
+        self.factory = RequestFactory()
+        self.site = admin.site
+        # Unsaved: a superuser needs no permission queries and has no franchise profile, i.e. head office
+        self.user = get_user_model()(username='benchmark', is_active=True, is_staff=True, is_superuser=True)
+        self.quotes = list(Quote.objects.select_related('customer', 'pricing').order_by('-pk')[:self.SAMPLE])
+        if not self.quotes:
+            raise CommandError("No quotes to benchmark; fill the database with generate_fake_data first")
+
+    def request(self, path, params=None):
+        request = self.factory.get(path, params or {})
+        request.user = self.user
+        return request
+
+    def calculate_total(self):
+        quotes = self.quotes
+        return lambda: [quote.calculate_total() for quote in quotes], len(quotes)
+
+    def full_address(self):
+        customers = [quote.customer for quote in self.quotes]
+        return lambda: [customer.full_address for customer in customers], len(customers)
+
+    def status_tag(self):
+        status_tag, quotes = self.site._registry[Quote].status_tag, self.quotes
+        return lambda: [status_tag(quote) for quote in quotes], len(quotes)
+
+    def price_calculator_view(self):
+        request = self.request('/admin/price-calculator/')
+        return lambda: self.site.price_calculator_view(request).render(), 1
+
+    def _changelist(self, params):
+        model_admin, request = self.site._registry[Quote], self.request('/admin/myadmin/quote/', params)
+
+        def run():
+            # The count queries, the page of quotes and every cell of the rows as the template renders them
+            changelist = model_admin.get_changelist_instance(request)
+            changelist.formset = None
+            return [list(row) for row in results(changelist)]
+
+        return run, 1
+
+    def changelist(self):
+        return self._changelist({})
+
+    def changelist_filtered(self):
+        return self._changelist({'is_completed__exact': '0', 'gutter_cleaning__exact': '1'})
+
+    def changelist_search(self):
+        return self._changelist({'q': 'smith'})
+
+    def changelist_sorted_by_total(self):
+        return self._changelist({'o': '-5'})
+
+    def changelist_last_page(self):
+        model_admin = self.site._registry[Quote]
+        pages = max(Quote.objects.count() // model_admin.list_per_page, 1)
+        return self._changelist({'p': str(pages)})
+
+
+class Command(BaseCommand):
+    help = (
+        "Time hot paths (pricing, display helpers, calculator page, quote changelist) on the current database "
+        "and compare them with a recorded baseline; fails if any got slower than the tolerance allows, "
+        "or if the database doesn't hold the dataset the baseline was recorded on"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file")
+        parser.add_argument('--record', action='store_true', help="Write the results as the new baseline")
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.25,
+            help="Allowed slowdown against the baseline as a fraction (default: 0.25)",
+        )
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per benchmark; the fastest counts")
+        parser.add_argument('--only', help="Comma-separated benchmark names")
+
+    def handle(self, *args, **options):
+        names = list(Suite.BENCHMARKS)
+        if options['only']:
+            names = [name.strip() for name in options['only'].split(',')]
+            unknown = set(names) - set(Suite.BENCHMARKS)
+            if unknown:
+                raise CommandError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+        dataset = {'quotes': Quote.objects.count(), 'customers': Customer.objects.count()}
+        if baseline and baseline.get('dataset') != dataset:
+            # Timings on another amount of data can't be compared, nor kept next to these
+            if options['record']:
+                baseline = {}
+            else:
+                raise CommandError(
+                    f"Baseline was recorded on {baseline.get('dataset')}, this database has {dataset}; "
+                    f"see benchmarks/README.md to generate that dataset and record a baseline"
+                )
+
+        suite = Suite()
+        timings = {}
+        regressions = []
+        self.stdout.write(f"{'benchmark':<28} {'time/op':>12} {'baseline':>12} {'change':>8}")
+        for name in names:
+            func, operations = getattr(suite, name)()
+            func()  # Warm up caches (compiled pricing, templates) first
+            elapsed, _ = best_of(options['repeat'], func)
+            timings[name] = elapsed / operations
+
+            recorded = baseline.get('benchmarks', {}).get(name)
+            change = ''
+            if recorded:
+                limit = recorded * (1 + options['tolerance'])
+                if timings[name] > limit and not options['record']:
+                    # Confirm with more runs before failing on a noisy machine
+                    elapsed, _ = best_of(options['repeat'] * 2, func)
+                    timings[name] = min(timings[name], elapsed / operations)
+                change = f"{timings[name] / recorded - 1:+.0%}"
+                if timings[name] > limit:
+                    regressions.append(name)
+                    change = self.style.ERROR(change)
+            self.stdout.write(
+                f"{name:<28} {duration(timings[name]):>12} {duration(recorded) if recorded else '-':>12} {change:>8}"
+            )
+
+        if options['record']:
+            os.makedirs(os.path.dirname(options['baseline']) or '.', exist_ok=True)
+            with open(options['baseline'], 'w') as file:
+                json.dump(
+                    {
+                        'recorded_at': timezone.now().isoformat(timespec='seconds'),
+                        'machine': f"{platform.platform()}, {os.cpu_count()} CPU(s), Python {platform.python_version()}",
+                        'dataset': dataset,
+                        'benchmarks': {**baseline.get('benchmarks', {}), **timings},
+                    },
+                    file,
+                    indent=2,
+                )
+                file.write('\n')
+            self.stdout.write(f"Baseline written to {options['baseline']}")
+        elif regressions:
+            raise CommandError(
+                f"{len(regressions)} benchmark(s) more than {options['tolerance']:.0%} slower than the baseline: "
+                f"{', '.join(regressions)}"
+            )
@@ -0,0 +1,38 @@
+import time
+
+from myadmin import dedupe
+from myadmin.franchises import FranchiseCommand
+from myadmin.models import Customer
+
+
+class Command(FranchiseCommand):
+    help = "List likely duplicate customers using normalized blocking keys"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--min-score', type=float, default=0.45, help="Minimum pair score (0-1)")
+        parser.add_argument('--limit', type=int, default=50, help="Number of pairs to print")
+        parser.add_argument(
+            '--rebuild-keys',
+            action='store_true',
+            help="Recompute blocking keys first, e.g. after bulk imports",
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild_keys']:
+            started = time.perf_counter()
+            updated = dedupe.rebuild_keys()
+            self.stdout.write(f"Rebuilt keys for {updated} customer(s) in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        pairs = dedupe.find_duplicate_pairs(min_score=options['min_score'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{len(pairs)} candidate pair(s) in {elapsed:.2f}s")
+
+        shown = pairs[:options['limit']]
+        customers = Customer.objects.in_bulk({pk for _, a, b in shown for pk in (a, b)})
+        for score, a, b in shown:
+            self.stdout.write(
+                f"{score:.2f}  #{a} {customers[a].full_name} <{customers[a].email}>  ~  "
+                f"#{b} {customers[b].full_name} <{customers[b].email}>"
+            )
@@ -0,0 +1,208 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from myadmin import audit
+from myadmin.dedupe import blocking_keys
+from myadmin.fields import CENTS, from_minor_units
+from myadmin.franchises import FranchiseCommand
+from myadmin.models import Crew, Customer, PricingRule, Quote, ServicePricing
+from myadmin.pricing_rules import QUOTE_COLUMNS, evaluator_for
+from myadmin.scheduling import estimate_minutes, rebuild_daily_load
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Daniel', 'Karen',
+    'Marc', 'Sophie', 'Jean', 'Isabelle', 'Pierre', 'Chantal', 'Ahmed', 'Fatima', 'Wei', 'Mei',
+    'Raj', 'Priya', 'Liam', 'Olivia', 'Noah', 'Emma', 'Lucas', 'Chloe', 'Ethan', 'Ava',
+]
+LAST_NAMES = [
+    'Smith', 'Brown', 'Tremblay', 'Martin', 'Roy', 'Wilson', 'MacDonald', 'Gagnon', 'Johnson', 'Taylor',
+    'Campbell', 'Anderson', 'Leblanc', 'Lee', 'Gauthier', 'White', 'Thompson', 'Bouchard', 'Scott', 'Stewart',
+    'Morin', 'Wong', 'Patel', 'Singh', 'Nguyen', 'Kelly', 'Murphy', 'Clark', 'Young', 'Lavoie',
+]
+STREETS = [
+    'Main St', 'Bank St', 'Carling Ave', 'Merivale Rd', 'Baseline Rd', 'Woodroffe Ave', 'Hunt Club Rd',
+    'Innes Rd', 'St. Joseph Blvd', 'Hazeldean Rd', 'March Rd', 'Greenbank Rd', 'Strandherd Dr',
+    'Bridle Path Dr', 'Maple Grove Rd', 'Riverside Dr', 'Alta Vista Dr', 'Fisher Ave', 'Prince of Wales Dr',
+    'Jockvale Rd', 'Terry Fox Dr', 'Tenth Line Rd', 'Boul. Saint-Joseph', 'Rue Principale',
+]
+# (city, province, postal code prefix, share of customers)
+CITIES = [
+    ('Ottawa', 'ON', 'K1', 30),
+    ('Nepean', 'ON', 'K2G', 14),
+    ('Kanata', 'ON', 'K2K', 14),
+    ('Orleans', 'ON', 'K1C', 12),
+    ('Barrhaven', 'ON', 'K2J', 10),
+    ('Stittsville', 'ON', 'K2S', 5),
+    ('Manotick', 'ON', 'K4M', 3),
+    ('Gatineau', 'QC', 'J8T', 8),
+    ('Aylmer', 'QC', 'J9H', 4),
+]
+# Power washing is seasonal: relative quote volume per month, January first
+MONTH_WEIGHTS = [0.15, 0.15, 0.35, 0.75, 1.0, 1.0, 0.95, 0.9, 0.8, 0.55, 0.3, 0.15]
+PRICING_TIERS = [
+    ('Standard', Decimal('1.00')),
+    ('Premium', Decimal('1.25')),
+    ('Commercial', Decimal('0.85')),
+    ('Spring Promotion', Decimal('0.90')),
+]
+CREW_NAMES = ['Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo', 'Foxtrot', 'Golf', 'Hotel']
+
+
+def postal_code(rng, prefix):
+    letters, digits = 'ABCEGHJKLMNPRSTVXY', '0123456789'
+    # Forward sortation area is letter-digit-letter; prefixes give the first two or all three
+    code = prefix if len(prefix) == 3 else prefix + rng.choice(letters)
+    return f'{code} {rng.choice(digits)}{rng.choice(letters)}{rng.choice(digits)}'
+
+
+def fake_customer(rng):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    city, province, prefix, _ = rng.choices(CITIES, weights=[city[3] for city in CITIES])[0]
+    customer = Customer(
+        first_name=first,
+        last_name=last,
+        email=f'{first}.{last}{rng.randrange(100)}@example.com'.lower() if rng.random() < 0.85 else '',
+        phone_number=f'613-{rng.randrange(200, 1000)}-{rng.randrange(10000):04d}' if rng.random() < 0.9 else '',
+        address_line1=f'{rng.randrange(1, 3000)} {rng.choice(STREETS)}',
+        address_line2=f'Unit {rng.randrange(1, 40)}' if rng.random() < 0.08 else '',
+        city=city,
+        state=province,
+        zip_code=postal_code(rng, prefix),
+    )
+    # bulk_create() skips save(), which keeps the duplicate detection keys
+    for field, value in blocking_keys(customer).items():
+        setattr(customer, field, value)
+    return customer
+
+
+def fake_quote_fields(rng):
+    """Service selections with roughly the spread of real residential jobs"""
+    by_cars = rng.random() < 0.3
+    return {
+        'house_sqft': min(max(int(rng.lognormvariate(7.6, 0.35)), 600), 9000),
+        'driveway_calculation_type': 'cars' if by_cars else 'sqft',
+        'driveway_sqft': 0 if by_cars else min(max(int(rng.gauss(650, 250)), 0), 3000),
+        'driveway_cars': rng.choice([1, 2, 2, 2, 3, 4]) if by_cars else 0,
+        'patio_deck_sqft': rng.randrange(80, 900) if rng.random() < 0.5 else 0,
+        'roof_cleaning_sqft': rng.randrange(800, 3500) if rng.random() < 0.2 else 0,
+        'gutter_cleaning': rng.random() < 0.4,
+        'distance_km': min(int(rng.expovariate(1 / 14)), 120),
+    }
+
+
+def seasonal_date(rng, today, days):
+    while True:
+        day = today - timedelta(days=rng.randrange(days))
+        if rng.random() < MONTH_WEIGHTS[day.month - 1]:
+            return day
+
+
+def next_weekday(day):
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+class Command(FranchiseCommand):
+    help = (
+        "Fill the database with realistic fake customers, pricing and quotes using bulk_create, "
+        "e.g. 1M quotes for benchmarks"
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--quotes', type=int, default=100_000)
+        parser.add_argument('--customers', type=int, help="Default: one for every 3 quotes")
+        parser.add_argument('--pricings', type=int, default=2, choices=range(1, len(PRICING_TIERS) + 1))
+        parser.add_argument('--crews', type=int, default=4, choices=range(0, len(CREW_NAMES) + 1))
+        parser.add_argument('--days', type=int, default=3 * 365, help="How far back quote dates go")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='FD', help="Quote number prefix, to keep runs apart")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        quote_count = options['quotes']
+        customer_count = options['customers'] or max(quote_count // 3, 1)
+        today = timezone.now().date()
+        started = time.perf_counter()
+
+        with audit.suspended():
+            pricings = self.pricings(options['pricings'])
+            crews = [
+                Crew.objects.get_or_create(name=f'Crew {name}')[0] for name in CREW_NAMES[:options['crews']]
+            ]
+            evaluators = [(pricing, evaluator_for(pricing).evaluate) for pricing in pricings]
+
+            customer_ids = []
+            for offset in range(0, customer_count, batch_size):
+                batch = [fake_customer(rng) for _ in range(min(batch_size, customer_count - offset))]
+                customer_ids.extend(customer.pk for customer in Customer.objects.bulk_create(batch))
+            self.stdout.write(f"{len(customer_ids)} customers in {time.perf_counter() - started:.1f} s")
+
+            number = Quote.objects.filter(quote_number__startswith=options['prefix']).count()
+            for offset in range(0, quote_count, batch_size):
+                batch = []
+                for _ in range(min(batch_size, quote_count - offset)):
+                    number += 1
+                    fields = fake_quote_fields(rng)
+                    quote_date = seasonal_date(rng, today, options['days'])
+                    work_date = None
+                    if rng.random() < 0.75:
+                        work_date = next_weekday(quote_date + timedelta(days=rng.randrange(1, 45)))
+                    # Most pricing is the first tier; repeat customers are more likely the older ones
+                    pricing, evaluate = evaluators[0] if rng.random() < 0.7 else rng.choice(evaluators)
+                    quote = Quote(
+                        customer_id=customer_ids[int(len(customer_ids) * rng.random() ** 1.3)],
+                        pricing=pricing,
+                        quote_number=f"{options['prefix']}{number:08d}",
+                        quote_date=quote_date,
+                        work_date=work_date,
+                        crew=rng.choice(crews) if work_date and crews and rng.random() < 0.9 else None,
+                        is_completed=bool(work_date) and work_date < today and rng.random() < 0.95,
+                        total_amount=from_minor_units(evaluate(*(fields[column] for column in QUOTE_COLUMNS)), CENTS),
+                        **fields,
+                    )
+                    quote.estimated_minutes = estimate_minutes(quote)
+                    batch.append(quote)
+                with transaction.atomic(using=options['franchise']):
+                    Quote.objects.bulk_create(batch)
+                done = offset + len(batch)
+                if done % (batch_size * 20) == 0 or done == quote_count:
+                    self.stdout.write(f"  {done} quotes, {done / (time.perf_counter() - started):.0f}/s")
+
+        rebuild_daily_load()
+        self.stdout.write(
+            f"Created {customer_count} customers and {quote_count} quotes in {time.perf_counter() - started:.1f} s"
+        )
+
+    def pricings(self, count):
+        """The first ``count`` pricing tiers, created with a few rules if missing"""
+        default = ServicePricing()
+        pricings = []
+        for name, factor in PRICING_TIERS[:count]:
+            pricing, created = ServicePricing.objects.get_or_create(
+                name=name,
+                defaults={
+                    field: (getattr(default, field) * factor).quantize(Decimal('0.01'))
+                    for field in ServicePricing.RATE_FIELDS
+                },
+            )
+            if created:
+                PricingRule.objects.bulk_create([
+                    PricingRule(pricing=pricing, kind='volume_discount', threshold=5000, percent_off=Decimal('5')),
+                    PricingRule(pricing=pricing, kind='distance_zone', threshold=25, amount=Decimal('0')),
+                    PricingRule(pricing=pricing, kind='distance_zone', threshold=60, amount=Decimal('25')),
+                    PricingRule(pricing=pricing, kind='minimum_charge', amount=Decimal('150')),
+                ])
+                # A new pricing version, as PricingRule.save() would make; bulk_create() skips it
+                pricing.save(update_fields=['updated_at'])
+            pricings.append(pricing)
+        return pricings
@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.utils import timezone
+
+from myadmin.franchises import FranchiseCommand
+from myadmin.models import DailyLoad, Quote
+from myadmin.scheduling import estimate_expression, rebuild_daily_load
+
+
+class Command(FranchiseCommand):
+    help = "Rebuild the per-day crew load table, e.g. after bulk imports that bypass Quote.save()"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--since', type=date.fromisoformat, help="First work date to rebuild")
+        parser.add_argument('--until', type=date.fromisoformat, help="Last work date to rebuild")
+        parser.add_argument(
+            '--estimates',
+            action='store_true',
+            help="Also recompute Quote.estimated_minutes for the range",
+        )
+
+    def handle(self, *args, **options):
+        since, until = options['since'], options['until']
+
+        if options['estimates']:
+            quotes = Quote.objects.filter(work_date__isnull=False)
+            if since:
+                quotes = quotes.filter(work_date__gte=since)
+            if until:
+                quotes = quotes.filter(work_date__lte=until)
+            updated = quotes.update(estimated_minutes=estimate_expression(), updated_at=timezone.now())
+            self.stdout.write(f"Re-estimated {updated} quote(s)")
+
+        rebuild_daily_load(since, until)
+        self.stdout.write(f"Daily load rebuilt: {DailyLoad.objects.count()} day(s) with bookings")
@@ -0,0 +1,87 @@
+import time
+from datetime import date
+
+from django.core.management.base import CommandError
+
+from myadmin.franchises import FranchiseCommand
+from myadmin.models import Quote, ServicePricing
+from myadmin.simulator import (
+    QuoteMeasurements,
+    Scenario,
+    baseline_pricing,
+    active_rule_count,
+    default_period,
+    parse_scenario,
+    simulate,
+)
+
+
+class Command(FranchiseCommand):
+    help = (
+        "Simulate list-rate revenue (before pricing rules) of historical quotes under candidate pricing. "
+        "Example: --scenario \"roof 0.65: roof_cleaning_sqft_price=0.65, distance_price_per_km*=2\""
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            required=True,
+            help="'[name:] field=value, field*=factor'; may be repeated",
+        )
+        parser.add_argument('--pricing', type=int, help="Baseline ServicePricing id (default: active pricing)")
+        parser.add_argument('--since', type=date.fromisoformat, help="First quote date (default: Jan 1 last year)")
+        parser.add_argument('--until', type=date.fromisoformat, help="Last quote date (default: Dec 31 last year)")
+        parser.add_argument('--completed-only', action='store_true', help="Only include completed quotes")
+
+    def handle(self, *args, **options):
+        if options['pricing']:
+            try:
+                pricing = ServicePricing.objects.get(pk=options['pricing'])
+            except ServicePricing.DoesNotExist:
+                raise CommandError(f"ServicePricing {options['pricing']} does not exist")
+        else:
+            pricing = baseline_pricing()
+        if pricing is None:
+            raise CommandError("No ServicePricing configured")
+
+        baseline = Scenario.from_pricing(pricing)
+        try:
+            scenarios = [parse_scenario(line, baseline) for line in options['scenario']]
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        default_since, default_until = default_period()
+        since = options['since'] or default_since
+        until = options['until'] or default_until
+        quotes = Quote.objects.filter(quote_date__range=(since, until))
+        if options['completed_only']:
+            quotes = quotes.filter(is_completed=True)
+
+        started = time.perf_counter()
+        measurements = QuoteMeasurements.load(quotes)
+        loaded = time.perf_counter()
+        results = simulate(measurements, baseline, scenarios)
+        finished = time.perf_counter()
+
+        self.stdout.write(
+            f"{len(measurements)} quotes from {since} to {until}, baseline '{pricing.name}' "
+            f"(load {loaded - started:.2f}s, {len(scenarios)} scenarios {finished - loaded:.3f}s)"
+        )
+        self.stdout.write("Revenue at list rates, before pricing rules")
+        rule_count = active_rule_count(pricing)
+        if rule_count:
+            self.stdout.write(self.style.WARNING(
+                f"'{pricing.name}' has {rule_count} active pricing rule(s), left out: totals won't match quote totals"
+            ))
+        for result in results:
+            self.stdout.write("")
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{result.scenario.name}: {result.baseline_total} -> {result.total} ({result.delta:+})"
+            ))
+            for label, base, value, delta in result.service_deltas():
+                if delta:
+                    self.stdout.write(f"  {label:<20} {base:>14} -> {value:>14} ({delta:+})")
+            for month, base, value, delta in result.month_deltas():
+                self.stdout.write(f"  {month:%Y-%m}              {base:>14} -> {value:>14} ({delta:+})")
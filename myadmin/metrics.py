@@ -0,0 +1,451 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Counters, gauges and histograms keep their values in memory behind a lock
+per label set, so recording a value costs well under a microsecond. With
+``settings.METRICS_DIR`` set (one directory shared by all gunicorn workers),
+each process also writes a snapshot of its values to its own file every few
+seconds; the scrape endpoint merges every process's file. Counters and
+histograms of exited workers still count, gauges only of live ones.
+
+Query counts and lock waits come from a wrapper installed on every database
+connection: SQLite's ``BEGIN IMMEDIATE`` returns once the write lock is held,
+so its duration is the time spent waiting for other writers.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import OperationalError
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_request_queries = contextvars.ContextVar('metrics_request_queries', default=None)
+
+
+class _CounterValue:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def get(self):
+        return self.value
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _HistogramValue:
+    __slots__ = ('_lock', '_buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        # One count per bucket plus +Inf; made cumulative when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def get(self):
+        with self._lock:
+            return [list(self.counts), self.sum]
+
+
+class Metric:
+    """A named metric with optional labels; ``labels()`` returns the value holder to record on"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        # Children by the label values exactly as passed, to skip str() on repeat lookups
+        self._lookup = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Unlabeled metrics record directly on the metric
+            self._default = self.labels()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Value holder for one combination of label values; cache it on hot paths"""
+        child = self._lookup.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            key = tuple(str(value) for value in values)
+            with self._lock:
+                child = self._children.setdefault(key, self._new_value())
+                self._lookup[values] = child
+        return child
+
+    def samples(self):
+        return [[list(key), child.get()] for key, child in list(self._children.items())]
+
+    def describe(self):
+        return {'kind': self.kind, 'help': self.documentation, 'labelnames': list(self.labelnames)}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    """A value that goes up and down; ``function`` is called at collection time instead"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None, registry=None):
+        self.function = function
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_value(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def samples(self):
+        if self.function is not None:
+            return [[[], self.function()]]
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def describe(self):
+        return {**super().describe(), 'buckets': list(self.buckets)}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def snapshot(self):
+        """JSON-serializable values of every metric in this process"""
+        return {
+            'pid': os.getpid(),
+            'metrics': {
+                name: {**metric.describe(), 'samples': metric.samples()}
+                for name, metric in list(self._metrics.items())
+            },
+        }
+
+
+REGISTRY = Registry()
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def merge(snapshots):
+    """Combine per-process snapshots: counters and histograms add up, gauges of live processes add up"""
+    merged = {}
+    for snapshot in snapshots:
+        alive = _pid_alive(snapshot['pid'])
+        for name, data in snapshot['metrics'].items():
+            if data['kind'] == 'gauge' and not alive:
+                continue
+            target = merged.setdefault(name, {**data, 'samples': {}})
+            for labels, value in data['samples']:
+                key = tuple(labels)
+                current = target['samples'].get(key)
+                if current is None:
+                    target['samples'][key] = value
+                elif data['kind'] == 'histogram':
+                    target['samples'][key] = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+                else:
+                    target['samples'][key] = current + value
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+def render(merged):
+    """Prometheus text exposition format"""
+    lines = []
+    for name in sorted(merged):
+        data = merged[name]
+        names = data['labelnames']
+        lines.append(f"# HELP {name} {_escape(data['help'])}")
+        lines.append(f"# TYPE {name} {data['kind']}")
+        for labels, value in sorted(data['samples'].items()):
+            if data['kind'] == 'histogram':
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip([*data['buckets'], float('inf')], counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(names, labels, [('le', _number(float(bound)))])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, labels)} {_number(float(total))}")
+                lines.append(f"{name}_count{_labels(names, labels)} {cumulative}")
+            else:
+                lines.append(f"{name}{_labels(names, labels)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+class SnapshotWriter:
+    """Daemon thread that writes this process's snapshot to ``METRICS_DIR`` every few seconds"""
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+
+    def ensure_started(self):
+        # Checked per request: a forked worker needs its own thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                os.makedirs(self.directory, exist_ok=True)
+                threading.Thread(target=self._run, name='metrics-writer', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.write()
+
+    def write(self):
+        temporary = f'{self.path}.tmp'
+        try:
+            with open(temporary, 'w') as snapshot:
+                json.dump(REGISTRY.snapshot(), snapshot)
+            os.replace(temporary, self.path)
+        except OSError:
+            logger.warning("Could not write metrics snapshot to %s", self.directory, exc_info=True)
+
+    def read_all(self):
+        self.write()
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith('metrics-') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as snapshot:
+                    snapshots.append(json.load(snapshot))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+
+writer = None
+if getattr(settings, 'METRICS_DIR', None):
+    writer = SnapshotWriter(settings.METRICS_DIR, getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0))
+    atexit.register(writer.write)
+
+
+def exposition():
+    """Current metrics of this process, or of all processes sharing ``METRICS_DIR``"""
+    snapshots = writer.read_all() if writer else [REGISTRY.snapshot()]
+    return render(merge(snapshots))
+
+
+# Business and performance metrics
+
+QUOTES_CREATED = Counter('nativewash_quotes_created_total', "Quotes created", ['franchise'])
+QUOTES_COMPLETED = Counter('nativewash_quotes_completed_total', "Quotes marked completed", ['franchise'])
+CALCULATE_TOTAL_SECONDS = Histogram(
+    'nativewash_calculate_total_seconds',
+    "Time spent in Quote.calculate_total()",
+    buckets=(1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2),
+)
+PRICING_CACHE = Counter(
+    'nativewash_pricing_rules_cache_total',
+    "Compiled pricing rules lookups by result (hit or miss)",
+    ['result'],
+)
+PRICING_CACHE_HITS = PRICING_CACHE.labels('hit')
+PRICING_CACHE_MISSES = PRICING_CACHE.labels('miss')
+REQUEST_SECONDS = Histogram('nativewash_http_request_duration_seconds', "Request latency by view", ['view', 'method'])
+REQUESTS = Counter('nativewash_http_requests_total', "Requests by view and status code", ['view', 'method', 'status'])
+REQUEST_QUERIES = Histogram(
+    'nativewash_http_request_queries',
+    "SQL queries per request by view",
+    ['view'],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+DB_QUERIES = Counter('nativewash_db_queries_total', "SQL statements executed", ['database'])
+DB_LOCK_WAIT_SECONDS = Histogram(
+    'nativewash_db_lock_wait_seconds',
+    "Time to begin a transaction, i.e. waiting for the database write lock",
+    ['database'],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 20.0),
+)
+DB_LOCK_TIMEOUTS = Counter('nativewash_db_lock_timeouts_total', "Statements that failed with 'database is locked'", ['database'])
+
+
+def _audit_pending():
+    from .audit import buffer
+
+    return len(buffer)
+
+
+AUDIT_PENDING = Gauge('nativewash_audit_pending_entries', "Audit entries waiting to be written", function=_audit_pending)
+
+
+def _query_wrapper(alias):
+    queries = DB_QUERIES.labels(alias)
+    lock_wait = DB_LOCK_WAIT_SECONDS.labels(alias)
+    timeouts = DB_LOCK_TIMEOUTS.labels(alias)
+
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as error:
+            if 'locked' in str(error):
+                timeouts.inc()
+            raise
+        finally:
+            if sql.startswith('BEGIN'):
+                lock_wait.observe(time.perf_counter() - started)
+            queries.inc()
+            counter = _request_queries.get()
+            if counter is not None:
+                counter[0] += 1
+
+    return wrapper
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """connection_created: count this connection's queries and lock waits"""
+    if not getattr(connection, '_metrics_wrapped', False):
+        connection.execute_wrappers.insert(0, _query_wrapper(connection.alias))
+        connection._metrics_wrapped = True
+
+
+def quote_saved(sender, instance, created, raw=False, using=None, **kwargs):
+    """post_save of Quote; connected before the audit handler, which refreshes the loaded snapshot"""
+    if raw:
+        return
+    if created:
+        QUOTES_CREATED.labels(using).inc()
+    was_completed = getattr(instance, '_audit_snapshot', {}).get('is_completed', False)
+    if instance.is_completed and (created or not was_completed):
+        QUOTES_COMPLETED.labels(using).inc()
+
+
+# The method label is client input; anything else is counted as 'other' to bound the label sets
+HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'))
+
+
+class MetricsMiddleware:
+    """Latency, status and SQL query count of every request, by view name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if writer is not None:
+            writer.ensure_started()
+        queries = [0]
+        token = _request_queries.set(queries)
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_queries.reset(token)
+            match = getattr(request, 'resolver_match', None)
+            view = match.view_name if match else '<unresolved>'
+            method = request.method if request.method in HTTP_METHODS else 'other'
+            REQUEST_SECONDS.labels(view, method).observe(elapsed)
+            REQUESTS.labels(view, method, status).inc()
+            REQUEST_QUERIES.labels(view).observe(queries[0])
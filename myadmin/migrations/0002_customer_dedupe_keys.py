@@ -0,0 +1,176 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:30
+
+import re
+
+from django.db import migrations, models
+
+# The key normalization as of this migration, frozen so later changes to
+# myadmin.dedupe don't change what it does
+
+ADDRESS_ABBREVIATIONS = {
+    'street': 'st',
+    'avenue': 'ave',
+    'road': 'rd',
+    'drive': 'dr',
+    'boulevard': 'blvd',
+    'crescent': 'cres',
+    'court': 'ct',
+    'place': 'pl',
+    'lane': 'ln',
+    'terrace': 'terr',
+    'circle': 'cir',
+    'highway': 'hwy',
+    'north': 'n',
+    'south': 's',
+    'east': 'e',
+    'west': 'w',
+    'apartment': 'apt',
+    'suite': 'ste',
+    'unit': 'unit',
+}
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) < 7:
+        return ''
+    return digits[-10:]
+
+
+def normalize_address(address_line1, address_line2, zip_code):
+    words = re.findall(r'[a-z0-9]+', f"{address_line1} {address_line2}".lower())
+    street = ' '.join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+    if not street:
+        return ''
+    return f"{street}|{re.sub(r'[^0-9A-Z]', '', (zip_code or '').upper())}"
+
+
+def soundex(name):
+    letters = re.sub(r'[^a-z]', '', (name or '').lower())
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def phonetic_name(first_name, last_name):
+    last = soundex(last_name)
+    if not last:
+        return ''
+    first = re.sub(r'[^a-z]', '', (first_name or '').lower())[:1].upper()
+    return f"{last}{first}"
+
+
+def populate_blocking_keys(apps, schema_editor):
+    Customer = apps.get_model('myadmin', 'Customer')
+    connection = schema_editor.connection
+    qn = connection.ops.quote_name
+    sql = (
+        f"UPDATE {qn(Customer._meta.db_table)} "
+        f"SET {qn('phone_key')} = %s, {qn('email_key')} = %s, {qn('address_key')} = %s, {qn('name_key')} = %s "
+        f"WHERE {qn('id')} = %s"
+    )
+    rows = Customer.objects.using(connection.alias).order_by().values_list(
+        'pk', 'first_name', 'last_name', 'email', 'phone_number', 'address_line1', 'address_line2', 'zip_code',
+    )
+    batch = []
+    with connection.cursor() as cursor:
+        for pk, first_name, last_name, email, phone_number, address_line1, address_line2, zip_code in rows.iterator(
+            chunk_size=5000
+        ):
+            batch.append((
+                normalize_phone(phone_number),
+                (email or '').strip().lower(),
+                normalize_address(address_line1, address_line2, zip_code),
+                phonetic_name(first_name, last_name),
+                pk,
+            ))
+            if len(batch) >= 5000:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myadmin', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='address_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=400),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='email_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='name_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=8),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='city',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='email',
+            field=models.EmailField(blank=True, max_length=254),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='first_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='last_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='phone_number',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='state',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='zip_code',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.RunPython(populate_blocking_keys, migrations.RunPython.noop),
+    ]
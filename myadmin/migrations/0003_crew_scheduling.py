@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Count, ExpressionWrapper, F, IntegerField, Sum, Value, When
+
+
+def estimate_expression():
+    """The duration estimate as of this migration, in hundredths of a minute rounded to minutes"""
+    hundredths = (
+        Value(30 * 100)
+        + F('house_sqft') * 6
+        + F('patio_deck_sqft') * 5
+        + F('roof_cleaning_sqft') * 10
+        + Case(
+            When(driveway_calculation_type='sqft', then=F('driveway_sqft') * 4),
+            default=F('driveway_cars') * (20 * 100),
+        )
+        + Case(When(gutter_cleaning=True, then=Value(60 * 100)), default=Value(0))
+        + F('distance_km') * (2 * 100)
+    )
+    return ExpressionWrapper((hundredths + 50) / 100, output_field=IntegerField())
+
+
+def populate_schedule(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Quote = apps.get_model('myadmin', 'Quote')
+    DailyLoad = apps.get_model('myadmin', 'DailyLoad')
+    Quote.objects.using(alias).update(estimated_minutes=estimate_expression())
+    rows = (
+        Quote.objects.using(alias).filter(work_date__isnull=False)
+        .order_by()
+        .values('work_date')
+        .annotate(jobs=Count('pk'), minutes=Sum('estimated_minutes'))
+    )
+    DailyLoad.objects.using(alias).bulk_create(
+        [DailyLoad(date=row['work_date'], job_count=row['jobs'], booked_minutes=row['minutes']) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myadmin', '0002_customer_dedupe_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Crew',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('daily_capacity_minutes', models.PositiveIntegerField(default=480, verbose_name='Daily Capacity (minutes)')),
+                ('works_weekends', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Crew',
+                'verbose_name_plural': 'Crews',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('job_count', models.PositiveIntegerField(default=0)),
+                ('booked_minutes', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Daily Load',
+                'verbose_name_plural': 'Daily Loads',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='quote',
+            name='estimated_minutes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Estimated Duration (minutes)'),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='work_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quote',
+            name='crew',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='quotes', to='myadmin.crew'),
+        ),
+        migrations.RunPython(populate_schedule, migrations.RunPython.noop),
+    ]
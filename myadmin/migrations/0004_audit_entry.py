@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:43
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myadmin', '0003_crew_scheduling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('model', models.CharField(max_length=40)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('c', 'Created'), ('u', 'Updated'), ('b', 'Bulk updated'), ('d', 'Deleted')], max_length=1)),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('changes', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+            options={
+                'verbose_name': 'Audit Entry',
+                'verbose_name_plural': 'Audit Entries',
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['model', 'object_id', 'timestamp'], name='auditentry_object_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Store money as integer minor units: cents, and milli-cents for per-sq.ft. rates
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Round
+
+import myadmin.fields
+
+# (model, field, max_digits, decimal_places, verbose_name, default)
+MONEY_FIELDS = [
+    ('servicepricing', 'house_sqft_price', 8, 5, "House Price per Square Foot", Decimal('0.50')),
+    ('servicepricing', 'driveway_sqft_price', 8, 5, "Driveway Price per Square Foot", Decimal('0.70')),
+    ('servicepricing', 'driveway_car_price', 6, 2, "Driveway Price per Car", Decimal('50.00')),
+    ('servicepricing', 'patio_deck_sqft_price', 8, 5, "Patio/Deck Price per Square Foot", Decimal('0.80')),
+    ('servicepricing', 'roof_cleaning_sqft_price', 8, 5, "Roof Cleaning Price per Square Foot", Decimal('0.60')),
+    ('servicepricing', 'gutter_cleaning_flat_price', 6, 2, "Gutter Cleaning Flat Price", Decimal('75.00')),
+    ('servicepricing', 'distance_price_per_km', 5, 2, "Price per Kilometer", Decimal('2.00')),
+    ('quote', 'total_amount', 10, 2, "Total Quote Amount", None),
+]
+
+
+def to_minor_units(apps, schema_editor):
+    for model_name, field, max_digits, places, verbose_name, default in MONEY_FIELDS:
+        model = apps.get_model('myadmin', model_name)
+        model._base_manager.using(schema_editor.connection.alias).update(**{
+            f'{field}_minor': Cast(Round(F(field) * Value(10 ** places)), models.BigIntegerField()),
+        })
+
+
+def from_minor_units(apps, schema_editor):
+    for model_name, field, max_digits, places, verbose_name, default in MONEY_FIELDS:
+        model = apps.get_model('myadmin', model_name)
+        model._base_manager.using(schema_editor.connection.alias).update(**{
+            field: Cast(
+                F(f'{field}_minor') * Value(Decimal(1).scaleb(-places)),
+                models.DecimalField(max_digits=max_digits + places, decimal_places=places),
+            ),
+        })
+
+
+def money_field(max_digits, places, verbose_name, default):
+    kwargs = {'max_digits': max_digits, 'verbose_name': verbose_name}
+    if places != 2:
+        kwargs['decimal_places'] = places
+    if default is not None:
+        kwargs['default'] = default
+    return myadmin.fields.MoneyField(**kwargs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myadmin', '0004_audit_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name=model_name,
+            name=f'{field}_minor',
+            field=money_field(max_digits, places, verbose_name, default if default is not None else Decimal('0')),
+        )
+        for model_name, field, max_digits, places, verbose_name, default in MONEY_FIELDS
+    ] + [
+        migrations.RunPython(to_minor_units, from_minor_units),
+        # Lets the decimal column be re-added to existing rows when migrating backwards
+        migrations.AlterField(
+            model_name='quote',
+            name='total_amount',
+            field=models.DecimalField(
+                decimal_places=2,
+                default=Decimal('0'),
+                max_digits=10,
+                verbose_name="Total Quote Amount",
+            ),
+        ),
+    ] + [
+        migrations.RemoveField(model_name=model_name, name=field)
+        for model_name, field, max_digits, places, verbose_name, default in MONEY_FIELDS
+    ] + [
+        migrations.RenameField(model_name=model_name, old_name=f'{field}_minor', new_name=field)
+        for model_name, field, max_digits, places, verbose_name, default in MONEY_FIELDS
+    ] + [
+        # total_amount had no default; drop the one needed to add the column
+        migrations.AlterField(
+            model_name='quote',
+            name='total_amount',
+            field=money_field(10, 2, "Total Quote Amount", None),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:51
+
+import django.core.validators
+import django.db.models.deletion
+import myadmin.fields
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myadmin', '0005_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('volume_discount', 'Volume discount'), ('distance_zone', 'Distance zone'), ('bundle_discount', 'Gutter + roof bundle discount'), ('minimum_charge', 'Minimum job charge')], max_length=20)),
+                ('threshold', models.PositiveIntegerField(default=0, help_text='Volume discount: minimum total sq.ft. Distance zone: up to this many km.')),
+                ('percent_off', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Volume and bundle discounts.', max_digits=5, validators=[django.core.validators.MinValueValidator(Decimal('0')), django.core.validators.MaxValueValidator(Decimal('100'))], verbose_name='Percent Off')),
+                ('amount', myadmin.fields.MoneyField(default=Decimal('0.00'), help_text='Distance zone: flat travel charge. Minimum charge: lowest job total.', max_digits=8)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('pricing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='myadmin.servicepricing')),
+            ],
+            options={
+                'verbose_name': 'Pricing Rule',
+                'verbose_name_plural': 'Pricing Rules',
+                'ordering': ['pricing', 'kind', 'threshold'],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:57
+
+import django.db.models.deletion
+import myadmin.franchises
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myadmin', '0006_pricing_rules'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaffProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('franchise', models.CharField(blank=True, choices=myadmin.franchises.franchise_choices, help_text='Leave blank for head office staff, who also see the cross-franchise report.', max_length=50)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='staff_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Staff Profile',
+                'verbose_name_plural': 'Staff Profiles',
+            },
+        ),
+    ]
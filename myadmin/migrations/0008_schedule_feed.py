@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myadmin', '0007_staff_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuoteTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quote_id', models.BigIntegerField()),
+                ('crew_id', models.BigIntegerField(blank=True, null=True)),
+                ('work_date', models.DateField()),
+                ('deleted_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Quote Tombstone',
+                'verbose_name_plural': 'Quote Tombstones',
+            },
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='quote',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myadmin', '0008_schedule_feed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='address_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=532),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def rebuild(apps, schema_editor, group_by):
+    alias = schema_editor.connection.alias
+    Quote = apps.get_model('myadmin', 'Quote')
+    DailyLoad = apps.get_model('myadmin', 'DailyLoad')
+    rows = (
+        Quote.objects.using(alias).filter(work_date__isnull=False)
+        .order_by()
+        .values('work_date', *group_by)
+        .annotate(jobs=Count('pk'), minutes=Sum('estimated_minutes'))
+    )
+    DailyLoad.objects.using(alias).all().delete()
+    DailyLoad.objects.using(alias).bulk_create(
+        [
+            DailyLoad(
+                date=row['work_date'],
+                job_count=row['jobs'],
+                booked_minutes=row['minutes'] or 0,
+                **{field: row[field] for field in group_by},
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+def split_by_crew(apps, schema_editor):
+    rebuild(apps, schema_editor, ['crew_id'])
+
+
+def combine_crews(apps, schema_editor):
+    rebuild(apps, schema_editor, [])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myadmin', '0009_customer_address_key_length'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='dailyload',
+            options={'ordering': ['date', 'crew'], 'verbose_name': 'Daily Load', 'verbose_name_plural': 'Daily Loads'},
+        ),
+        migrations.AddField(
+            model_name='dailyload',
+            name='crew',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_loads', to='myadmin.crew'),
+        ),
+        migrations.AlterField(
+            model_name='dailyload',
+            name='date',
+            field=models.DateField(db_index=True),
+        ),
+        # Going back, one row per date before the date is unique again
+        migrations.RunPython(migrations.RunPython.noop, combine_crews),
+        migrations.AddConstraint(
+            model_name='dailyload',
+            constraint=models.UniqueConstraint(condition=models.Q(('crew__isnull', False)), fields=('date', 'crew'), name='daily_load_unique_crew_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyload',
+            constraint=models.UniqueConstraint(condition=models.Q(('crew__isnull', True)), fields=('date',), name='daily_load_unique_unassigned_date'),
+        ),
+        migrations.RunPython(split_by_crew, migrations.RunPython.noop),
+    ]
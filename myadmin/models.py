@@ -1,10 +1,21 @@
+from django.conf import settings
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from decimal import Decimal
+import time
 
+from .audit import AuditedQuerySet, AuditSnapshotMixin
+from .dedupe import blocking_keys
+from . import metrics, pricing_rules
+from .franchises import franchise_choices
+from .fields import CENTS, MILLICENTS, MoneyField, from_minor_units, to_minor_units
+from .scheduling import estimate_minutes
 
-class ServicePricing(models.Model):
+
+class ServicePricing(AuditSnapshotMixin, models.Model):
     """
     Model to store pricing configuration for all services
     """
@@ -12,55 +23,55 @@ class ServicePricing(models.Model):
     description = models.TextField(blank=True)
 
     # House square footage pricing
-    house_sqft_price = models.DecimalField(
-        max_digits=5,
-        decimal_places=2,
+    house_sqft_price = MoneyField(
+        max_digits=8,
+        decimal_places=MILLICENTS,
         default=Decimal('0.50'),
         verbose_name="House Price per Square Foot"
     )
 
     # Driveway pricing
-    driveway_sqft_price = models.DecimalField(
-        max_digits=5,
-        decimal_places=2,
+    driveway_sqft_price = MoneyField(
+        max_digits=8,
+        decimal_places=MILLICENTS,
         default=Decimal('0.70'),
         verbose_name="Driveway Price per Square Foot"
     )
-    driveway_car_price = models.DecimalField(
+    driveway_car_price = MoneyField(
         max_digits=6,
-        decimal_places=2,
+        decimal_places=CENTS,
         default=Decimal('50.00'),
         verbose_name="Driveway Price per Car"
     )
 
     # Patio/Deck pricing
-    patio_deck_sqft_price = models.DecimalField(
-        max_digits=5,
-        decimal_places=2,
+    patio_deck_sqft_price = MoneyField(
+        max_digits=8,
+        decimal_places=MILLICENTS,
         default=Decimal('0.80'),
         verbose_name="Patio/Deck Price per Square Foot"
     )
 
     # Roof cleaning pricing
-    roof_cleaning_sqft_price = models.DecimalField(
-        max_digits=5,
-        decimal_places=2,
+    roof_cleaning_sqft_price = MoneyField(
+        max_digits=8,
+        decimal_places=MILLICENTS,
         default=Decimal('0.60'),
         verbose_name="Roof Cleaning Price per Square Foot"
     )
 
     # Gutter cleaning pricing
-    gutter_cleaning_flat_price = models.DecimalField(
+    gutter_cleaning_flat_price = MoneyField(
         max_digits=6,
-        decimal_places=2,
+        decimal_places=CENTS,
         default=Decimal('75.00'),
         verbose_name="Gutter Cleaning Flat Price"
     )
 
     # Distance pricing
-    distance_price_per_km = models.DecimalField(
+    distance_price_per_km = MoneyField(
         max_digits=5,
-        decimal_places=2,
+        decimal_places=CENTS,
         default=Decimal('2.00'),
         verbose_name="Price per Kilometer"
     )
@@ -70,15 +81,96 @@ class ServicePricing(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    objects = AuditedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Service Pricing"
         verbose_name_plural = "Service Pricing"
 
+    RATE_FIELDS = (
+        'house_sqft_price',
+        'driveway_sqft_price',
+        'driveway_car_price',
+        'patio_deck_sqft_price',
+        'roof_cleaning_sqft_price',
+        'gutter_cleaning_flat_price',
+        'distance_price_per_km',
+    )
+
     def __str__(self):
         return f"{self.name} - {'Active' if self.is_active else 'Inactive'}"
 
+    def rates_in_millicents(self):
+        """Every rate as an integer number of milli-cents"""
+        return {field: to_minor_units(getattr(self, field), MILLICENTS) for field in self.RATE_FIELDS}
+
 
-class Customer(models.Model):
+class PricingRule(models.Model):
+    """
+    Model to store a pricing rule applied on top of a ServicePricing's rates
+    """
+    KIND_CHOICES = [
+        ('volume_discount', 'Volume discount'),
+        ('distance_zone', 'Distance zone'),
+        ('bundle_discount', 'Gutter + roof bundle discount'),
+        ('minimum_charge', 'Minimum job charge'),
+    ]
+
+    pricing = models.ForeignKey(
+        ServicePricing,
+        on_delete=models.CASCADE,
+        related_name='rules'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    threshold = models.PositiveIntegerField(
+        default=0,
+        help_text="Volume discount: minimum total sq.ft. Distance zone: up to this many km."
+    )
+    percent_off = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        validators=[MinValueValidator(Decimal('0')), MaxValueValidator(Decimal('100'))],
+        verbose_name="Percent Off",
+        help_text="Volume and bundle discounts."
+    )
+    amount = MoneyField(
+        max_digits=8,
+        default=Decimal('0.00'),
+        help_text="Distance zone: flat travel charge. Minimum charge: lowest job total."
+    )
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Pricing Rule"
+        verbose_name_plural = "Pricing Rules"
+        ordering = ['pricing', 'kind', 'threshold']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} ({self.pricing.name})"
+
+    def clean(self):
+        if self.kind in ('volume_discount', 'bundle_discount') and not self.percent_off:
+            raise ValidationError({'percent_off': "Discount rules need a percentage."})
+        if self.kind == 'distance_zone' and not self.threshold:
+            raise ValidationError({'threshold': "Distance zones need a maximum distance in km."})
+        if self.kind == 'minimum_charge' and not self.amount:
+            raise ValidationError({'amount': "Minimum charge rules need an amount."})
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # A new pricing version: recompiles the rules and changes the calculator's ETag
+        self.pricing.save(update_fields=['updated_at'])
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.pricing.save(update_fields=['updated_at'])
+        return result
+
+
+class Customer(AuditSnapshotMixin, models.Model):
     """
     Model to store customer information
     """
@@ -93,7 +185,16 @@ class Customer(models.Model):
     zip_code = models.CharField(max_length=20, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Normalized blocking keys for duplicate detection, maintained on save
+    phone_key = models.CharField(max_length=20, blank=True, db_index=True, editable=False)
+    email_key = models.CharField(max_length=254, blank=True, db_index=True, editable=False)
+    # Both address lines (255 + ' ' + 255), '|' and the zip (20): normalizing never lengthens them
+    address_key = models.CharField(max_length=532, blank=True, db_index=True, editable=False)
+    name_key = models.CharField(max_length=8, blank=True, db_index=True, editable=False)
+
+    objects = AuditedQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Customer"
@@ -103,6 +204,15 @@ class Customer(models.Model):
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def save(self, *args, **kwargs):
+        # Keep the duplicate detection keys in sync with the contact details
+        for field, value in blocking_keys(self).items():
+            setattr(self, field, value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'phone_key', 'email_key', 'address_key', 'name_key'}
+        super().save(*args, **kwargs)
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
@@ -116,7 +226,30 @@ class Customer(models.Model):
         return address
 
 
-class Quote(models.Model):
+class Crew(models.Model):
+    """
+    Model to store a work crew and how much work it can take on per day
+    """
+    name = models.CharField(max_length=100, unique=True)
+    daily_capacity_minutes = models.PositiveIntegerField(
+        default=480,
+        verbose_name="Daily Capacity (minutes)"
+    )
+    works_weekends = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Crew"
+        verbose_name_plural = "Crews"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class Quote(AuditSnapshotMixin, models.Model):
     """
     Model to store quotes created for customers
     """
@@ -140,7 +273,14 @@ class Quote(models.Model):
     # Quote details
     quote_number = models.CharField(max_length=50, unique=True)
     quote_date = models.DateField(default=timezone.now)
-    work_date = models.DateField(null=True, blank=True)
+    work_date = models.DateField(null=True, blank=True, db_index=True)
+    crew = models.ForeignKey(
+        Crew,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='quotes'
+    )
     is_completed = models.BooleanField(default=False)
 
     # Service areas and measurements
@@ -184,17 +324,26 @@ class Quote(models.Model):
         verbose_name="Distance to Job (km)"
     )
 
+    # Scheduling
+    estimated_minutes = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Estimated Duration (minutes)"
+    )
+
     # Quote totals
-    total_amount = models.DecimalField(
+    total_amount = MoneyField(
         max_digits=10,
-        decimal_places=2,
+        decimal_places=CENTS,
         verbose_name="Total Quote Amount"
     )
 
     # Other quote info
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = AuditedQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Quote"
@@ -204,37 +353,138 @@ class Quote(models.Model):
     def __str__(self):
         return f"Quote #{self.quote_number} - {self.customer.full_name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored work date and crew so the day and crew it moves away from can be updated
+        instance._loaded_work_date = instance.__dict__.get('work_date')
+        instance._loaded_crew_id = instance.__dict__.get('crew_id')
+        return instance
+
     def save(self, *args, **kwargs):
         # Calculate the total amount before saving
         if not self.total_amount:
             self.calculate_total()
+        self.estimated_minutes = estimate_minutes(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'estimated_minutes'}
         super().save(*args, **kwargs)
 
     def calculate_total(self):
-        """Calculate the total amount based on service selections and pricing"""
-        total = Decimal('0.00')
+        """Calculate the total amount based on service selections, pricing and its rules"""
+        started = time.perf_counter()
+        # Exact integer arithmetic in milli-cents, rounded to cents at the end
+        cents = pricing_rules.evaluator_for(self.pricing).quote_total(self)
+        self.total_amount = from_minor_units(cents, CENTS)
+        metrics.CALCULATE_TOTAL_SECONDS.observe(time.perf_counter() - started)
+        return self.total_amount
 
-        # House
-        total += Decimal(str(self.house_sqft)) * self.pricing.house_sqft_price
 
-        # Driveway
-        if self.driveway_calculation_type == 'sqft':
-            total += Decimal(str(self.driveway_sqft)) * self.pricing.driveway_sqft_price
-        else:  # 'cars'
-            total += Decimal(str(self.driveway_cars)) * self.pricing.driveway_car_price
+class DailyLoad(models.Model):
+    """
+    Booked work per day and crew, maintained from Quote saves and deletes
+    """
+    date = models.DateField(db_index=True)
+    # Null for the jobs without a crew
+    crew = models.ForeignKey(Crew, on_delete=models.CASCADE, null=True, blank=True, related_name='daily_loads')
+    job_count = models.PositiveIntegerField(default=0)
+    booked_minutes = models.PositiveIntegerField(default=0)
 
-        # Patio/Deck
-        total += Decimal(str(self.patio_deck_sqft)) * self.pricing.patio_deck_sqft_price
+    class Meta:
+        verbose_name = "Daily Load"
+        verbose_name_plural = "Daily Loads"
+        ordering = ['date', 'crew']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'crew'], condition=models.Q(crew__isnull=False), name='daily_load_unique_crew_date'
+            ),
+            models.UniqueConstraint(
+                fields=['date'], condition=models.Q(crew__isnull=True), name='daily_load_unique_unassigned_date'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} ({self.crew or 'no crew'}): {self.job_count} jobs, {self.booked_minutes} min"
 
-        # Roof Cleaning
-        total += Decimal(str(self.roof_cleaning_sqft)) * self.pricing.roof_cleaning_sqft_price
 
-        # Gutter Cleaning
-        if self.gutter_cleaning:
-            total += self.pricing.gutter_cleaning_flat_price
+class QuoteTombstone(models.Model):
+    """
+    A scheduled quote that left a crew's schedule (deleted, unscheduled, moved
+    to another crew or into the past), kept a while so that crew's schedule
+    feed devices drop it
+    """
+    quote_id = models.BigIntegerField()
+    crew_id = models.BigIntegerField(null=True, blank=True)
+    work_date = models.DateField()
+    deleted_at = models.DateTimeField(db_index=True)
 
-        # Distance
-        total += Decimal(str(self.distance_km)) * self.pricing.distance_price_per_km
+    class Meta:
+        verbose_name = "Quote Tombstone"
+        verbose_name_plural = "Quote Tombstones"
 
-        self.total_amount = total
-        return total
\ No newline at end of file
+    def __str__(self):
+        return f"Quote {self.quote_id} removed {self.deleted_at}"
+
+
+class AuditEntry(models.Model):
+    """
+    Append-only record of field changes to pricing, customers and quotes
+    """
+    ACTION_CHOICES = [
+        ('c', 'Created'),
+        ('u', 'Updated'),
+        ('b', 'Bulk updated'),
+        ('d', 'Deleted'),
+    ]
+
+    timestamp = models.DateTimeField()
+    model = models.CharField(max_length=40)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=1, choices=ACTION_CHOICES)
+    # Plain id rather than a foreign key, so entries outlive the user
+    user_id = models.IntegerField(null=True, blank=True)
+    changes = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        verbose_name = "Audit Entry"
+        verbose_name_plural = "Audit Entries"
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['model', 'object_id', 'timestamp'], name='auditentry_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} {self.get_action_display()} at {self.timestamp}"
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Audit entries are append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Audit entries are append-only")
+
+
+class StaffProfile(models.Model):
+    """
+    Model to store which franchise a staff user works for (kept in the default database with the users)
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='staff_profile'
+    )
+    franchise = models.CharField(
+        max_length=50,
+        blank=True,
+        choices=franchise_choices,
+        help_text="Leave blank for head office staff, who also see the cross-franchise report."
+    )
+
+    class Meta:
+        verbose_name = "Staff Profile"
+        verbose_name_plural = "Staff Profiles"
+
+    def __str__(self):
+        return f"{self.user} ({self.get_franchise_display() or 'Head Office'})"
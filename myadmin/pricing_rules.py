@@ -0,0 +1,302 @@
+"""
+Pricing rules engine.
+
+A ServicePricing and its active PricingRules are reduced to a plan of
+integer constants, and the plan is compiled into a Python function with
+those constants inlined and the branches for absent rule kinds left out.
+Compiled evaluators are cached per pricing version (database, id and
+updated_at, which saving a rule bumps), so quotes, bulk repricing and the calculator
+endpoint all share one compile.
+
+Evaluation order, all in integer milli-cents:
+
+1. Services: house, driveway (sq.ft. or cars), patio/deck, roof, gutters
+2. Bundle discount: percentage off roof + gutters when both are booked
+3. Volume discount: percentage off the services for the highest tier whose
+   minimum total sq.ft. is reached
+4. Travel: flat charge of the first distance zone covering the distance,
+   else the per-km rate
+5. Minimum job charge
+6. Rounded half up to cents
+
+``evaluate_reference`` implements the same rules directly on the models with
+Decimal arithmetic. It is the specification the compiled code is tested against.
+The calculator page evaluates the plan from pricing.json with
+``myadmin/js/pricing-plan.js``, which must follow the same steps, and offers
+it to the calculator bundle as ``window.pricingRules``.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import audit, metrics
+from .fields import CENTS, MILLICENTS, from_minor_units, rescale, to_minor_units
+
+# Quote columns passed to an evaluator, in argument order
+QUOTE_COLUMNS = (
+    'house_sqft',
+    'driveway_calculation_type',
+    'driveway_sqft',
+    'driveway_cars',
+    'patio_deck_sqft',
+    'roof_cleaning_sqft',
+    'gutter_cleaning',
+    'distance_km',
+)
+
+# Compiled evaluators kept per (database, pricing id, updated_at)
+CACHE_SIZE = 32
+
+_cache = {}
+# Request threads evict and insert concurrently
+_cache_lock = threading.Lock()
+
+
+def _basis_points(percent):
+    return int(Decimal(percent).scaleb(2).to_integral_value(ROUND_HALF_UP))
+
+
+def build_plan(pricing, rules):
+    """Reduce a pricing and its active rules to integer constants"""
+    volume = {}
+    zones = {}
+    bundle = 0
+    minimum = 0
+    for rule in rules:
+        if not rule.is_active:
+            continue
+        if rule.kind == 'volume_discount':
+            volume[rule.threshold] = max(volume.get(rule.threshold, 0), _basis_points(rule.percent_off))
+        elif rule.kind == 'distance_zone':
+            charge = to_minor_units(rule.amount, MILLICENTS)
+            zones[rule.threshold] = min(zones.get(rule.threshold, charge), charge)
+        elif rule.kind == 'bundle_discount':
+            bundle = max(bundle, _basis_points(rule.percent_off))
+        elif rule.kind == 'minimum_charge':
+            minimum = max(minimum, to_minor_units(rule.amount, MILLICENTS))
+
+    return {
+        'rates': pricing.rates_in_millicents(),
+        'volumeTiers': sorted(volume.items()),
+        'distanceZones': sorted(zones.items()),
+        'bundleBasisPoints': bundle,
+        'minimum': minimum,
+    }
+
+
+def generate_source(plan):
+    """Python source of ``evaluate(*QUOTE_COLUMNS) -> cents`` for a plan"""
+    rates = plan['rates']
+    lines = [
+        f"def evaluate({', '.join(QUOTE_COLUMNS)}):",
+        f"    roof = roof_cleaning_sqft * {rates['roof_cleaning_sqft_price']}",
+        "    if gutter_cleaning:",
+        f"        roof += {rates['gutter_cleaning_flat_price']}",
+    ]
+    if plan['bundleBasisPoints']:
+        lines += [
+            "    if gutter_cleaning and roof_cleaning_sqft:",
+            f"        roof -= (roof * {plan['bundleBasisPoints']} + 5000) // 10000",
+        ]
+    lines += [
+        f"    services = house_sqft * {rates['house_sqft_price']} + patio_deck_sqft * {rates['patio_deck_sqft_price']} + roof",
+        "    if driveway_calculation_type == 'sqft':",
+        f"        services += driveway_sqft * {rates['driveway_sqft_price']}",
+        "    else:",
+        f"        services += driveway_cars * {rates['driveway_car_price']}",
+    ]
+    if plan['volumeTiers']:
+        thresholds = tuple(threshold for threshold, _ in plan['volumeTiers'])
+        basis_points = (0,) + tuple(bp for _, bp in plan['volumeTiers'])
+        lines += [
+            "    sqft = house_sqft + patio_deck_sqft + roof_cleaning_sqft",
+            "    if driveway_calculation_type == 'sqft':",
+            "        sqft += driveway_sqft",
+            f"    bp = {basis_points!r}[bisect_right({thresholds!r}, sqft)]",
+            "    if bp:",
+            "        services -= (services * bp + 5000) // 10000",
+        ]
+    if plan['distanceZones']:
+        limits = tuple(limit for limit, _ in plan['distanceZones'])
+        charges = tuple(charge for _, charge in plan['distanceZones'])
+        lines += [
+            "    if not distance_km:",
+            "        travel = 0",
+            "    else:",
+            f"        zone = bisect_left({limits!r}, distance_km)",
+            f"        travel = {charges!r}[zone] if zone < {len(limits)} else distance_km * {rates['distance_price_per_km']}",
+        ]
+    else:
+        lines.append(f"    travel = distance_km * {rates['distance_price_per_km']}")
+    lines.append("    total = services + travel")
+    if plan['minimum']:
+        lines += [
+            f"    if total < {plan['minimum']}:",
+            f"        total = {plan['minimum']}",
+        ]
+    lines.append("    return (total + 500) // 1000")
+    return '\n'.join(lines) + '\n'
+
+
+class CompiledRules:
+    """A compiled evaluator for one pricing version"""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.source = generate_source(plan)
+        namespace = {'bisect_left': bisect_left, 'bisect_right': bisect_right}
+        exec(compile(self.source, '<pricing rules>', 'exec'), namespace)
+        self.evaluate = namespace['evaluate']
+
+    def quote_total(self, quote):
+        """Total in cents for a Quote instance"""
+        return self.evaluate(*(getattr(quote, column) for column in QUOTE_COLUMNS))
+
+    def totals(self, rows):
+        """Totals in cents for an iterable of ``QUOTE_COLUMNS`` tuples"""
+        evaluate = self.evaluate
+        return [evaluate(*row) for row in rows]
+
+
+def _rules_of(pricing):
+    if pricing.pk is None:
+        return []
+    return list(pricing.rules.filter(is_active=True))
+
+
+def evaluator_for(pricing):
+    """The cached compiled evaluator for the current version of ``pricing``"""
+    key = (pricing._state.db, pricing.pk, pricing.updated_at)
+    compiled = _cache.get(key) if pricing.pk is not None else None
+    if compiled is not None:
+        metrics.PRICING_CACHE_HITS.inc()
+    else:
+        metrics.PRICING_CACHE_MISSES.inc()
+        compiled = CompiledRules(build_plan(pricing, _rules_of(pricing)))
+        if pricing.pk is not None:
+            with _cache_lock:
+                while len(_cache) >= CACHE_SIZE:
+                    _cache.pop(next(iter(_cache)))
+                _cache[key] = compiled
+    return compiled
+
+
+def evaluate_reference(pricing, rules, quote):
+    """
+    Straightforward Decimal interpretation of the rules, in dollars.
+
+    Slow; used to check the compiled evaluator.
+    """
+    step = Decimal(1).scaleb(-MILLICENTS)
+    active = [rule for rule in rules if rule.is_active]
+
+    def percent_of(amount, percent):
+        return (amount * Decimal(percent) / 100).quantize(step, ROUND_HALF_UP)
+
+    roof = quote.roof_cleaning_sqft * pricing.roof_cleaning_sqft_price
+    if quote.gutter_cleaning:
+        roof += pricing.gutter_cleaning_flat_price
+    if quote.gutter_cleaning and quote.roof_cleaning_sqft:
+        bundles = [rule.percent_off for rule in active if rule.kind == 'bundle_discount']
+        if bundles:
+            roof -= percent_of(roof, max(bundles))
+
+    services = quote.house_sqft * pricing.house_sqft_price + quote.patio_deck_sqft * pricing.patio_deck_sqft_price + roof
+    sqft = quote.house_sqft + quote.patio_deck_sqft + quote.roof_cleaning_sqft
+    if quote.driveway_calculation_type == 'sqft':
+        services += quote.driveway_sqft * pricing.driveway_sqft_price
+        sqft += quote.driveway_sqft
+    else:
+        services += quote.driveway_cars * pricing.driveway_car_price
+
+    tiers = [rule for rule in active if rule.kind == 'volume_discount' and rule.threshold <= sqft]
+    if tiers:
+        best = max(rule.threshold for rule in tiers)
+        services -= percent_of(services, max(rule.percent_off for rule in tiers if rule.threshold == best))
+
+    travel = quote.distance_km * pricing.distance_price_per_km
+    if quote.distance_km:
+        zones = [rule for rule in active if rule.kind == 'distance_zone' and rule.threshold >= quote.distance_km]
+        if zones:
+            nearest = min(rule.threshold for rule in zones)
+            travel = min(rule.amount for rule in zones if rule.threshold == nearest)
+    else:
+        travel = Decimal('0')
+
+    total = services + travel
+    minimums = [rule.amount for rule in active if rule.kind == 'minimum_charge']
+    if minimums and total < max(minimums):
+        total = max(minimums)
+    return total.quantize(Decimal(1).scaleb(-CENTS), ROUND_HALF_UP)
+
+
+def describe(plan):
+    """Human-readable summary of a plan's rules, for the calculator page"""
+    def dollars(millicents):
+        return f"${rescale(millicents, MILLICENTS, CENTS) / 100:,.2f}"
+
+    lines = []
+    if plan['bundleBasisPoints']:
+        lines.append(f"{plan['bundleBasisPoints'] / 100:g}% off roof and gutter cleaning booked together")
+    for threshold, basis_points in plan['volumeTiers']:
+        lines.append(f"{basis_points / 100:g}% off services from {threshold:,} sq.ft.")
+    for limit, charge in plan['distanceZones']:
+        lines.append(f"{dollars(charge)} travel up to {limit} km")
+    if plan['minimum']:
+        lines.append(f"Minimum job charge {dollars(plan['minimum'])}")
+    return lines
+
+
+def _write_totals(model, rows, using, now):
+    """Write ``[(total in cents, pk)]`` with one prepared UPDATE, bumping ``updated_at``"""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    total = model._meta.get_field('total_amount')
+    updated_at = model._meta.get_field('updated_at')
+    sql = (
+        f"UPDATE {qn(model._meta.db_table)} SET {qn(total.column)} = %s, {qn(updated_at.column)} = %s "
+        f"WHERE {qn(model._meta.pk.column)} = %s"
+    )
+    stamp = updated_at.get_db_prep_value(now, connection)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(cents, stamp, pk) for cents, pk in rows])
+
+
+def reprice(queryset, batch_size=5000):
+    """
+    Recompute ``total_amount`` of the quotes in ``queryset`` with each quote's
+    pricing rules, writing only totals that changed. Returns that count.
+    """
+    from .models import ServicePricing
+
+    using = queryset.db
+    model = queryset.model
+    pricing_ids = set(queryset.order_by().values_list('pricing_id', flat=True).distinct())
+    evaluators = {
+        pk: evaluator_for(pricing).evaluate
+        for pk, pricing in ServicePricing.objects.using(using).in_bulk(pricing_ids).items()
+    }
+
+    updated = 0
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        changed, before, after = [], {}, {}
+        rows = queryset.order_by('pk').values_list('pk', 'pricing_id', 'total_amount', *QUOTE_COLUMNS)
+        for pk, pricing_id, old, *columns in rows.iterator(chunk_size=batch_size):
+            cents = evaluators[pricing_id](*columns)
+            if to_minor_units(old, CENTS) != cents:
+                changed.append((cents, pk))
+                before[pk] = {'total_amount': old}
+                after[pk] = {'total_amount': from_minor_units(cents, CENTS)}
+            if len(changed) >= batch_size:
+                _write_totals(model, changed, using, now)
+                updated += len(changed)
+                changed = []
+        if changed:
+            _write_totals(model, changed, using, now)
+            updated += len(changed)
+        audit.record_bulk(model, before, after, using)
+    return updated
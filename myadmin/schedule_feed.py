@@ -0,0 +1,264 @@
+"""
+Schedule feed for crew devices, as JSON or iCalendar.
+
+A device polls its crew's feed URL (a signed token, see ``device_token``).
+Without a sync token the response is every scheduled job from today on,
+streamed; it carries a token, and a poll with that token returns only the
+jobs changed since, plus the ids of jobs to drop: deleted, unscheduled,
+moved to another crew or into the past.
+
+The cursor is an ``updated_at`` timestamp of quotes and customers (an
+address change updates the customer's jobs). A scheduled quote leaving its
+crew's schedule leaves a ``QuoteTombstone`` with that crew and day for
+``TOMBSTONE_DAYS``; older tokens get a full sync. Both the changes and the
+removals are read for the feed's crew and window only. Every response has an
+ETag over the same rows, so an unchanged feed costs two MAX() lookups and a
+304.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+from .franchises import aliases, name_of
+
+# A write commits within the SQLite lock timeout (20 s) of stamping updated_at,
+# so the next poll re-reads this much before the previous one to not miss it
+SETTLE = timedelta(seconds=30)
+TOMBSTONE_DAYS = 30
+# Jobs per database fetch and per streamed chunk of a full sync
+STREAM_CHUNK_SIZE = 500
+
+DEVICE_SALT = 'myadmin.schedule_feed.device'
+SYNC_SALT = 'myadmin.schedule_feed.sync'
+
+# (field, name, unit) of the measured services
+MEASURED_SERVICES = [
+    ('house_sqft', "House wash", 'sqft'),
+    ('patio_deck_sqft', "Patio/deck", 'sqft'),
+    ('roof_cleaning_sqft', "Roof cleaning", 'sqft'),
+]
+
+
+def device_token(crew):
+    """URL token of a crew's feed; deactivating the crew revokes it"""
+    return signing.dumps({'f': crew._state.db, 'c': crew.pk}, salt=DEVICE_SALT)
+
+
+def crew_for_device(token):
+    """The active crew of a device token, or None"""
+    from .models import Crew
+
+    try:
+        data = signing.loads(token, salt=DEVICE_SALT)
+    except signing.BadSignature:
+        return None
+    if data.get('f') not in aliases():
+        return None
+    return Crew.objects.using(data['f']).filter(pk=data.get('c'), is_active=True).first()
+
+
+def services(quote):
+    items = []
+    if quote.driveway_calculation_type == 'cars':
+        if quote.driveway_cars:
+            items.append({'name': "Driveway", 'quantity': quote.driveway_cars, 'unit': 'cars'})
+    elif quote.driveway_sqft:
+        items.append({'name': "Driveway", 'quantity': quote.driveway_sqft, 'unit': 'sqft'})
+    for field, name, unit in MEASURED_SERVICES:
+        if getattr(quote, field):
+            items.append({'name': name, 'quantity': getattr(quote, field), 'unit': unit})
+    if quote.gutter_cleaning:
+        items.append({'name': "Gutter cleaning", 'quantity': 1, 'unit': 'job'})
+    return items
+
+
+def job(quote):
+    customer = quote.customer
+    return {
+        'id': quote.pk,
+        'quoteNumber': quote.quote_number,
+        'workDate': quote.work_date,
+        'crew': quote.crew.name if quote.crew_id else None,
+        'customer': {'name': customer.full_name, 'phone': customer.phone_number, 'email': customer.email},
+        'address': customer.full_address,
+        'services': services(quote),
+        'distanceKm': quote.distance_km,
+        'estimatedMinutes': quote.estimated_minutes,
+        'total': quote.total_amount,
+        'isCompleted': quote.is_completed,
+        'notes': quote.notes,
+        'updatedAt': max(quote.updated_at, customer.updated_at),
+    }
+
+
+def record_removed(rows, using):
+    """
+    Leave tombstones for ``[(quote pk, crew pk, work date)]`` that left the
+    schedule of that crew and day, and prune expired ones
+    """
+    from .models import QuoteTombstone
+
+    now = timezone.now()
+    QuoteTombstone.objects.using(using).bulk_create([
+        QuoteTombstone(quote_id=pk, crew_id=crew_id, work_date=work_date, deleted_at=now)
+        for pk, crew_id, work_date in rows
+        if work_date
+    ])
+    QuoteTombstone.objects.using(using).filter(deleted_at__lt=now - timedelta(days=TOMBSTONE_DAYS)).delete()
+
+
+def quote_saved(sender, instance, raw=False, using=None, **kwargs):
+    """post_save: devices of the crew the job was on must drop it if it left them or moved into the past"""
+    work_date = getattr(instance, '_loaded_work_date', None)
+    crew_id = getattr(instance, '_loaded_crew_id', None)
+    instance._loaded_crew_id = instance.crew_id
+    if raw or work_date is None:
+        # New or unscheduled until now: no device had the job
+        return
+    new_date = instance._meta.get_field('work_date').to_python(instance.work_date)
+    left = (
+        instance.crew_id != crew_id
+        or new_date is None
+        or new_date < timezone.localdate() <= work_date
+    )
+    if left:
+        record_removed([(instance.pk, crew_id, work_date)], using)
+
+
+def quote_deleted(sender, instance, using=None, **kwargs):
+    """post_delete: devices holding this job must drop it"""
+    record_removed([(instance.pk, instance.crew_id, instance.work_date)], using)
+
+
+class Feed:
+    """The jobs of one crew (or all crews) in one database from ``start`` on"""
+
+    def __init__(self, using, crew=None, start=None):
+        self.using = using
+        self.crew = crew
+        self.now = timezone.now()
+        self.start = start or timezone.localdate(self.now)
+        self.scope = f'{using}:{crew.pk if crew else "*"}:{self.start.isoformat()}'
+
+    def quotes(self):
+        from .models import Quote
+
+        quotes = Quote.objects.using(self.using).select_related('customer', 'crew')
+        return quotes.filter(crew=self.crew) if self.crew else quotes
+
+    def scheduled(self):
+        return self.quotes().filter(work_date__gte=self.start).order_by('work_date', 'pk')
+
+    def tombstones(self):
+        """Jobs that left this feed's crew on a day in the window"""
+        from .models import QuoteTombstone
+
+        tombstones = QuoteTombstone.objects.using(self.using).filter(work_date__gte=self.start)
+        return tombstones.filter(crew_id=self.crew.pk) if self.crew else tombstones
+
+    def sync_token(self):
+        cursor = self.now - SETTLE
+        return signing.dumps({'s': self.scope, 't': int(cursor.timestamp() * 1_000_000)}, salt=SYNC_SALT)
+
+    def cursor(self, token):
+        """Timestamp of a sync token for this feed, or None if it's invalid, for another feed or too old"""
+        try:
+            data = signing.loads(token, salt=SYNC_SALT)
+        except signing.BadSignature:
+            return None
+        if data.get('s') != self.scope:
+            return None
+        cursor = datetime.fromtimestamp(data['t'] / 1_000_000, tz=dt_timezone.utc)
+        if cursor < self.now - timedelta(days=TOMBSTONE_DAYS):
+            return None
+        return cursor
+
+    def etag(self, variant):
+        latest = [
+            *self.scheduled().order_by().aggregate(Max('updated_at'), Max('customer__updated_at')).values(),
+            self.tombstones().aggregate(latest=Max('deleted_at'))['latest'],
+        ]
+        key = f'{variant}|{self.scope}|' + '|'.join(str(value) for value in latest)
+        return quote_etag(hashlib.sha256(key.encode()).hexdigest()[:32])
+
+    def changes(self, cursor):
+        """Jobs changed since ``cursor`` and the ids of jobs that left the feed since"""
+        changed = self.scheduled().filter(Q(updated_at__gt=cursor) | Q(customer__updated_at__gt=cursor))
+        jobs = [job(quote) for quote in changed]
+        removed = set(self.tombstones().filter(deleted_at__gt=cursor).values_list('quote_id', flat=True))
+        # Moved away and back, or to another day of the window: it's in the jobs
+        return jobs, sorted(removed - {data['id'] for data in jobs})
+
+    def full_json(self):
+        """Chunks of the JSON document of every scheduled job, fetched and encoded a few hundred at a time"""
+        yield '{"full": true, "syncToken": %s, "removed": [], "jobs": [' % json.dumps(self.sync_token())
+        separator = ''
+        chunk = []
+        for quote in self.scheduled().iterator(chunk_size=STREAM_CHUNK_SIZE):
+            chunk.append(json.dumps(job(quote), cls=DjangoJSONEncoder))
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield separator + ','.join(chunk)
+                separator, chunk = ',', []
+        if chunk:
+            yield separator + ','.join(chunk)
+        yield ']}'
+
+    def delta_json(self, cursor):
+        jobs, removed = self.changes(cursor)
+        return json.dumps(
+            {'full': False, 'syncToken': self.sync_token(), 'removed': removed, 'jobs': jobs},
+            cls=DjangoJSONEncoder,
+        )
+
+    def ics(self, host):
+        """Lines of an iCalendar document with one all-day event per scheduled job"""
+        stamp = self.now.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        name = f'{self.crew.name} schedule' if self.crew else f'{name_of(self.using)} schedule'
+        yield from ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Capital Power Washer//Schedule Feed//EN']
+        yield from ['CALSCALE:GREGORIAN', 'METHOD:PUBLISH', _ics_line('X-WR-CALNAME', name)]
+        for quote in self.scheduled().iterator(chunk_size=STREAM_CHUNK_SIZE):
+            data = job(quote)
+            description = [
+                *(
+                    item['name'] if item['unit'] == 'job' else f"{item['name']}: {item['quantity']:,} {item['unit']}"
+                    for item in data['services']
+                ),
+                f"Total: ${data['total']:,}",
+                f"Estimated time: {data['estimatedMinutes']} min",
+                f"Phone: {data['customer']['phone']}" if data['customer']['phone'] else '',
+                data['notes'],
+            ]
+            yield 'BEGIN:VEVENT'
+            yield f'UID:quote-{quote.pk}-{self.using}@{host}'
+            yield f'DTSTAMP:{stamp}'
+            yield f"LAST-MODIFIED:{data['updatedAt'].astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+            yield f"DTSTART;VALUE=DATE:{quote.work_date.strftime('%Y%m%d')}"
+            yield f"DTEND;VALUE=DATE:{(quote.work_date + timedelta(days=1)).strftime('%Y%m%d')}"
+            yield _ics_line('SUMMARY', f"{data['customer']['name']} (#{quote.quote_number})")
+            yield _ics_line('LOCATION', data['address'])
+            yield _ics_line('DESCRIPTION', '\n'.join(line for line in description if line))
+            yield 'STATUS:CONFIRMED'
+            yield 'END:VEVENT'
+        yield 'END:VCALENDAR'
+
+
+def _ics_line(name, text):
+    """A property with its text escaped and folded at 75 octets (RFC 5545)"""
+    escaped = text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+    line = f'{name}:{escaped}'.encode()
+    parts = []
+    while len(line) > 75:
+        cut = 75 if not parts else 74
+        # Don't split a UTF-8 sequence
+        while cut and (line[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(line[:cut])
+        line = line[cut:]
+    parts.append(line)
+    return '\r\n '.join(part.decode() for part in parts)
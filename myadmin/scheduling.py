@@ -0,0 +1,280 @@
+"""
+Crew capacity scheduling.
+
+Each quote gets an estimated duration from its measurements. Booked minutes
+per work day and crew are kept in the ``DailyLoad`` table, refreshed for just
+the affected days whenever a quote is saved or deleted, so capacity checks and
+the earliest-slot search read a handful of indexed rows instead of
+aggregating every quote. Each crew's load is checked against its own
+capacity; jobs without a crew only count against the combined capacity.
+"""
+import calendar
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import router, transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, IntegerField, Q, Sum, Value, When
+
+# Minutes of work per 100 sq.ft. of each measured service
+MINUTES_PER_100_SQFT = {
+    'house_sqft': 6,
+    'driveway_sqft': 4,
+    'patio_deck_sqft': 5,
+    'roof_cleaning_sqft': 10,
+}
+MINUTES_PER_CAR = 20
+GUTTER_CLEANING_MINUTES = 60
+SETUP_MINUTES = 30
+# Round trip to the job site
+TRAVEL_MINUTES_PER_KM = 2
+
+# How far ahead the earliest-slot search looks, and how many days it reads per query
+SLOT_SEARCH_DAYS = 365
+SLOT_SEARCH_WINDOW = 62
+
+
+def estimate_minutes(quote):
+    """Estimated crew time for a quote, including setup and travel"""
+    # Accumulate in hundredths of a minute so this matches estimate_expression() exactly
+    hundredths = SETUP_MINUTES * 100
+    hundredths += quote.house_sqft * MINUTES_PER_100_SQFT['house_sqft']
+    hundredths += quote.patio_deck_sqft * MINUTES_PER_100_SQFT['patio_deck_sqft']
+    hundredths += quote.roof_cleaning_sqft * MINUTES_PER_100_SQFT['roof_cleaning_sqft']
+    if quote.driveway_calculation_type == 'sqft':
+        hundredths += quote.driveway_sqft * MINUTES_PER_100_SQFT['driveway_sqft']
+    else:
+        hundredths += quote.driveway_cars * MINUTES_PER_CAR * 100
+    if quote.gutter_cleaning:
+        hundredths += GUTTER_CLEANING_MINUTES * 100
+    hundredths += quote.distance_km * TRAVEL_MINUTES_PER_KM * 100
+    return (hundredths + 50) // 100
+
+
+def estimate_expression():
+    """estimate_minutes() as a SQL expression, for queryset.update() on bulk paths"""
+    hundredths = (
+        Value(SETUP_MINUTES * 100)
+        + F('house_sqft') * MINUTES_PER_100_SQFT['house_sqft']
+        + F('patio_deck_sqft') * MINUTES_PER_100_SQFT['patio_deck_sqft']
+        + F('roof_cleaning_sqft') * MINUTES_PER_100_SQFT['roof_cleaning_sqft']
+        + Case(
+            When(driveway_calculation_type='sqft', then=F('driveway_sqft') * MINUTES_PER_100_SQFT['driveway_sqft']),
+            default=F('driveway_cars') * (MINUTES_PER_CAR * 100),
+        )
+        + Case(When(gutter_cleaning=True, then=Value(GUTTER_CLEANING_MINUTES * 100)), default=Value(0))
+        + F('distance_km') * (TRAVEL_MINUTES_PER_KM * 100)
+    )
+    return ExpressionWrapper((hundredths + 50) / 100, output_field=IntegerField())
+
+
+class Capacity:
+    """Daily capacity in minutes of each active crew"""
+
+    def __init__(self, crews):
+        # {crew pk: (daily capacity minutes, works weekends)}
+        self.crews = crews
+        self.weekday_minutes = sum(minutes for minutes, _ in crews.values())
+        self.weekend_minutes = sum(minutes for minutes, weekends in crews.values() if weekends)
+
+    @classmethod
+    def current(cls):
+        from .models import Crew
+
+        rows = Crew.objects.filter(is_active=True).values_list('pk', 'daily_capacity_minutes', 'works_weekends')
+        return cls({pk: (minutes, weekends) for pk, minutes, weekends in rows})
+
+    def for_date(self, day, crew_id=None):
+        """Minutes one crew, or all active crews together, can work on ``day``"""
+        if crew_id is None:
+            return self.weekend_minutes if day.weekday() >= 5 else self.weekday_minutes
+        # An inactive or deleted crew has no capacity, so any job left on it conflicts
+        minutes, weekends = self.crews.get(crew_id, (0, False))
+        return minutes if weekends or day.weekday() < 5 else 0
+
+    def conflicts(self, day, loads):
+        """Pks of the crews booked over capacity on ``day``; ``loads`` maps crew pk (None: no crew) to minutes"""
+        return [
+            crew_id for crew_id, minutes in loads.items()
+            if crew_id is not None and minutes > self.for_date(day, crew_id)
+        ]
+
+    def fits(self, day, loads, minutes, crew_id=None):
+        """Whether a job of ``minutes`` fits on ``day`` for a crew, or for any crew if ``crew_id`` is None"""
+        if crew_id is not None:
+            return loads.get(crew_id, 0) + minutes <= self.for_date(day, crew_id)
+        if sum(loads.values()) + minutes > self.for_date(day):
+            return False
+        return any(loads.get(pk, 0) + minutes <= self.for_date(day, pk) for pk in self.crews)
+
+
+def _load_rows(quotes):
+    return quotes.order_by().values('work_date', 'crew_id').annotate(jobs=Count('pk'), minutes=Sum('estimated_minutes'))
+
+
+def _daily_loads(rows):
+    from .models import DailyLoad
+
+    return [
+        DailyLoad(date=row['work_date'], crew_id=row['crew_id'], job_count=row['jobs'], booked_minutes=row['minutes'] or 0)
+        for row in rows
+    ]
+
+
+def refresh_daily_load(dates, using=None):
+    """Recompute the DailyLoad rows of every crew on ``dates`` from their quotes"""
+    from .models import DailyLoad, Quote
+
+    dates = {day for day in dates if day}
+    if not dates:
+        return
+
+    rows = _load_rows(Quote.objects.using(using).filter(work_date__in=dates))
+    loads = DailyLoad.objects.using(using)
+    with transaction.atomic(using=loads.db):
+        loads.filter(date__in=dates).delete()
+        loads.bulk_create(_daily_loads(rows))
+
+
+def rebuild_daily_load(start=None, end=None):
+    """Rebuild DailyLoad from scratch, optionally for a date range only"""
+    from .models import DailyLoad, Quote
+
+    using = router.db_for_write(DailyLoad)
+    quotes = Quote.objects.using(using).filter(work_date__isnull=False)
+    loads = DailyLoad.objects.using(using)
+    if start:
+        quotes = quotes.filter(work_date__gte=start)
+        loads = loads.filter(date__gte=start)
+    if end:
+        quotes = quotes.filter(work_date__lte=end)
+        loads = loads.filter(date__lte=end)
+
+    with transaction.atomic(using=using):
+        loads.delete()
+        DailyLoad.objects.using(using).bulk_create(_daily_loads(_load_rows(quotes)), batch_size=1000)
+
+
+def quote_saved(sender, instance, using=None, **kwargs):
+    """post_save: refresh the day the quote moved from and the day it is on now, for every crew"""
+    previous = getattr(instance, '_loaded_work_date', None)
+    refresh_daily_load({previous, instance.work_date}, using)
+    instance._loaded_work_date = instance.work_date
+
+
+def quote_deleted(sender, instance, using=None, **kwargs):
+    """post_delete: the quote's day has one job less"""
+    refresh_daily_load({instance.work_date, getattr(instance, '_loaded_work_date', None)}, using)
+
+
+def crew_deleting(sender, instance, using=None, **kwargs):
+    """pre_delete: remember the crew's days, whose jobs are about to lose their crew"""
+    from .models import DailyLoad
+
+    instance._load_dates = set(DailyLoad.objects.using(using).filter(crew=instance).values_list('date', flat=True))
+
+
+def crew_deleted(sender, instance, using=None, **kwargs):
+    """post_delete: the crew's jobs were set to no crew without Quote.save()"""
+    refresh_daily_load(getattr(instance, '_load_dates', ()), using)
+
+
+def daily_loads(start, end):
+    """``{date: {crew pk (None: no crew): booked minutes}}`` for days with bookings in the range"""
+    from .models import DailyLoad
+
+    loads = defaultdict(dict)
+    rows = DailyLoad.objects.filter(date__range=(start, end)).values_list('date', 'crew_id', 'booked_minutes')
+    for day, crew_id, minutes in rows:
+        loads[day][crew_id] = minutes
+    return loads
+
+
+def booked_minutes(day, crew_id=None):
+    """Minutes booked on ``day`` for one crew, or for all jobs if ``crew_id`` is None"""
+    loads = daily_loads(day, day)[day]
+    return loads.get(crew_id, 0) if crew_id is not None else sum(loads.values())
+
+
+def earliest_available_date(minutes, start, capacity=None, crew_id=None):
+    """
+    First day on or after ``start`` where a job of ``minutes`` fits the
+    crew's capacity, or any crew's if ``crew_id`` is None.
+
+    Reads DailyLoad one window at a time; days without a row are empty.
+    Returns None if nothing fits within ``SLOT_SEARCH_DAYS``.
+    """
+    if capacity is None:
+        capacity = Capacity.current()
+
+    window_start = start
+    last_day = start + timedelta(days=SLOT_SEARCH_DAYS)
+    while window_start <= last_day:
+        window_end = min(window_start + timedelta(days=SLOT_SEARCH_WINDOW - 1), last_day)
+        loads = daily_loads(window_start, window_end)
+        day = window_start
+        while day <= window_end:
+            if capacity.fits(day, loads.get(day, {}), minutes, crew_id):
+                return day
+            day += timedelta(days=1)
+        window_start = window_end + timedelta(days=1)
+    return None
+
+
+def month_calendar(year, month, capacity=None):
+    """
+    Weeks of ``{date, in_month, jobs, completed, minutes, capacity, utilization, conflicts}`` for a month grid.
+
+    Built from one grouped query over the quotes of the displayed range;
+    ``conflicts`` lists ``(crew name, minutes, capacity)`` of overbooked crews.
+    """
+    from .models import Crew, Quote
+
+    if capacity is None:
+        capacity = Capacity.current()
+
+    weeks = calendar.Calendar(firstweekday=6).monthdatescalendar(year, month)
+    first, last = weeks[0][0], weeks[-1][-1]
+    rows = (
+        Quote.objects.filter(work_date__range=(first, last))
+        .order_by()
+        .values('work_date', 'crew_id')
+        .annotate(
+            jobs=Count('pk'),
+            completed=Count('pk', filter=Q(is_completed=True)),
+            minutes=Sum('estimated_minutes'),
+        )
+    )
+    by_day = defaultdict(dict)
+    for row in rows:
+        row['minutes'] = row['minutes'] or 0
+        by_day[row['work_date']][row['crew_id']] = row
+
+    conflicts = {}
+    for day, crews in by_day.items():
+        conflicts[day] = capacity.conflicts(day, {crew_id: row['minutes'] for crew_id, row in crews.items()})
+    names = dict(Crew.objects.filter(pk__in={pk for pks in conflicts.values() for pk in pks}).values_list('pk', 'name'))
+
+    result = []
+    for week in weeks:
+        days = []
+        for day in week:
+            crews = by_day.get(day, {}).values()
+            minutes = sum(row['minutes'] for row in crews)
+            day_capacity = capacity.for_date(day)
+            day_conflicts = [
+                (names.get(crew_id, '?'), by_day[day][crew_id]['minutes'], capacity.for_date(day, crew_id))
+                for crew_id in conflicts.get(day, ())
+            ]
+            days.append({
+                'date': day,
+                'in_month': day.month == month,
+                'jobs': sum(row['jobs'] for row in crews),
+                'completed': sum(row['completed'] for row in crews),
+                'minutes': minutes,
+                'capacity': day_capacity,
+                'utilization': round(100 * minutes / day_capacity) if day_capacity else (100 if minutes else 0),
+                'conflicts': day_conflicts,
+                'overbooked': minutes > day_capacity or bool(day_conflicts),
+            })
+        result.append(days)
+    return result
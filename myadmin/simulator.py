@@ -0,0 +1,288 @@
+"""
+What-if pricing simulator over historical quotes.
+
+Quote measurements are loaded once into compact ``array`` columns ordered by
+quote month. Because every service price is a linear rate on one measurement,
+each month reduces to a handful of column sums, and any number of candidate
+pricing sets can then be evaluated against those sums without touching the
+database again.
+
+The revenue is at list rates: pricing rules (discounts, minimum charges,
+distance zones) aren't linear and aren't applied, so with active rules it
+differs from the stored quote totals. Deltas compare list rates to list rates.
+"""
+from array import array
+from datetime import date
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .models import Quote, ServicePricing
+
+# (label, quote measurement column, ServicePricing rate field)
+SERVICES = (
+    ('House', 'house_sqft', 'house_sqft_price'),
+    ('Driveway (sq.ft.)', 'driveway_sqft', 'driveway_sqft_price'),
+    ('Driveway (cars)', 'driveway_cars', 'driveway_car_price'),
+    ('Patio/Deck', 'patio_deck_sqft', 'patio_deck_sqft_price'),
+    ('Roof Cleaning', 'roof_cleaning_sqft', 'roof_cleaning_sqft_price'),
+    ('Gutter Cleaning', 'gutter_cleaning', 'gutter_cleaning_flat_price'),
+    ('Distance', 'distance_km', 'distance_price_per_km'),
+)
+
+PRICE_FIELDS = tuple(rate for _, _, rate in SERVICES)
+
+# Typecodes keep a million quotes at roughly 4 bytes per measurement
+COLUMN_TYPECODES = {
+    'house_sqft': 'I',
+    'driveway_sqft': 'I',
+    'driveway_cars': 'B',
+    'patio_deck_sqft': 'I',
+    'roof_cleaning_sqft': 'I',
+    'gutter_cleaning': 'B',
+    'distance_km': 'H',
+}
+
+CENTS = Decimal('0.01')
+
+
+class QuoteMeasurements:
+    """Column-oriented snapshot of quote measurements, grouped by month"""
+
+    def __init__(self):
+        self.columns = {name: array(code) for name, code in COLUMN_TYPECODES.items()}
+        self.months = []
+        # offsets[i]:offsets[i + 1] is the slice of rows quoted in months[i]
+        self.offsets = array('Q', [0])
+        self._month_totals = None
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    @classmethod
+    def load(cls, queryset=None, chunk_size=5000):
+        """Read the measurement columns of ``queryset`` (all quotes by default)"""
+        if queryset is None:
+            queryset = Quote.objects.all()
+
+        rows = queryset.order_by('quote_date', 'pk').values_list(
+            'quote_date',
+            'driveway_calculation_type',
+            'house_sqft',
+            'driveway_sqft',
+            'driveway_cars',
+            'patio_deck_sqft',
+            'roof_cleaning_sqft',
+            'gutter_cleaning',
+            'distance_km',
+        )
+
+        snapshot = cls()
+        cols = snapshot.columns
+        house, dw_sqft, dw_cars = cols['house_sqft'], cols['driveway_sqft'], cols['driveway_cars']
+        patio, roof = cols['patio_deck_sqft'], cols['roof_cleaning_sqft']
+        gutter, distance = cols['gutter_cleaning'], cols['distance_km']
+
+        current_month = None
+        count = 0
+        for quote_date, dw_type, h, ds, dc, p, r, g, d in rows.iterator(chunk_size=chunk_size):
+            month = quote_date.replace(day=1)
+            if month != current_month:
+                if current_month is not None:
+                    snapshot.offsets.append(count)
+                snapshot.months.append(month)
+                current_month = month
+
+            # Only the driveway measurement matching the calculation type is billed
+            if dw_type == 'sqft':
+                dc = 0
+            else:
+                ds = 0
+
+            house.append(h)
+            dw_sqft.append(ds)
+            dw_cars.append(dc)
+            patio.append(p)
+            roof.append(r)
+            gutter.append(1 if g else 0)
+            distance.append(d)
+            count += 1
+
+        if current_month is not None:
+            snapshot.offsets.append(count)
+        return snapshot
+
+    def month_totals(self):
+        """Per-month sums of every billed measurement, in ``SERVICES`` order"""
+        if self._month_totals is None:
+            columns = [self.columns[column] for _, column, _ in SERVICES]
+            totals = []
+            for i in range(len(self.months)):
+                start, end = self.offsets[i], self.offsets[i + 1]
+                totals.append(tuple(sum(col[start:end]) for col in columns))
+            self._month_totals = totals
+        return self._month_totals
+
+
+class Scenario:
+    """A named set of ServicePricing rates"""
+
+    def __init__(self, name, rates):
+        self.name = name
+        self.rates = rates
+
+    @classmethod
+    def from_pricing(cls, pricing, name=None):
+        return cls(name or pricing.name, {field: getattr(pricing, field) for field in PRICE_FIELDS})
+
+    def derive(self, name, changes):
+        """
+        Return a copy of this scenario with ``changes`` applied.
+
+        ``changes`` maps a rate field to ``('=', value)`` or ``('*', factor)``.
+        """
+        rates = dict(self.rates)
+        for field, (op, value) in changes.items():
+            rates[field] = value if op == '=' else rates[field] * value
+        return Scenario(name, rates)
+
+
+def parse_changes(text):
+    """
+    Parse ``"roof_cleaning_sqft_price=0.65, distance_price_per_km*=2"``.
+
+    Raises ValueError on unknown fields or malformed values.
+    """
+    changes = {}
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '*=' in part:
+            field, value = part.split('*=', 1)
+            op = '*'
+        elif '=' in part:
+            field, value = part.split('=', 1)
+            op = '='
+        else:
+            raise ValueError(f"Expected 'field=value' or 'field*=factor', got '{part}'")
+
+        field = field.strip()
+        if field not in PRICE_FIELDS:
+            raise ValueError(f"Unknown pricing field '{field}'")
+        try:
+            value = Decimal(value.strip())
+        except ArithmeticError:
+            raise ValueError(f"Invalid number for '{field}': '{value.strip()}'")
+        if not value.is_finite():
+            raise ValueError(f"Invalid number for '{field}': '{value}'")
+        if value < 0:
+            raise ValueError(f"'{field}' cannot be negative")
+        changes[field] = (op, value)
+
+    if not changes:
+        raise ValueError("Scenario has no changes")
+    return changes
+
+
+def parse_scenario(line, base):
+    """Parse ``"name: changes"`` (the name is optional) into a Scenario derived from ``base``"""
+    name, sep, changes = line.partition(':')
+    if not sep:
+        name, changes = line.strip(), line
+    return base.derive(name.strip(), parse_changes(changes))
+
+
+class SimulationResult:
+    """Revenue of one scenario compared against the baseline"""
+
+    def __init__(self, scenario, months, by_service, by_month, baseline_by_service, baseline_by_month):
+        self.scenario = scenario
+        self.months = months
+        self.by_service = by_service
+        self.by_month = by_month
+        self.baseline_by_service = baseline_by_service
+        self.baseline_by_month = baseline_by_month
+
+    @property
+    def total(self):
+        return sum(self.by_month, Decimal('0.00'))
+
+    @property
+    def baseline_total(self):
+        return sum(self.baseline_by_month, Decimal('0.00'))
+
+    @property
+    def delta(self):
+        return self.total - self.baseline_total
+
+    def service_deltas(self):
+        """[(label, baseline, scenario, delta)] per service"""
+        return [
+            (label, base, value, value - base)
+            for (label, _, _), base, value in zip(SERVICES, self.baseline_by_service, self.by_service)
+        ]
+
+    def month_deltas(self):
+        """[(month, baseline, scenario, delta)] per month"""
+        return [
+            (month, base, value, value - base)
+            for month, base, value in zip(self.months, self.baseline_by_month, self.by_month)
+        ]
+
+
+def _revenue(month_totals, scenario):
+    """Return (per-service, per-month) revenue of ``scenario`` over the reduced totals"""
+    rates = [scenario.rates[field] for field in PRICE_FIELDS]
+    by_service = [Decimal('0.00')] * len(SERVICES)
+    by_month = []
+    for totals in month_totals:
+        month_sum = Decimal('0.00')
+        for i, (quantity, rate) in enumerate(zip(totals, rates)):
+            amount = quantity * rate
+            by_service[i] += amount
+            month_sum += amount
+        by_month.append(month_sum.quantize(CENTS))
+    return [amount.quantize(CENTS) for amount in by_service], by_month
+
+
+def simulate(measurements, baseline, scenarios):
+    """
+    Evaluate ``scenarios`` against ``measurements`` and compare each to ``baseline``.
+
+    Read-only: nothing is written to the database.
+    """
+    month_totals = measurements.month_totals()
+    baseline_by_service, baseline_by_month = _revenue(month_totals, baseline)
+
+    results = []
+    for scenario in scenarios:
+        by_service, by_month = _revenue(month_totals, scenario)
+        results.append(SimulationResult(
+            scenario,
+            measurements.months,
+            by_service,
+            by_month,
+            baseline_by_service,
+            baseline_by_month,
+        ))
+    return results
+
+
+def default_period():
+    """First and last day of the previous calendar year"""
+    last_year = timezone.localdate().year - 1
+    return date(last_year, 1, 1), date(last_year, 12, 31)
+
+
+def active_rule_count(pricing):
+    """Active pricing rules of ``pricing``, which the list-rate revenue leaves out"""
+    return pricing.rules.filter(is_active=True).count()
+
+
+def baseline_pricing():
+    """The pricing the calculator uses: the active one, else the most recently updated"""
+    pricing = ServicePricing.objects.filter(is_active=True).first()
+    if not pricing:
+        pricing = ServicePricing.objects.order_by('-updated_at').first()
+    return pricing
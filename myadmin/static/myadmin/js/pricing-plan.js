@@ -0,0 +1,85 @@
+// Evaluates a pricing plan (the "rules" of pricing.json) exactly like the
+// compiled evaluator of myadmin/pricing_rules.py: integer milli-cents, with
+// percentages in basis points rounded half up, and the total rounded half up
+// to cents. Amounts stay far below 2^53, so plain numbers are exact.
+(function (root) {
+  "use strict";
+
+  // Index of the first value > x in a sorted array (Python's bisect_right)
+  function bisectRight(values, x) {
+    var low = 0;
+    var high = values.length;
+    while (low < high) {
+      var middle = (low + high) >> 1;
+      if (x < values[middle]) {
+        high = middle;
+      } else {
+        low = middle + 1;
+      }
+    }
+    return low;
+  }
+
+  // Index of the first value >= x (Python's bisect_left)
+  function bisectLeft(values, x) {
+    var low = 0;
+    var high = values.length;
+    while (low < high) {
+      var middle = (low + high) >> 1;
+      if (values[middle] < x) {
+        low = middle + 1;
+      } else {
+        high = middle;
+      }
+    }
+    return low;
+  }
+
+  function minus(amount, basisPoints) {
+    return amount - Math.floor((amount * basisPoints + 5000) / 10000);
+  }
+
+  function first(pairs) {
+    return pairs.map(function (pair) { return pair[0]; });
+  }
+
+  // Total in cents of a quote given as {house_sqft, driveway_calculation_type, ...}
+  function evaluate(plan, quote) {
+    var rates = plan.rates;
+    var bySqft = quote.driveway_calculation_type === "sqft";
+
+    var roof = quote.roof_cleaning_sqft * rates.roof_cleaning_sqft_price;
+    if (quote.gutter_cleaning) {
+      roof += rates.gutter_cleaning_flat_price;
+    }
+    if (plan.bundleBasisPoints && quote.gutter_cleaning && quote.roof_cleaning_sqft) {
+      roof = minus(roof, plan.bundleBasisPoints);
+    }
+
+    var services = quote.house_sqft * rates.house_sqft_price + quote.patio_deck_sqft * rates.patio_deck_sqft_price + roof;
+    services += bySqft ? quote.driveway_sqft * rates.driveway_sqft_price : quote.driveway_cars * rates.driveway_car_price;
+
+    if (plan.volumeTiers.length) {
+      var sqft = quote.house_sqft + quote.patio_deck_sqft + quote.roof_cleaning_sqft + (bySqft ? quote.driveway_sqft : 0);
+      var tier = bisectRight(first(plan.volumeTiers), sqft);
+      if (tier) {
+        services = minus(services, plan.volumeTiers[tier - 1][1]);
+      }
+    }
+
+    var travel = quote.distance_km * rates.distance_price_per_km;
+    if (plan.distanceZones.length) {
+      var zone = bisectLeft(first(plan.distanceZones), quote.distance_km);
+      if (!quote.distance_km) {
+        travel = 0;
+      } else if (zone < plan.distanceZones.length) {
+        travel = plan.distanceZones[zone][1];
+      }
+    }
+
+    var total = Math.max(services + travel, plan.minimum);
+    return Math.floor((total + 500) / 1000);
+  }
+
+  root.PricingPlan = { evaluate: evaluate };
+})(typeof window !== "undefined" ? window : globalThis);
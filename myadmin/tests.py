@@ -1,3 +1,1194 @@
-from django.test import TestCase
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count, F, QuerySet, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import audit, bulk, dedupe, franchises, metrics, pricing_rules, schedule_feed, scheduling, simulator
+from .management.commands.benchmark_sharding import create_shard, drop_shard
+from .fields import CENTS, MILLICENTS, MoneyAvg, from_minor_units, to_minor_units, trim_places
+from .models import (
+    AuditEntry, Crew, Customer, DailyLoad, PricingRule, Quote, QuoteTombstone, ServicePricing, StaffProfile,
+)
+from .pricing_rules import QUOTE_COLUMNS, CompiledRules, build_plan, evaluate_reference
+from .simulator import PRICE_FIELDS, parse_changes
+
+
+class CompiledPricingRulesTests(SimpleTestCase):
+    """The compiled evaluator must agree with the reference interpreter on any input"""
+
+    EXAMPLES = 3000
+
+    def random_pricing(self, rng):
+        return ServicePricing(
+            name='random',
+            house_sqft_price=from_minor_units(rng.randrange(0, 200_000), MILLICENTS),
+            driveway_sqft_price=from_minor_units(rng.randrange(0, 200_000), MILLICENTS),
+            patio_deck_sqft_price=from_minor_units(rng.randrange(0, 200_000), MILLICENTS),
+            roof_cleaning_sqft_price=from_minor_units(rng.randrange(0, 200_000), MILLICENTS),
+            driveway_car_price=from_minor_units(rng.randrange(0, 20_000), CENTS),
+            gutter_cleaning_flat_price=from_minor_units(rng.randrange(0, 50_000), CENTS),
+            distance_price_per_km=from_minor_units(rng.randrange(0, 1_000), CENTS),
+        )
+
+    def random_rules(self, rng):
+        rules = []
+        for _ in range(rng.randrange(0, 8)):
+            rules.append(PricingRule(
+                kind=rng.choice([kind for kind, _ in PricingRule.KIND_CHOICES]),
+                threshold=rng.choice([0, 1, rng.randrange(0, 100), rng.randrange(0, 10_000)]),
+                percent_off=from_minor_units(rng.randrange(0, 10_001), 2),
+                amount=from_minor_units(rng.randrange(0, 100_000), CENTS),
+                is_active=rng.random() < 0.85,
+            ))
+        return rules
+
+    def random_quote(self, rng, rules):
+        # Measurements are often picked right at a rule threshold to exercise the boundaries
+        thresholds = [rule.threshold for rule in rules] or [0]
+
+        def measurement(limit):
+            if rng.random() < 0.3:
+                return max(0, rng.choice(thresholds) + rng.choice([-1, 0, 1]))
+            return rng.choice([0, rng.randrange(0, limit)])
+
+        return Quote(
+            house_sqft=measurement(6000),
+            driveway_calculation_type=rng.choice(['sqft', 'cars']),
+            driveway_sqft=measurement(3000),
+            driveway_cars=rng.randrange(0, 6),
+            patio_deck_sqft=measurement(2000),
+            roof_cleaning_sqft=measurement(4000),
+            gutter_cleaning=rng.random() < 0.5,
+            distance_km=measurement(150),
+        )
+
+    def test_compiled_matches_reference(self):
+        rng = random.Random(20240601)
+        for example in range(self.EXAMPLES):
+            pricing = self.random_pricing(rng)
+            rules = self.random_rules(rng)
+            compiled = CompiledRules(build_plan(pricing, rules))
+            for _ in range(5):
+                quote = self.random_quote(rng, rules)
+                expected = to_minor_units(evaluate_reference(pricing, rules, quote), CENTS)
+                with self.subTest(example=example, quote=vars(quote), source=compiled.source):
+                    self.assertEqual(compiled.quote_total(quote), expected)
+
+    @skipUnless(shutil.which('node'), "needs Node.js")
+    def test_calculator_page_matches_compiled(self):
+        rng = random.Random(20261019)
+        cases, expected = [], []
+        for _ in range(300):
+            pricing = self.random_pricing(rng)
+            rules = self.random_rules(rng)
+            compiled = CompiledRules(build_plan(pricing, rules))
+            for _ in range(5):
+                quote = self.random_quote(rng, rules)
+                cases.append([compiled.plan, {column: getattr(quote, column) for column in QUOTE_COLUMNS}])
+                expected.append(compiled.quote_total(quote))
+
+        script = os.path.join(settings.BASE_DIR, 'myadmin', 'static', 'myadmin', 'js', 'pricing-plan.js')
+        program = (
+            f'require({json.dumps(script)});'
+            'const cases = JSON.parse(require("fs").readFileSync(0, "utf8"));'
+            'console.log(JSON.stringify(cases.map(([plan, quote]) => PricingPlan.evaluate(plan, quote))));'
+        )
+        result = subprocess.run(
+            ['node', '-e', program], input=json.dumps(cases), capture_output=True, text=True, check=True,
+        )
+        self.assertEqual(json.loads(result.stdout), expected)
+
+    def test_evaluator_cache_is_thread_safe(self):
+        pricings = []
+        for pk in range(1, 201):
+            pricing = ServicePricing(pk=pk, name='random', updated_at=timezone.now())
+            pricing._state.db = 'default'
+            pricings.append(pricing)
+        errors = []
+
+        def compile_all(offset):
+            try:
+                for pricing in pricings[offset:] + pricings[:offset]:
+                    pricing_rules.evaluator_for(pricing)
+            except Exception as exc:
+                errors.append(exc)
+
+        with mock.patch.object(pricing_rules, '_rules_of', return_value=[]), \
+                mock.patch.object(pricing_rules, 'CACHE_SIZE', 4), mock.patch.dict(pricing_rules._cache, clear=True):
+            threads = [threading.Thread(target=compile_all, args=(offset,)) for offset in range(0, 200, 25)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertLessEqual(len(pricing_rules._cache), 4)
+        self.assertEqual(errors, [])
+
+    def test_no_rules_is_plain_rate_total(self):
+        pricing = ServicePricing(
+            house_sqft_price=Decimal('0.15'),
+            driveway_sqft_price=Decimal('0.10'),
+            driveway_car_price=Decimal('25.00'),
+            patio_deck_sqft_price=Decimal('0.12'),
+            roof_cleaning_sqft_price=Decimal('0.20'),
+            gutter_cleaning_flat_price=Decimal('150.00'),
+            distance_price_per_km=Decimal('1.50'),
+        )
+        quote = Quote(
+            house_sqft=2000,
+            driveway_calculation_type='cars',
+            driveway_sqft=0,
+            driveway_cars=2,
+            patio_deck_sqft=300,
+            roof_cleaning_sqft=1500,
+            gutter_cleaning=True,
+            distance_km=12,
+        )
+        compiled = CompiledRules(build_plan(pricing, []))
+        self.assertEqual(from_minor_units(compiled.quote_total(quote), CENTS), Decimal('854.00'))
+
+
+class SimulatorInputTests(SimpleTestCase):
+    def test_parses_assignments_and_factors(self):
+        changes = parse_changes('roof_cleaning_sqft_price=0.65, distance_price_per_km*=2')
+        self.assertEqual(changes, {
+            'roof_cleaning_sqft_price': ('=', Decimal('0.65')),
+            'distance_price_per_km': ('*', Decimal('2')),
+        })
+
+    def test_rejects_invalid_input(self):
+        for text in [
+            'roof_cleaning_sqft_price=nan',
+            'roof_cleaning_sqft_price=NaN',
+            'roof_cleaning_sqft_price=sNaN',
+            'roof_cleaning_sqft_price=inf',
+            'distance_price_per_km*=-Infinity',
+            'roof_cleaning_sqft_price=-1',
+            'roof_cleaning_sqft_price=abc',
+            'roof_cleaning_sqft_price',
+            'unknown_price=1',
+            ' , ',
+        ]:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                parse_changes(text)
+
+
+class PricingSimulatorViewTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(user)
+        ServicePricing.objects.create(name='Standard', is_active=True)
+
+    def test_non_finite_value_is_a_form_error(self):
+        for value in ['nan', 'inf']:
+            with self.subTest(value=value):
+                response = self.client.get(
+                    '/admin/pricing-simulator/', {'scenarios': f'{PRICE_FIELDS[0]}={value}'}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['errors']), 1)
+                self.assertEqual(response.context['results'], [])
+
+
+class SimulateTests(TestCase):
+    def setUp(self):
+        self.pricing = ServicePricing.objects.create(
+            name='Standard', house_sqft_price=Decimal('0.15'), driveway_sqft_price=Decimal('0.10'),
+            driveway_car_price=Decimal('25.00'), patio_deck_sqft_price=Decimal('0.12'),
+            roof_cleaning_sqft_price=Decimal('0.20'), gutter_cleaning_flat_price=Decimal('150.00'),
+            distance_price_per_km=Decimal('1.50'),
+        )
+        # A rule changes stored totals, not the list-rate revenue
+        PricingRule.objects.create(pricing=self.pricing, kind='minimum_charge', amount=Decimal('500'))
+        customer = Customer.objects.create(first_name='John', last_name='Smith', address_line1='12 Main St')
+        rng = random.Random(7)
+        for i in range(40):
+            Quote.objects.create(
+                customer=customer, pricing=self.pricing, quote_number=f'Q{i}',
+                quote_date=date(2030, rng.randrange(1, 13), rng.randrange(1, 29)),
+                house_sqft=rng.randrange(0, 4000), driveway_calculation_type=rng.choice(['sqft', 'cars']),
+                driveway_sqft=rng.randrange(0, 1500), driveway_cars=rng.randrange(0, 5),
+                patio_deck_sqft=rng.randrange(0, 800), roof_cleaning_sqft=rng.randrange(0, 3000),
+                gutter_cleaning=rng.random() < 0.5, distance_km=rng.randrange(0, 60),
+            )
+
+    def list_price(self, quote, rates):
+        """Per-service amounts of one quote; only the driveway measurement of its calculation type counts"""
+        by_cars = quote.driveway_calculation_type == 'cars'
+        quantities = [
+            quote.house_sqft,
+            0 if by_cars else quote.driveway_sqft,
+            quote.driveway_cars if by_cars else 0,
+            quote.patio_deck_sqft,
+            quote.roof_cleaning_sqft,
+            1 if quote.gutter_cleaning else 0,
+            quote.distance_km,
+        ]
+        return [quantity * rates[field] for quantity, field in zip(quantities, PRICE_FIELDS)]
+
+    def test_deltas_add_up_per_quote(self):
+        baseline = simulator.Scenario.from_pricing(self.pricing)
+        scenario = baseline.derive('Roof and cars', {
+            'roof_cleaning_sqft_price': ('=', Decimal('0.25')),
+            'driveway_car_price': ('*', Decimal('2')),
+            'driveway_sqft_price': ('=', Decimal('0.05')),
+        })
+        totals = list(Quote.objects.order_by('pk').values_list('total_amount', flat=True))
+
+        with CaptureQueriesContext(connection) as queries:
+            measurements = simulator.QuoteMeasurements.load(Quote.objects.all())
+            result, = simulator.simulate(measurements, baseline, [scenario])
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries.captured_queries))
+        self.assertEqual(list(Quote.objects.order_by('pk').values_list('total_amount', flat=True)), totals)
+
+        by_service = [Decimal('0')] * len(PRICE_FIELDS)
+        by_month = {}
+        for quote in Quote.objects.all():
+            deltas = [
+                new - old
+                for old, new in zip(self.list_price(quote, baseline.rates), self.list_price(quote, scenario.rates))
+            ]
+            by_service = [total + delta for total, delta in zip(by_service, deltas)]
+            month = quote.quote_date.replace(day=1)
+            by_month[month] = by_month.get(month, Decimal('0')) + sum(deltas)
+
+        self.assertEqual([delta for _, _, _, delta in result.service_deltas()], by_service)
+        self.assertEqual({month: delta for month, _, _, delta in result.month_deltas()}, by_month)
+        self.assertEqual(result.delta, sum(by_service))
+        self.assertNotEqual(by_service[1], 0)
+        self.assertNotEqual(by_service[2], 0)
+
+    def test_view_says_rules_are_left_out(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+        response = self.client.get('/admin/pricing-simulator/', {
+            'pricing': self.pricing.pk, 'since': '2030-01-01', 'until': '2030-12-31',
+            'scenarios': 'roof_cleaning_sqft_price=0.25',
+        })
+        self.assertEqual(response.context['quote_count'], 40)
+        self.assertContains(response, "has 1 active pricing rule;")
+
+
+class DedupeTests(TestCase):
+    def setUp(self):
+        self.pricing = ServicePricing.objects.create(name='Standard')
+
+    def customer(self, **fields):
+        return Customer.objects.create(**{
+            'first_name': 'John',
+            'last_name': 'Smith',
+            'address_line1': '12 Main Street',
+            'zip_code': 'K1A 0B1',
+            **fields,
+        })
+
+    def quote(self, customer, number):
+        return Quote.objects.create(customer=customer, pricing=self.pricing, quote_number=number, house_sqft=1000)
+
+    def test_keys(self):
+        customer = self.customer(
+            first_name='Jon', last_name='Smyth', email=' John@Example.COM ', phone_number='+1 (613) 555-0100',
+            address_line1='12 Main Street North', address_line2='Apartment 4', zip_code='k1a-0b1',
+        )
+        self.assertEqual(customer.phone_key, '6135550100')
+        self.assertEqual(customer.email_key, 'john@example.com')
+        self.assertEqual(customer.address_key, '12 main st n apt 4|K1A0B1')
+        self.assertEqual(customer.name_key, 'S530J')
+
+    def test_longest_address_key_fits(self):
+        customer = self.customer(address_line1='a' * 255, address_line2='b' * 255, zip_code='9' * 20)
+        self.assertEqual(len(customer.address_key), Customer._meta.get_field('address_key').max_length)
+        customer.refresh_from_db()
+        self.assertEqual(customer.address_key, f"{'a' * 255} {'b' * 255}|{'9' * 20}")
+
+    def test_migration_keys_match(self):
+        migration = import_module('myadmin.migrations.0002_customer_dedupe_keys')
+        for first, last, phone, line1, line2, zip_code in [
+            ('John', 'Smith', '613.555.0100', '12 Main Street', '', 'K1A 0B1'),
+            ('Ashcraft', "O'Hara", '555-01', 'Unit 4, 300 Riverside Drive West', 'Suite 2', 'j8t-1a1'),
+            ('', '', '', '', '', ''),
+        ]:
+            with self.subTest(last_name=last):
+                self.assertEqual(migration.normalize_phone(phone), dedupe.normalize_phone(phone))
+                self.assertEqual(
+                    migration.normalize_address(line1, line2, zip_code),
+                    dedupe.normalize_address(line1, line2, zip_code),
+                )
+                self.assertEqual(migration.phonetic_name(first, last), dedupe.phonetic_name(first, last))
+
+    def test_find_duplicates(self):
+        a = self.customer(phone_number='613-555-0100')
+        b = self.customer(first_name='J.', phone_number='(613) 555 0100', address_line1='12 Main St')
+        self.customer(first_name='Mary', last_name='Jones', address_line1='9 Bank St')
+        self.assertEqual(dedupe.find_duplicate_pairs(), [(1.0, a.pk, b.pk)])
+
+    def test_merge(self):
+        primary = self.customer(phone_number='613-555-0100', notes='Gate code 1234')
+        duplicate = self.customer(
+            first_name='Johnny', last_name='Smithers', address_line1='1 Elm St', phone_number='6135550100',
+            email='john@example.com', notes='Dog in yard',
+        )
+        self.quote(primary, 'Q1')
+        self.quote(duplicate, 'Q2')
+        self.quote(duplicate, 'Q3')
+
+        self.assertEqual(dedupe.merge_customers(primary, [duplicate]), 2)
+        primary.refresh_from_db()
+        self.assertEqual(primary.email, 'john@example.com')
+        self.assertEqual(primary.notes, 'Gate code 1234\n\nDog in yard')
+        self.assertEqual(primary.quotes.count(), 3)
+        self.assertFalse(Customer.objects.filter(pk=duplicate.pk).exists())
+
+    def test_merge_unrelated_needs_confirmation(self):
+        primary = self.customer()
+        stranger = self.customer(first_name='Mary', last_name='Jones', address_line1='9 Bank St')
+        self.quote(stranger, 'Q1')
+
+        with self.assertRaises(ValueError):
+            dedupe.merge_customers(primary, [stranger])
+        self.assertTrue(Customer.objects.filter(pk=stranger.pk).exists())
+
+        self.assertEqual(dedupe.merge_customers(primary, [stranger], confirmed=True), 1)
+        self.assertFalse(Customer.objects.filter(pk=stranger.pk).exists())
+
+    def test_merge_action_confirms_unrelated(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+        primary = self.customer()
+        stranger = self.customer(first_name='Mary', last_name='Jones', address_line1='9 Bank St')
+        data = {'action': 'merge_selected', '_selected_action': [primary.pk, stranger.pk]}
+
+        response = self.client.post('/admin/myadmin/customer/', data)
+        self.assertTemplateUsed(response, 'admin/merge_customers_confirmation.html')
+        self.assertTrue(Customer.objects.filter(pk=stranger.pk).exists())
+
+        response = self.client.post('/admin/myadmin/customer/', {**data, 'confirm': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Customer.objects.filter(pk=stranger.pk).exists())
+
+
+class DailyLoadTests(TestCase):
+    MONDAY = date(2030, 6, 3)
+    TUESDAY = date(2030, 6, 4)
+    SATURDAY = date(2030, 6, 8)
+
+    def setUp(self):
+        self.pricing = ServicePricing.objects.create(name='Standard')
+        self.customer = Customer.objects.create(first_name='John', last_name='Smith', address_line1='12 Main St')
+        self.alpha = Crew.objects.create(name='Alpha', daily_capacity_minutes=300)
+        self.bravo = Crew.objects.create(name='Bravo', daily_capacity_minutes=300, works_weekends=True)
+        self.numbers = iter(range(1, 1000))
+
+    def quote(self, work_date, crew=None, house_sqft=2000):
+        # 30 setup + 120 house minutes
+        return Quote.objects.create(
+            customer=self.customer, pricing=self.pricing, quote_number=f'Q{next(self.numbers)}',
+            work_date=work_date, crew=crew, house_sqft=house_sqft,
+        )
+
+    def assertLoadsConsistent(self):
+        expected = {
+            (row['work_date'], row['crew']): (row['jobs'], row['minutes'])
+            for row in Quote.objects.filter(work_date__isnull=False).order_by().values('work_date', 'crew')
+            .annotate(jobs=Count('pk'), minutes=Sum('estimated_minutes'))
+        }
+        actual = {
+            (load.date, load.crew_id): (load.job_count, load.booked_minutes) for load in DailyLoad.objects.all()
+        }
+        self.assertEqual(actual, expected)
+
+    def test_create_update_delete(self):
+        a = self.quote(self.MONDAY, self.alpha)
+        b = self.quote(self.MONDAY, self.bravo)
+        self.quote(self.MONDAY)
+        self.assertLoadsConsistent()
+        self.assertEqual(scheduling.booked_minutes(self.MONDAY, self.alpha.pk), 150)
+        self.assertEqual(scheduling.booked_minutes(self.MONDAY), 450)
+
+        a.work_date = self.TUESDAY
+        a.save()
+        b.crew = self.alpha
+        b.save()
+        self.assertLoadsConsistent()
+        self.assertEqual(scheduling.booked_minutes(self.MONDAY, self.bravo.pk), 0)
+
+        a.house_sqft = 4000
+        a.save()
+        self.assertLoadsConsistent()
+        self.assertEqual(scheduling.booked_minutes(self.TUESDAY, self.alpha.pk), 270)
+
+        b.delete()
+        self.assertLoadsConsistent()
+
+    def test_bulk_operations(self):
+        quotes = [self.quote(self.MONDAY, self.alpha), self.quote(self.TUESDAY, self.bravo), self.quote(None)]
+        selection = Quote.objects.filter(pk__in=[quote.pk for quote in quotes])
+
+        bulk.reschedule(selection, days=1)
+        self.assertLoadsConsistent()
+        bulk.reschedule(selection, work_date=self.SATURDAY.isoformat())
+        self.assertLoadsConsistent()
+        self.assertEqual(DailyLoad.objects.get(date=self.SATURDAY, crew=self.alpha).job_count, 1)
+        bulk.delete(selection.filter(crew=self.bravo))
+        self.assertLoadsConsistent()
+
+    def test_crew_delete(self):
+        self.quote(self.MONDAY, self.alpha)
+        self.quote(self.MONDAY)
+        self.alpha.delete()
+        self.assertLoadsConsistent()
+        self.assertEqual(DailyLoad.objects.get(date=self.MONDAY, crew=None).job_count, 2)
+
+    def test_rebuild(self):
+        self.quote(self.MONDAY, self.alpha)
+        self.quote(self.MONDAY, self.bravo)
+        DailyLoad.objects.all().delete()
+        scheduling.rebuild_daily_load()
+        self.assertLoadsConsistent()
+
+    def test_per_crew_capacity(self):
+        self.quote(self.MONDAY, self.alpha)
+        self.quote(self.MONDAY, self.alpha)
+        self.quote(self.SATURDAY, self.alpha)
+        capacity = scheduling.Capacity.current()
+
+        # 300 of Alpha's 300 minutes: full, though the day has 600 minutes between both crews
+        self.assertEqual(scheduling.earliest_available_date(30, self.MONDAY, capacity, self.alpha.pk), self.TUESDAY)
+        self.assertEqual(scheduling.earliest_available_date(30, self.MONDAY, capacity, self.bravo.pk), self.MONDAY)
+        self.assertEqual(scheduling.earliest_available_date(30, self.MONDAY, capacity), self.MONDAY)
+        self.assertEqual(scheduling.earliest_available_date(301, self.MONDAY, capacity), None)
+
+        self.quote(self.MONDAY, self.alpha)
+        days = {day['date']: day for week in scheduling.month_calendar(2030, 6, capacity) for day in week}
+        self.assertEqual(days[self.MONDAY]['conflicts'], [('Alpha', 450, 300)])
+        self.assertTrue(days[self.MONDAY]['overbooked'])
+        # Alpha doesn't work weekends
+        self.assertEqual(days[self.SATURDAY]['conflicts'], [('Alpha', 150, 0)])
+        self.assertFalse(days[self.TUESDAY]['overbooked'])
+
+    def test_schedule_view_month(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+        today = timezone.now().date()
+        for month in ['9999-12', '0001-01', '1-1', '2030-13', 'june', '']:
+            with self.subTest(month=month):
+                response = self.client.get('/admin/schedule/', {'month': month})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['month'], date(today.year, today.month, 1))
+        response = self.client.get('/admin/schedule/', {'month': '2030-06'})
+        self.assertEqual(response.context['month'], date(2030, 6, 1))
+
+
+class AuditTests(TestCase):
+    def setUp(self):
+        self.pricing = ServicePricing.objects.create(name='Standard')
+        self.customers = [
+            Customer.objects.create(first_name='John', last_name='Smith', address_line1='12 Main St'),
+            Customer.objects.create(first_name='Mary', last_name='Jones', address_line1='9 Bank St'),
+        ]
+        self.quotes = [
+            Quote.objects.create(
+                customer=customer, pricing=self.pricing, quote_number=f'Q{i}', house_sqft=1000, notes='',
+            )
+            for i, customer in enumerate(self.customers)
+        ]
+
+    def recorded(self, func):
+        """Entries queued by ``func()`` once its transaction commits"""
+        with mock.patch.object(audit.buffer, 'add') as add, self.captureOnCommitCallbacks(execute=True):
+            func()
+        return [entry for call in add.call_args_list for entry in call.args[0]]
+
+    def test_update_plain_values(self):
+        quotes = Quote.objects.filter(pk__in=[quote.pk for quote in self.quotes])
+        # Savepoint, the before values, the update itself, savepoint release
+        with self.assertNumQueries(4):
+            entries = self.recorded(lambda: quotes.update(
+                notes='Call first', customer=self.customers[0], work_date='2030-06-03', updated_at=timezone.now()
+            ))
+        changes = {entry.object_id: entry.changes for entry in entries}
+        self.assertEqual(changes, {
+            self.quotes[0].pk: {'notes': ['', 'Call first'], 'work_date': [None, date(2030, 6, 3)]},
+            self.quotes[1].pk: {
+                'notes': ['', 'Call first'],
+                'customer_id': [self.customers[1].pk, self.customers[0].pk],
+                'work_date': [None, date(2030, 6, 3)],
+            },
+        })
+        self.assertEqual({entry.action for entry in entries}, {'b'})
+
+    def test_update_expressions(self):
+        quotes = Quote.objects.filter(pk=self.quotes[0].pk)
+        entries = self.recorded(lambda: quotes.update(house_sqft=F('house_sqft') + 500, notes='Bigger'))
+        self.assertEqual(entries[0].changes, {'house_sqft': [1000, 1500], 'notes': ['', 'Bigger']})
+
+    def test_unchanged_update_records_nothing(self):
+        self.assertEqual(self.recorded(lambda: Quote.objects.update(notes='')), [])
+
+    def test_save_skips_deferred_fields(self):
+        quote = Quote.objects.defer('notes', 'house_sqft').get(pk=self.quotes[0].pk)
+        quote.distance_km = 12
+
+        def save():
+            with self.assertNumQueries(0):
+                values = quote.audit_values()
+            self.assertNotIn('notes', values)
+            quote.save(update_fields=['distance_km'])
+
+        entries = self.recorded(save)
+        self.assertEqual(entries[0].changes, {'distance_km': [0, 12]})
+        self.assertEqual(Quote.objects.get(pk=quote.pk).notes, '')
+
+    def test_flush_gives_up_after_max_attempts(self):
+        buffer = audit.AuditBuffer(flush_interval=60, batch_size=100, max_attempts=2)
+        buffer._thread = True  # Don't start the flush thread
+        entry = AuditEntry(model='myadmin.quote', object_id=1, action='u', changes={}, timestamp=timezone.now())
+        buffer.add([entry], 'default')
+
+        with mock.patch.object(QuerySet, 'bulk_create', side_effect=DatabaseError), \
+                self.assertLogs('myadmin.audit', 'WARNING') as logs:
+            self.assertEqual(buffer.flush(), 0)
+            self.assertEqual(len(buffer), 1)
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer), 0)
+        self.assertIn('Dropped 1 audit entries for default after 2 attempts: myadmin.quote:1:u', logs.output[-1])
+
+        buffer.add([entry], 'default')
+        self.assertEqual(buffer.flush(), 1)
+        self.assertTrue(AuditEntry.objects.filter(object_id=1).exists())
+
+
+class PricingConfigTests(TestCase):
+    URL = '/admin/price-calculator/pricing.json'
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+        self.pricing = ServicePricing.objects.create(name='Standard', is_active=True)
+
+    def test_calculator_page_offers_rules(self):
+        response = self.client.get('/admin/price-calculator/')
+        self.assertContains(response, 'window.pricingRules = {')
+        self.assertContains(response, '"pricecalculator:quote"')
+
+    def test_etag_revalidation(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Standard')
+        etag = response.headers['ETag']
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+
+        response = self.client.get(self.URL, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+        # A new rule saves its pricing, which changes the ETag
+        PricingRule.objects.create(pricing=self.pricing, kind='minimum_charge', amount=Decimal('150'))
+        response = self.client.get(self.URL, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertTrue(response.json()['rules']['summary'])
+
+    def test_no_pricing(self):
+        self.pricing.delete()
+        self.assertEqual(self.client.get(self.URL).status_code, 404)
+
+    def test_service_worker_needs_no_login(self):
+        self.client.logout()
+        response = self.client.get('/admin/price-calculator/sw.js')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('javascript', response.headers['Content-Type'])
+
+
+class MoneyFieldTests(TestCase):
+    def setUp(self):
+        self.pricing = ServicePricing.objects.create(
+            name='Standard', house_sqft_price=Decimal('0.12345'), driveway_sqft_price=Decimal('0.7'),
+        )
+        self.customer = Customer.objects.create(first_name='John', last_name='Smith', address_line1='12 Main St')
+
+    def test_round_trip(self):
+        pricing = ServicePricing.objects.get(pk=self.pricing.pk)
+        self.assertEqual(str(pricing.house_sqft_price), '0.12345')
+        self.assertEqual(str(pricing.driveway_sqft_price), '0.70')
+        self.assertEqual(str(pricing.driveway_car_price), '50.00')
+        self.assertEqual(
+            ServicePricing.objects.filter(pk=pricing.pk).values_list('house_sqft_price', flat=True).get(),
+            Decimal('0.12345'),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT house_sqft_price, driveway_car_price FROM myadmin_servicepricing')
+            self.assertEqual(cursor.fetchone(), (12345, 5000))
+
+    def test_rounds_half_up(self):
+        quote = Quote.objects.create(
+            customer=self.customer, pricing=self.pricing, quote_number='Q1', total_amount=Decimal('10.005'),
+        )
+        quote.refresh_from_db()
+        self.assertEqual(quote.total_amount, Decimal('10.01'))
+        self.assertEqual(to_minor_units(Decimal('-0.005'), CENTS), -1)
+
+    def test_trim_places(self):
+        for value, expected in [('0.50000', '0.50'), ('0.12340', '0.1234'), ('100.00000', '100.00'), ('0', '0.00')]:
+            with self.subTest(value=value):
+                self.assertEqual(str(trim_places(Decimal(value))), expected)
+
+    def test_aggregates(self):
+        for number, total in enumerate(['10.00', '10.00', '10.01']):
+            Quote.objects.create(
+                customer=self.customer, pricing=self.pricing, quote_number=f'Q{number}', total_amount=Decimal(total),
+            )
+        totals = Quote.objects.aggregate(total=Sum('total_amount'), average=MoneyAvg('total_amount'))
+        self.assertEqual(totals, {'total': Decimal('30.01'), 'average': Decimal('10.00')})
+
+    def test_admin_shows_trimmed_rates(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+        response = self.client.get(f'/admin/myadmin/servicepricing/{self.pricing.pk}/change/')
+        self.assertContains(response, 'value="0.70"')
+        self.assertContains(response, 'value="0.12345"')
+        self.assertNotContains(response, '0.70000')
+
+
+class MoneyMigrationTests(TransactionTestCase):
+    BEFORE = [('myadmin', '0004_audit_entry')]
+    AFTER = [('myadmin', '0005_money_minor_units')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_forward_and_backward(self):
+        apps = self.migrate(self.BEFORE)
+        pricing = apps.get_model('myadmin', 'ServicePricing').objects.create(
+            name='Standard', house_sqft_price=Decimal('0.15'), driveway_car_price=Decimal('49.99'),
+        )
+        customer = apps.get_model('myadmin', 'Customer').objects.create(first_name='John', address_line1='1 Main St')
+        apps.get_model('myadmin', 'Quote').objects.create(
+            customer=customer, pricing=pricing, quote_number='Q1', total_amount=Decimal('1234.56'),
+        )
+
+        self.migrate(self.AFTER)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT house_sqft_price, driveway_car_price FROM myadmin_servicepricing')
+            self.assertEqual(cursor.fetchone(), (15000, 4999))
+            cursor.execute('SELECT total_amount FROM myadmin_quote')
+            self.assertEqual(cursor.fetchone(), (123456,))
+
+        apps = self.migrate(self.BEFORE)
+        pricing = apps.get_model('myadmin', 'ServicePricing').objects.get()
+        self.assertEqual(pricing.house_sqft_price, Decimal('0.15'))
+        self.assertEqual(pricing.driveway_car_price, Decimal('49.99'))
+        self.assertEqual(apps.get_model('myadmin', 'Quote').objects.get().total_amount, Decimal('1234.56'))
+
+
+class BulkActionTests(TestCase):
+    WORK_DATE = date(2030, 6, 3)
+
+    def setUp(self):
+        self.standard = ServicePricing.objects.create(name='Standard', house_sqft_price=Decimal('0.10'))
+        self.premium = ServicePricing.objects.create(name='Premium', house_sqft_price=Decimal('0.20'))
+        self.customer = Customer.objects.create(first_name='John', last_name='Smith', address_line1='12 Main St')
+        self.crew = Crew.objects.create(name='Alpha')
+        self.numbers = iter(range(1, 1000))
+
+    def quote(self, pricing=None, **fields):
+        return Quote.objects.create(
+            customer=self.customer, pricing=pricing or self.standard, quote_number=f'Q{next(self.numbers)}',
+            house_sqft=2000, total_amount=Decimal('200.00'), **fields,
+        )
+
+    def selection(self, *quotes):
+        return Quote.objects.filter(pk__in=[quote.pk for quote in quotes])
+
+    def test_complete(self):
+        done, todo = self.quote(is_completed=True), self.quote()
+        self.assertEqual(bulk.complete(self.selection(done, todo)), 1)
+        self.assertTrue(Quote.objects.get(pk=todo.pk).is_completed)
+
+    def test_reschedule(self):
+        scheduled, unscheduled = self.quote(work_date=self.WORK_DATE, crew=self.crew), self.quote()
+        self.assertEqual(bulk.reschedule(self.selection(scheduled, unscheduled), days=2), 1)
+        self.assertEqual(Quote.objects.get(pk=scheduled.pk).work_date, date(2030, 6, 5))
+        self.assertIsNone(Quote.objects.get(pk=unscheduled.pk).work_date)
+
+        bulk.reschedule(self.selection(scheduled), work_date='2030-07-01')
+        self.assertEqual(Quote.objects.get(pk=scheduled.pk).work_date, date(2030, 7, 1))
+
+    def test_reassign_pricing_skips_completed_and_target(self):
+        open_quote = self.quote()
+        completed = self.quote(is_completed=True)
+        on_target = self.quote(pricing=self.premium)
+        selection = self.selection(open_quote, completed, on_target)
+
+        self.assertEqual(bulk.reassign_pricing(selection, self.premium.pk), 1)
+        open_quote.refresh_from_db()
+        completed.refresh_from_db()
+        on_target.refresh_from_db()
+        self.assertEqual((open_quote.pricing_id, open_quote.total_amount), (self.premium.pk, Decimal('400.00')))
+        self.assertEqual((completed.pricing_id, completed.total_amount), (self.standard.pk, Decimal('200.00')))
+        # Already on the pricing: not repriced either
+        self.assertEqual(on_target.total_amount, Decimal('200.00'))
+
+        self.assertEqual(bulk.reassign_pricing(selection, self.premium.pk, include_completed=True), 1)
+        completed.refresh_from_db()
+        self.assertEqual((completed.pricing_id, completed.total_amount), (self.premium.pk, Decimal('400.00')))
+
+    def test_delete(self):
+        scheduled, unscheduled = self.quote(work_date=self.WORK_DATE, crew=self.crew), self.quote()
+        with mock.patch.object(audit.buffer, 'add') as add, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(bulk.delete(self.selection(scheduled, unscheduled)), 2)
+        self.assertFalse(Quote.objects.filter(pk__in=[scheduled.pk, unscheduled.pk]).exists())
+        deleted = {(entry.object_id, entry.action) for call in add.call_args_list for entry in call.args[0]}
+        self.assertEqual(deleted, {(scheduled.pk, 'd'), (unscheduled.pk, 'd')})
+        self.assertEqual(
+            list(QuoteTombstone.objects.values_list('quote_id', 'crew_id')), [(scheduled.pk, self.crew.pk)]
+        )
+        self.assertFalse(DailyLoad.objects.exists())
+
+    def test_run_chunk(self):
+        quotes = [self.quote() for _ in range(5)]
+        selection = self.selection(*quotes)
+        cursor, changed = 0, 0
+        while cursor is not None:
+            _, count, cursor = bulk.run_chunk(selection, 'complete', {}, cursor, chunk_size=2)
+            changed += count
+        self.assertEqual(changed, 5)
+        self.assertEqual(selection.filter(is_completed=True).count(), 5)
+
+    def test_reassign_action_reports_skipped(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+        quotes = [self.quote(), self.quote(is_completed=True), self.quote(pricing=self.premium)]
+        data = {
+            'action': 'reassign_pricing',
+            'pricing': self.premium.pk,
+            '_selected_action': [quote.pk for quote in quotes],
+        }
+
+        response = self.client.post('/admin/myadmin/quote/', data, follow=True)
+        self.assertContains(
+            response, "Moved to Premium and repriced: 1 quote(s), skipped 2 completed or already on Premium."
+        )
+
+        response = self.client.post('/admin/myadmin/quote/', {**data, 'include_completed': 'on'}, follow=True)
+        self.assertContains(response, "Moved to Premium and repriced: 1 quote(s), skipped 2 already on Premium.")
+
+
+@override_settings(FRANCHISES={'north': 'North'})
+class FranchiseRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = franchises.FranchiseRouter()
+
+    def test_franchise_data_follows_current_franchise(self):
+        self.assertEqual(self.router.db_for_read(Quote), 'default')
+        with franchises.using_franchise('north'):
+            self.assertEqual(self.router.db_for_read(Quote), 'north')
+            self.assertEqual(self.router.db_for_write(Crew), 'north')
+        self.assertEqual(self.router.db_for_write(Quote), 'default')
+
+    def test_shared_models_stay_in_default(self):
+        with franchises.using_franchise('north'):
+            self.assertIsNone(self.router.db_for_read(StaffProfile))
+            self.assertIsNone(self.router.db_for_write(get_user_model()))
+
+    def test_instances_stay_in_their_database(self):
+        customer = Customer()
+        customer._state.db = 'north'
+        self.assertEqual(self.router.db_for_write(Quote, instance=customer), 'north')
+        other = Customer()
+        other._state.db = 'default'
+        self.assertFalse(self.router.allow_relation(customer, other))
+        self.assertTrue(self.router.allow_relation(customer, customer))
+
+    def test_allow_migrate(self):
+        self.assertIsNone(self.router.allow_migrate('default', 'auth', 'user'))
+        self.assertTrue(self.router.allow_migrate('north', 'myadmin', 'quote'))
+        self.assertFalse(self.router.allow_migrate('north', 'myadmin', 'staffprofile'))
+        self.assertFalse(self.router.allow_migrate('north', 'auth', 'user'))
+
+    def test_middleware_uses_staff_franchise(self):
+        user = get_user_model()(username='staff', is_staff=True)
+        request = RequestFactory().get('/admin/')
+        request.user = user
+        middleware = franchises.FranchiseMiddleware(lambda request: franchises.current_alias())
+        self.assertEqual(middleware(request), 'default')
+
+        user.staff_profile = StaffProfile(user=user, franchise='north')
+        # A franchise without a configured database gets nothing
+        self.assertIsNone(franchises.franchise_of(user))
+        with mock.patch.dict(connections.settings, {'north': connections.settings['default']}):
+            self.assertEqual(middleware(request), 'north')
+        self.assertEqual(franchises.current_alias(), 'default')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.requests = metrics.Counter('app_requests_total', "Requests by view", ['view'], registry=self.registry)
+        self.pending = metrics.Gauge('app_pending', "Pending \\ entries\nqueued", registry=self.registry)
+        self.latency = metrics.Histogram(
+            'app_latency_seconds', "Latency", ['view'], buckets=(0.1, 1), registry=self.registry
+        )
+
+    def test_exposition_format(self):
+        self.requests.labels('quote "list"').inc()
+        self.requests.labels('quote "list"').inc(2)
+        self.pending.set(4)
+        latency = self.latency.labels('home')
+        for value in (0.05, 0.5, 0.5, 3):
+            latency.observe(value)
+
+        self.assertEqual(metrics.render(metrics.merge([self.registry.snapshot()])), '\n'.join([
+            '# HELP app_latency_seconds Latency',
+            '# TYPE app_latency_seconds histogram',
+            'app_latency_seconds_bucket{view="home",le="0.1"} 1',
+            'app_latency_seconds_bucket{view="home",le="1.0"} 3',
+            'app_latency_seconds_bucket{view="home",le="+Inf"} 4',
+            'app_latency_seconds_sum{view="home"} 4.05',
+            'app_latency_seconds_count{view="home"} 4',
+            '# HELP app_pending Pending \\\\ entries\\nqueued',
+            '# TYPE app_pending gauge',
+            'app_pending 4',
+            '# HELP app_requests_total Requests by view',
+            '# TYPE app_requests_total counter',
+            'app_requests_total{view="quote \\"list\\""} 3',
+        ]) + '\n')
+
+    def test_merge_processes(self):
+        self.requests.labels('home').inc(2)
+        self.pending.set(1)
+        self.latency.labels('home').observe(0.5)
+        live = self.registry.snapshot()
+        exited = {**json.loads(json.dumps(live)), 'pid': live['pid'] + 1}
+
+        with mock.patch.object(metrics, '_pid_alive', side_effect=lambda pid: pid == live['pid']):
+            merged = metrics.merge([live, exited])
+        self.assertEqual(merged['app_requests_total']['samples'], {('home',): 4})
+        # Gauges of exited processes no longer count
+        self.assertEqual(merged['app_pending']['samples'], {(): 1})
+        self.assertEqual(merged['app_latency_seconds']['samples'], {('home',): [[0, 2, 0], 1.0]})
+
+    def test_snapshot_files(self):
+        self.requests.labels('home').inc()
+        with tempfile.TemporaryDirectory() as directory:
+            writer = metrics.SnapshotWriter(directory, interval=60)
+            with mock.patch.object(metrics, 'REGISTRY', self.registry):
+                snapshots = writer.read_all()
+            self.assertEqual(os.listdir(directory), [f'metrics-{os.getpid()}.json'])
+        self.assertEqual(snapshots[0]['metrics']['app_requests_total']['samples'], [[['home'], 1]])
+
+    def test_labels_are_checked(self):
+        with self.assertRaises(ValueError):
+            self.requests.labels()
+        with self.assertRaises(ValueError):
+            metrics.Counter('app_requests_total', "Duplicate", registry=self.registry)
+
+    def test_unknown_methods_share_a_label(self):
+        other = metrics.REQUESTS.labels('admin:login', 'other', 405)
+        before = other.get()
+        for method in ('FOO', 'BAR', 'PROPFIND'):
+            self.client.generic(method, '/admin/login/')
+        self.assertEqual(other.get(), before + 3)
+        self.assertFalse({method for _, method, _ in metrics.REQUESTS._children} & {'FOO', 'BAR', 'PROPFIND'})
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_view_access(self):
+        self.assertEqual(self.client.get('/admin/metrics/').status_code, 403)
+        response = self.client.get('/admin/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertContains(response, '# TYPE nativewash_quotes_created_total counter')
+        self.assertEqual(self.client.get('/admin/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+        self.assertEqual(self.client.get('/admin/metrics/').status_code, 200)
+
+
+class GenerateFakeDataTests(TestCase):
+    def test_small_run(self):
+        save = ServicePricing.save
+        versions = []
+
+        def record_version(pricing, *args, **kwargs):
+            save(pricing, *args, **kwargs)
+            versions.append((pricing.pk, pricing.rules.count(), pricing.updated_at))
+
+        with mock.patch.object(ServicePricing, 'save', record_version):
+            call_command(
+                'generate_fake_data', quotes=60, customers=20, pricings=2, crews=2, batch_size=25, stdout=StringIO()
+            )
+        self.assertEqual((Quote.objects.count(), Customer.objects.count(), Crew.objects.count()), (60, 20, 2))
+        for pricing in ServicePricing.objects.all():
+            self.assertEqual(pricing.rules.count(), 4)
+            # A new version once the rules are in, so evaluators cached for the bare pricing aren't used
+            self.assertIn((pricing.pk, 4, pricing.updated_at), versions)
+            evaluate = pricing_rules.evaluator_for(pricing).evaluate
+            for quote in pricing.quotes.all():
+                self.assertEqual(
+                    to_minor_units(quote.total_amount, CENTS),
+                    evaluate(*(getattr(quote, column) for column in QUOTE_COLUMNS)),
+                )
+        loads = DailyLoad.objects.aggregate(jobs=Sum('job_count'))['jobs']
+        self.assertEqual(loads, Quote.objects.filter(work_date__isnull=False).count())
+
+
+class BenchmarkSuiteTests(TestCase):
+    def setUp(self):
+        call_command('generate_fake_data', quotes=20, customers=5, crews=1, stdout=StringIO())
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'baseline.json')
+        self.dataset = {'quotes': 20, 'customers': 5}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_suite(self, baseline):
+        with open(self.path, 'w') as file:
+            json.dump(baseline, file)
+        call_command('benchmark_suite', baseline=self.path, only='full_address', repeat=1, stdout=StringIO())
+
+    def test_fails_on_other_dataset(self):
+        with self.assertRaisesMessage(CommandError, 'this database has {'):
+            self.run_suite({'dataset': {'quotes': 1_000_000, 'customers': 333_333}, 'benchmarks': {}})
+
+    def test_fails_on_regression(self):
+        # Within the tolerance of a generous baseline
+        self.run_suite({'dataset': self.dataset, 'benchmarks': {'full_address': 1.0}})
+        message = '1 benchmark(s) more than 25% slower than the baseline: full_address'
+        with self.assertRaisesMessage(CommandError, message):
+            self.run_suite({'dataset': self.dataset, 'benchmarks': {'full_address': 1e-12}})
+
+
+class ScheduleFeedTests(TestCase):
+    def setUp(self):
+        self.pricing = ServicePricing.objects.create(name='Standard')
+        self.customer = Customer.objects.create(first_name='John', last_name='Smith', address_line1='12 Main St')
+        self.alpha = Crew.objects.create(name='Alpha')
+        self.bravo = Crew.objects.create(name='Bravo')
+        self.today = timezone.localdate()
+        self.numbers = iter(range(1, 1000))
+
+    def quote(self, crew, days=7, customer=None):
+        return Quote.objects.create(
+            customer=customer or self.customer, pricing=self.pricing, quote_number=f'Q{next(self.numbers)}',
+            work_date=self.today + timedelta(days=days), crew=crew, house_sqft=1000,
+        )
+
+    def changes(self, crew, cursor):
+        jobs, removed = schedule_feed.Feed('default', crew).changes(cursor)
+        return [data['id'] for data in jobs], removed
+
+    def test_changes_are_scoped_to_the_crew(self):
+        alpha = self.quote(self.alpha)
+        bravo = [self.quote(self.bravo) for _ in range(3)]
+        cursor = timezone.now()
+
+        bravo[0].notes = 'Call first'
+        bravo[0].save()
+        bravo[1].work_date = None
+        bravo[1].save()
+        deleted = bravo[2].pk
+        bravo[2].delete()
+        self.assertEqual(self.changes(self.alpha, cursor), ([], []))
+        self.assertEqual(self.changes(self.bravo, cursor), ([bravo[0].pk], [bravo[1].pk, deleted]))
+
+        alpha.notes = 'Gate code 1234'
+        alpha.save()
+        self.assertEqual(self.changes(self.alpha, cursor), ([alpha.pk], []))
+
+    def test_jobs_without_a_previous_date(self):
+        cursor = timezone.now()
+        back_dated = self.quote(self.alpha, days=-30)
+        imported = Quote.objects.create(
+            customer=self.customer, pricing=self.pricing, quote_number='Q-import',
+            work_date=str(self.today - timedelta(days=3)), crew=self.alpha, house_sqft=1000,
+        )
+        unscheduled = self.quote(self.alpha)
+        unscheduled.work_date = None
+        unscheduled.save()
+        unscheduled = Quote.objects.get(pk=unscheduled.pk)
+        unscheduled.work_date = self.today - timedelta(days=1)
+        unscheduled.save()
+
+        # Only the unscheduling was a removal; none of these saves raises
+        jobs, removed = self.changes(self.alpha, cursor)
+        self.assertEqual(removed, [unscheduled.pk])
+        self.assertNotIn(back_dated.pk, jobs)
+        self.assertNotIn(imported.pk, jobs)
+
+    def test_jobs_leaving_the_crew(self):
+        moved, unscheduled, past, later, deleted = [self.quote(self.alpha) for _ in range(5)]
+        cursor = timezone.now()
+
+        moved.crew = self.bravo
+        moved.save()
+        unscheduled.work_date = None
+        unscheduled.save()
+        past.work_date = self.today - timedelta(days=1)
+        past.save()
+        later.work_date = self.today + timedelta(days=8)
+        later.save()
+        deleted_pk = deleted.pk
+        deleted.delete()
+
+        self.assertEqual(
+            self.changes(self.alpha, cursor), ([later.pk], sorted([moved.pk, unscheduled.pk, past.pk, deleted_pk]))
+        )
+        self.assertEqual(self.changes(self.bravo, cursor), ([moved.pk], []))
+        # Still on the schedule of all crews
+        self.assertEqual(
+            self.changes(None, cursor), ([moved.pk, later.pk], sorted([unscheduled.pk, past.pk, deleted_pk]))
+        )
+
+        moved.crew = self.alpha
+        moved.save()
+        self.assertEqual(self.changes(self.alpha, cursor)[0], [moved.pk, later.pk])
+        self.assertNotIn(moved.pk, self.changes(self.alpha, cursor)[1])
+
+    def test_bulk_reschedule_into_the_past(self):
+        quotes = [self.quote(self.alpha), self.quote(self.alpha, days=9)]
+        selection = Quote.objects.filter(pk__in=[quote.pk for quote in quotes])
+        cursor = timezone.now()
+
+        bulk.reschedule(selection, days=1)
+        self.assertEqual(self.changes(self.alpha, cursor), ([quote.pk for quote in quotes], []))
+        bulk.reschedule(selection.filter(pk=quotes[0].pk), days=-30)
+        self.assertEqual(self.changes(self.alpha, cursor), ([quotes[1].pk], [quotes[0].pk]))
+        bulk.reschedule(selection, work_date=(self.today - timedelta(days=2)).isoformat())
+        self.assertEqual(self.changes(self.alpha, cursor), ([], [quotes[0].pk, quotes[1].pk]))
+        self.assertEqual(QuoteTombstone.objects.filter(quote_id=quotes[0].pk).count(), 1)
+
+    def test_customer_changes(self):
+        other = Customer.objects.create(first_name='Mary', last_name='Jones', address_line1='9 Bank St')
+        alpha = self.quote(self.alpha)
+        self.quote(self.bravo, customer=other)
+        cursor = timezone.now()
+
+        Customer.objects.filter(pk__in=[self.customer.pk, other.pk]).update(updated_at=timezone.now())
+        self.assertEqual(self.changes(self.alpha, cursor), ([alpha.pk], []))
+
+    def test_etag_follows_the_crew_feed(self):
+        alpha, bravo = self.quote(self.alpha), self.quote(self.bravo)
+        feed = schedule_feed.Feed('default', self.alpha)
+        etag = feed.etag('json')
+
+        bravo.notes = 'Call first'
+        bravo.save()
+        bravo.delete()
+        self.assertEqual(feed.etag('json'), etag)
+
+        alpha.crew = self.bravo
+        alpha.save()
+        self.assertNotEqual(feed.etag('json'), etag)
+
+    def test_device_poll(self):
+        alpha, bravo = self.quote(self.alpha), self.quote(self.bravo)
+        url = f'/admin/schedule/feed/{schedule_feed.device_token(self.alpha)}.json'
+
+        response = self.client.get(url)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertTrue(data['full'])
+        self.assertEqual([job['id'] for job in data['jobs']], [alpha.pk])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        bravo.delete()
+        response = self.client.get(url, {'since': data['syncToken']})
+        data = json.loads(response.content)
+        self.assertFalse(data['full'])
+        # The cursor goes back SETTLE seconds, so the job just created is sent again
+        self.assertEqual(([job['id'] for job in data['jobs']], data['removed']), ([alpha.pk], []))
+
+
+@override_settings(FRANCHISES={'north': 'North'})
+class FranchiseDatabaseTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # A franchise database in a temporary file, flushed after each test like the default one
+        cls.databases = {*cls.databases, 'north'}
+        cls.directory = tempfile.mkdtemp()
+        create_shard('north', os.path.join(cls.directory, 'north.sqlite3'))
+        with audit.suspended():
+            Customer.objects.using('north').all().delete()
+            ServicePricing.objects.using('north').all().delete()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        drop_shard('north')
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        with audit.suspended(), franchises.using_franchise('north'):
+            self.north_pricing = ServicePricing.objects.create(name='North').pk
+            self.north_customer = Customer.objects.create(
+                first_name='Bench', last_name='Mark', address_line1='1 Main St'
+            ).pk
+
+    def quote(self, number, quote_date, total, is_completed=False, customer=None, **fields):
+        with audit.suspended():
+            return Quote.objects.create(
+                customer_id=customer.pk if customer else self.north_customer, pricing_id=self.north_pricing,
+                quote_number=number, quote_date=quote_date, total_amount=Decimal(total), is_completed=is_completed,
+                **fields,
+            )
+
+    def test_head_office_report_merges_franchises(self):
+        pricing = ServicePricing.objects.create(name='Standard')
+        customer = Customer.objects.create(first_name='John', last_name='Smith', address_line1='12 Main St')
+        Quote.objects.create(
+            customer=customer, pricing=pricing, quote_number='H1', quote_date=date(2030, 3, 5),
+            total_amount=Decimal('100.00'), is_completed=True,
+        )
+        with franchises.using_franchise('north'):
+            self.quote('N1', date(2030, 3, 9), '200.00', is_completed=True)
+            self.quote('N2', date(2030, 4, 1), '50.00')
+            self.quote('N3', date(2031, 1, 1), '999.00', is_completed=True)
+
+        report = franchises.head_office_report(date(2030, 1, 1), date(2030, 12, 31))
+        self.assertEqual(
+            [(row['alias'], row['name'], row['quotes'], row['revenue']) for row in report['franchises']],
+            [('default', 'Head Office', 1, Decimal('100.00')), ('north', 'North', 2, Decimal('200.00'))],
+        )
+        self.assertEqual(report['totals'], {
+            'quotes': 3, 'completed': 2, 'quoted': Decimal('350.00'), 'revenue': Decimal('300.00'), 'customers': 2,
+        })
+        self.assertEqual(
+            [(row['month'], row['quotes'], row['revenue']) for row in report['months']],
+            [(date(2030, 3, 1), 2, Decimal('300.00')), (date(2030, 4, 1), 1, 0)],
+        )
+
+    def test_writes_are_atomic_on_the_franchise_database(self):
+        # Audit entries would be flushed to the franchise database after it is gone
+        with audit.suspended(), franchises.using_franchise('north'):
+            primary = Customer.objects.get(pk=self.north_customer)
+            duplicate = Customer.objects.create(first_name='Bench', last_name='Mark', address_line1='1 Main St')
+            self.quote('N1', date(2030, 3, 9), '200.00', customer=duplicate)
+            with mock.patch.object(Customer, 'save', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+                dedupe.merge_customers(primary, [duplicate])
+            # The quote moved before the failure is moved back
+            self.assertEqual(Quote.objects.get(quote_number='N1').customer_id, duplicate.pk)
+
+            self.quote('N2', date(2030, 3, 9), '50.00', work_date=date(2030, 3, 11))
+            DailyLoad.objects.all().delete()
+            scheduling.rebuild_daily_load()
+            self.assertEqual(DailyLoad.objects.using('north').get().job_count, 1)
+        self.assertFalse(DailyLoad.objects.using('default').exists())
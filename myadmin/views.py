@@ -1,3 +1,68 @@
-from django.shortcuts import render
+import hashlib
+from functools import lru_cache
 
-# Create your views here.
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.http import quote_etag
+
+
+def pricing_config(pricing):
+    """The calculator's ``pricingConfig`` for a ServicePricing"""
+    return {
+        'houseSqft': {
+            'label': "House",
+            'pricePerSqft': float(pricing.house_sqft_price),
+            'unit': "sq.ft.",
+        },
+        'driveway': {
+            'label': "Driveway",
+            'pricePerSqft': float(pricing.driveway_sqft_price),
+            'pricePerCar': float(pricing.driveway_car_price),
+            'unit': "sq.ft./cars",
+        },
+        'patioDeck': {
+            'label': "Patio/Deck",
+            'pricePerSqft': float(pricing.patio_deck_sqft_price),
+            'unit': "sq.ft.",
+        },
+        'roofCleaning': {
+            'label': "Roof Cleaning",
+            'pricePerSqft': float(pricing.roof_cleaning_sqft_price),
+            'unit': "sq.ft.",
+        },
+        'gutterCleaning': {
+            'label': "Gutter Cleaning",
+            'priceFlat': float(pricing.gutter_cleaning_flat_price),
+            'unit': "yes/no",
+        },
+        'distance': {
+            'label': "Distance to Job",
+            'pricePerKm': float(pricing.distance_price_per_km),
+            'unit': "km",
+        },
+    }
+
+
+def pricing_etag(pricing):
+    """Strong ETag that changes whenever the pricing row is saved or a different one becomes active"""
+    return quote_etag(f"pricing-{pricing.pk}-{int(pricing.updated_at.timestamp() * 1_000_000)}")
+
+
+@lru_cache(maxsize=None)
+def asset_version(path):
+    """Short content hash of a static file, or '' if it can't be found"""
+    location = finders.find(path)
+    if not location and staticfiles_storage.exists(path):
+        location = staticfiles_storage.path(path)
+    if not location:
+        return ''
+    with open(location, 'rb') as asset:
+        return hashlib.sha256(asset.read()).hexdigest()[:12]
+
+
+def versioned_static(path):
+    """Static URL with a content hash, so it can be cached until the file changes"""
+    version = asset_version(path)
+    url = static(path)
+    return f"{url}?v={version}" if version else url
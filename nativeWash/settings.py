@@ -50,11 +50,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "myadmin.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "myadmin.audit.AuditMiddleware",
+    "myadmin.franchises.FranchiseMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -87,9 +90,31 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, os.getenv('DATABASE_PATH', 'db.sqlite3')),
+        'OPTIONS': {
+            # Every atomic(), read-only too, locks at BEGIN, so read-then-write ones wait instead of failing
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+# Franchise territories, each with its own database: "north=north.sqlite3,south=south.sqlite3".
+# The default database holds users and head office's own data.
+FRANCHISES = {}
+for entry in filter(None, (part.strip() for part in os.getenv('FRANCHISE_DATABASES', '').split(','))):
+    alias, _, path = entry.partition('=')
+    FRANCHISES[alias] = alias.replace('_', ' ').title()
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': os.path.join(BASE_DIR, path or f'{alias}.sqlite3')}
+
+DATABASE_ROUTERS = ['myadmin.franchises.FranchiseRouter']
+
+
+# Metrics (served at /admin/metrics/). With several worker processes, point
+# METRICS_DIR at a directory they share; each writes its values there. Empty
+# it when the server restarts, as counters of exited workers are kept.
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
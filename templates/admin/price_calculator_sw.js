@@ -0,0 +1,86 @@
+// Service worker for the price calculator.
+// The shell page and static assets are cached so the calculator opens offline;
+// pricing.json is always fetched from the network and cached by the page itself.
+const CACHE_NAME = "{{ cache_name|escapejs }}";
+const SHELL_URL = "{{ shell_url|escapejs }}";
+const CONFIG_URL = "{{ config_url|escapejs }}";
+const STATIC_URL = "{{ static_url|escapejs }}";
+const PRECACHE_URLS = [{% for url in precache_urls %}"{{ url|escapejs }}", {% endfor %}SHELL_URL];
+
+function cacheable(response) {
+  // Never cache a login redirect in place of the calculator
+  return response && response.ok && !response.redirected;
+}
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches.open(CACHE_NAME)
+      .then((cache) => Promise.all(PRECACHE_URLS.map((url) =>
+        fetch(url, { credentials: "same-origin" }).then((response) => {
+          if (cacheable(response)) {
+            return cache.put(url, response);
+          }
+        })
+      )))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((names) => Promise.all(
+        names
+          .filter((name) => name.startsWith("price-calculator-") && name !== CACHE_NAME)
+          .map((name) => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  if (request.method !== "GET") {
+    return;
+  }
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin || url.pathname === CONFIG_URL) {
+    return;
+  }
+
+  if (request.mode === "navigate" && url.pathname === SHELL_URL) {
+    // Stale-while-revalidate: open instantly from cache, refresh it in the background
+    event.respondWith(
+      caches.open(CACHE_NAME).then((cache) =>
+        cache.match(SHELL_URL).then((cached) => {
+          const network = fetch(request).then((response) => {
+            if (cacheable(response)) {
+              cache.put(SHELL_URL, response.clone());
+            }
+            return response;
+          });
+          if (cached) {
+            event.waitUntil(network.catch(() => undefined));
+            return cached;
+          }
+          return network;
+        })
+      )
+    );
+    return;
+  }
+
+  if (url.pathname.startsWith(STATIC_URL)) {
+    // Versioned assets never change under the same URL: cache first
+    event.respondWith(
+      caches.open(CACHE_NAME).then((cache) =>
+        cache.match(request).then((cached) => cached || fetch(request).then((response) => {
+          if (cacheable(response)) {
+            cache.put(request, response.clone());
+          }
+          return response;
+        }))
+      )
+    );
+  }
+});